@@ -0,0 +1,149 @@
+"""Temperature aggregation over the sensors of SPZB0001 thermostat units."""
+from bisect import bisect_left, insort
+
+AGGREGATE_MEAN = "mean"
+AGGREGATE_MEDIAN = "median"
+AGGREGATE_EMA = "ema"
+AGGREGATES = [AGGREGATE_MEAN, AGGREGATE_MEDIAN, AGGREGATE_EMA]
+
+
+class SensorWindow:
+    """Fixed size ring buffer of the latest readings of one sensor.
+
+    Readings and their timestamps live in preallocated lists, pushing and
+    evicting never allocates. An exponential moving average is kept up to
+    date on every push. With ordered, a list shared by the windows of an
+    aggregate, the buffered readings are also kept sorted in it.
+    """
+
+    def __init__(self, size, alpha, ordered=None):
+        """Initialize the window."""
+        self.size = size
+        self.alpha = alpha
+        self.ordered = ordered
+        self.values = [0.0] * size
+        self.times = [0.0] * size
+        self.count = 0
+        self.ema = None
+        self._head = 0
+
+    def push(self, time, value):
+        """Add a reading, replacing the oldest one if the window is full.
+
+        Returns the change of count and total for the aggregate.
+        """
+        head = self._head
+        if self.count == self.size:
+            removed = self.values[head]
+            added = 0
+            if self.ordered is not None:
+                _remove_sorted(self.ordered, removed)
+        else:
+            removed = 0.0
+            added = 1
+            self.count += 1
+        if self.ordered is not None:
+            insort(self.ordered, value)
+        self.values[head] = value
+        self.times[head] = time
+        self._head = (head + 1) % self.size
+        self.ema = value if self.ema is None else self.ema + self.alpha * (value - self.ema)
+        return added, value - removed
+
+    def touch(self, time):
+        """Mark the latest reading as current at time."""
+        self.times[(self._head - 1) % self.size] = time
+
+    def evict(self, before):
+        """Drop the readings older than before.
+
+        Returns the change of count and total for the aggregate.
+        """
+        removed = 0
+        total = 0.0
+        tail = (self._head - self.count) % self.size
+        while self.count and self.times[tail] < before:
+            total += self.values[tail]
+            if self.ordered is not None:
+                _remove_sorted(self.ordered, self.values[tail])
+            tail = (tail + 1) % self.size
+            self.count -= 1
+            removed += 1
+        if not self.count:
+            # SPZB: a sensor without fresh readings starts its average anew
+            self.ema = None
+        return -removed, -total
+
+
+class TemperatureAggregate:
+    """Combine the readings of several temperature sensors into one value.
+
+    mean averages all buffered readings of all sensors, median takes the
+    median of them and ema averages the moving averages of the sensors.
+    For median the readings of all sensors are kept sorted while they are
+    pushed and evicted. Readings older than max_age seconds are evicted, a
+    sensor without fresh readings does not take part until it reports again.
+    """
+
+    def __init__(self, sensor_entity_ids, method, size, max_age, alpha):
+        """Initialize the aggregate."""
+        self.method = method
+        self.max_age = max_age
+        self.ordered = [] if method == AGGREGATE_MEDIAN else None
+        self.windows = {
+            entity_id: SensorWindow(size, alpha, self.ordered)
+            for entity_id in sensor_entity_ids
+        }
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, entity_id, time, value):
+        """Add a reading of a sensor."""
+        added, total = self.windows[entity_id].push(time, value)
+        self.count += added
+        self.total += total
+
+    def touch(self, entity_id, time, value):
+        """Mark the latest reading of a sensor reporting it again as current.
+
+        A sensor whose readings were all evicted gets value as a new reading.
+        """
+        window = self.windows[entity_id]
+        if window.count:
+            window.touch(time)
+        else:
+            self.push(entity_id, time, value)
+
+    def value(self, now):
+        """Return the aggregated value of the fresh readings, None if none."""
+        if self.max_age is not None:
+            before = now - self.max_age
+            for window in self.windows.values():
+                if window.count:
+                    removed, total = window.evict(before)
+                    self.count += removed
+                    self.total += total
+        if not self.count:
+            # SPZB: drop the rounding errors the running total collected
+            self.total = 0.0
+            return None
+        if self.method == AGGREGATE_MEDIAN:
+            readings = self.ordered
+            middle = len(readings) // 2
+            if len(readings) % 2:
+                return readings[middle]
+            return (readings[middle - 1] + readings[middle]) / 2
+        if self.method == AGGREGATE_EMA:
+            total = 0.0
+            count = 0
+            for window in self.windows.values():
+                if window.ema is not None:
+                    total += window.ema
+                    count += 1
+            return total / count
+        return self.total / self.count
+
+
+def _remove_sorted(ordered, value):
+    """Remove a value from a sorted list."""
+    del ordered[bisect_left(ordered, value)]
@@ -0,0 +1,80 @@
+"""Grouped heater commands of SPZB0001 thermostat units."""
+import asyncio
+import logging
+
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+
+# SPZB: seconds the batch waits for pipelines still finishing their last step
+BATCH_JOIN_TIMEOUT = 1
+
+
+class CommandBatch:
+    """Move the heaters of several pipelines to one opening together.
+
+    The pipelines join the batch from their workers instead of applying the
+    opening on their own. Once all of them joined, or after
+    BATCH_JOIN_TIMEOUT, the drivers are moved with async_apply_group, so every
+    step is a single service call with one shared wait for all heaters.
+    Pipelines joining after the start apply the opening on their own.
+    """
+
+    def __init__(self, hass, driver_class, heater_entity_ids, opening, call):
+        """Initialize the batch.
+
+        call(heater_entity_ids, domain, service, data, **kwargs) sends a
+        command for several heaters.
+        """
+        self.hass = hass
+        self.driver_class = driver_class
+        self.heater_entity_ids = set(heater_entity_ids)
+        self.opening = opening
+        self._call = call
+        self._drivers = []
+        self._done = hass.loop.create_future()
+        self._timer = None
+        self._task = None
+
+    async def async_join(self, driver):
+        """Move the heater of driver with the batch, return True if acknowledged."""
+        if self._task is not None:
+            return await driver.async_apply(self.opening)
+        self._drivers.append(driver)
+        if len(self._drivers) == len(self.heater_entity_ids):
+            self._async_start()
+        elif self._timer is None:
+            self._timer = self.hass.loop.call_later(
+                BATCH_JOIN_TIMEOUT, self._async_start
+            )
+        # SPZB: a cancelled pipeline must not cancel the commands of the others
+        acknowledged = await asyncio.shield(self._done)
+        return driver.heater_entity_id in acknowledged
+
+    @callback
+    def _async_start(self):
+        """Start moving the joined heaters."""
+        if self._task is not None:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._task = self.hass.async_create_task(self._async_run())
+
+    async def _async_run(self):
+        """Move the joined heaters and hand the result to all of them."""
+        drivers = list(self._drivers)
+        _LOGGER.debug(
+            "Moving %s heaters to %s together", len(drivers), self.opening
+        )
+        acknowledged = set()
+        try:
+            acknowledged = await self.driver_class.async_apply_group(
+                drivers, self.opening, self._call
+            )
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error while sending grouped commands")
+        finally:
+            # SPZB: release the joined pipelines, also if the batch was cancelled
+            if not self._done.done():
+                self._done.set_result(acknowledged)
@@ -1,15 +1,19 @@
 """Special support for SPZB0001 thermostat units."""
 import asyncio
+from collections import deque
+from datetime import datetime, time as dt_time, timedelta
+from functools import partial
+import json
 import logging
+import math
 
 import voluptuous as vol
 
-from homeassistant.components.climate import PLATFORM_SCHEMA, ClimateEntity
-
+from homeassistant import config as conf_util
 from homeassistant.components.climate import (
     DOMAIN as CLIMATE_DOMAIN,
-    SERVICE_SET_HVAC_MODE,
-    SERVICE_SET_TEMPERATURE,
+    PLATFORM_SCHEMA,
+    ClimateEntity,
 )
 
 from homeassistant.components.climate.const import (
@@ -29,21 +33,73 @@ from homeassistant.components.climate.const import (
 from homeassistant.const import (
     ATTR_ENTITY_ID,
     ATTR_TEMPERATURE,
+    ATTR_TIME,
     CONF_NAME,
+    CONF_PLATFORM,
     EVENT_HOMEASSISTANT_START,
-    SERVICE_TURN_OFF,
+    EVENT_HOMEASSISTANT_STOP,
+    SERVICE_RELOAD,
     STATE_UNAVAILABLE,
     STATE_UNKNOWN,
 )
-from homeassistant.core import DOMAIN as HA_DOMAIN, CoreState, callback
+from homeassistant.core import Context, CoreState, callback
+from homeassistant.exceptions import HomeAssistantError
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.event import (
-    async_track_state_change_event,
-)
-from homeassistant.helpers.reload import async_setup_reload_service
+from homeassistant.helpers import config_per_platform, entity_platform
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.helpers.service import async_register_admin_service
+from homeassistant.loader import async_get_integration
+import homeassistant.util.dt as dt_util
 
-from . import DOMAIN, PLATFORMS
+from . import DOMAIN
+from .aggregate import AGGREGATE_MEAN, AGGREGATES, TemperatureAggregate
+from .batch import CommandBatch
+from .control import (
+    CONTROL_MODE_HYSTERESIS,
+    CONTROL_MODE_TPI,
+    CONTROL_MODES,
+    ActuationCounter,
+    hysteresis_decision,
+    tpi_duty,
+)
+from .dispatch import StateChangeDispatcher
+from .driver import (
+    OPENING_DECIMALS,
+    VALVE_DOMAINS,
+    ModeSequenceDriver,
+    ValvePositionDriver,
+)
+from .heater import parse_heater_state
+from .metrics import (
+    COUNTER_COMMANDS_SENT,
+    COUNTER_ECHOES_IGNORED,
+    COUNTER_HEATER_DRIFTS,
+    COUNTER_HEATER_REVERTS,
+    COUNTER_WINDOW_OPENINGS,
+    HISTOGRAM_SENSOR_TO_DECISION,
+    Metrics,
+)
+from .model import ThermalModel
+from .pipeline import HEALTH_QUARANTINED, HeaterCommandPipeline
+from .reconcile import HeaterReconciler
+from .scheduler import (
+    PRIORITY_CONTROL,
+    PRIORITY_RECONCILE,
+    PRIORITY_SAFETY,
+    PRIORITY_USER,
+    AirtimeScheduler,
+)
+from .trace import (
+    DEFAULT_TRACE_SIZE,
+    KIND_COMMAND,
+    KIND_DECISION,
+    KIND_HEATER_STATE,
+    KIND_READING,
+    KIND_TARGET,
+    TraceRecorder,
+)
+from .window import WindowDetector
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -51,54 +107,588 @@ DEFAULT_NAME = "SPZB0001 Thermostat"
 
 CONF_HEATER = "heater"
 CONF_SENSOR = "target_sensor"
+CONF_VALVE = "valve_entity"
 CONF_TARGET_TEMP = "target_temp"
 CONF_INITIAL_HVAC_MODE = "initial_hvac_mode"
 CONF_AWAY_TEMP = "away_temp"
+CONF_COMMAND_RATE = "command_rate"
+CONF_COMMAND_BURST = "command_burst"
+CONF_RECONCILE_INTERVAL = "reconcile_interval"
+CONF_COLD_TOLERANCE = "cold_tolerance"
+CONF_HOT_TOLERANCE = "hot_tolerance"
+CONF_MIN_DUR = "min_cycle_duration"
+CONF_CONTROL_MODE = "control_mode"
+CONF_TPI_CYCLE = "tpi_cycle"
+CONF_TPI_COEFFICIENT = "tpi_coefficient"
+CONF_SENSOR_DEBOUNCE = "sensor_debounce"
+CONF_SENSOR_AGGREGATE = "sensor_aggregate"
+CONF_SENSOR_WINDOW = "sensor_window"
+CONF_SENSOR_MAX_AGE = "sensor_max_age"
+CONF_SENSOR_EMA_ALPHA = "sensor_ema_alpha"
+CONF_OVERSHOOT_GUARD = "overshoot_guard"
+CONF_OPEN_WINDOW_SLOPE = "open_window_slope"
+CONF_OPEN_WINDOW_TIME = "open_window_time"
+CONF_TRACE_FILE = "trace_file"
+CONF_TRACE_SIZE = "trace_size"
+CONF_ZONES = "zones"
 SUPPORT_FLAGS = SUPPORT_TARGET_TEMPERATURE
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
-    {
-        vol.Required(CONF_HEATER): cv.entity_id,
-        vol.Required(CONF_SENSOR): cv.entity_id,
-        vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
-        vol.Optional(CONF_TARGET_TEMP): vol.Coerce(float),
-        vol.Optional(CONF_INITIAL_HVAC_MODE): vol.In([HVAC_MODE_HEAT, HVAC_MODE_OFF]),
-        vol.Optional(CONF_AWAY_TEMP): vol.Coerce(float),
-    }
+DATA_SCHEDULER = "scheduler"
+DATA_DISPATCHER = "dispatcher"
+DATA_METRICS = "metrics"
+DATA_THERMOSTATS = "thermostats"
+DATA_RECONCILER = "reconciler"
+DATA_RELOAD_LOCK = "reload_lock"
+DATA_TRACE = "trace"
+# SPZB: callbacks told about every opening handed to a heater pipeline, e.g. by the simulation
+DATA_REQUEST_LISTENERS = "request_listeners"
+DEFAULT_COMMAND_RATE = 2.0
+DEFAULT_COMMAND_BURST = 5
+DEFAULT_RECONCILE_INTERVAL = timedelta(minutes=5)
+DEFAULT_TOLERANCE = 0.0
+DEFAULT_TPI_CYCLE = timedelta(minutes=20)
+DEFAULT_TPI_COEFFICIENT = 0.6
+DEFAULT_SENSOR_DEBOUNCE = timedelta(seconds=0)
+DEFAULT_SENSOR_WINDOW = 1
+DEFAULT_SENSOR_EMA_ALPHA = 0.3
+DEFAULT_OVERSHOOT_GUARD = 0.0
+DEFAULT_OPEN_WINDOW_TIME = timedelta(minutes=5)
+
+ATTR_COMMAND_QUEUE = "command_queue"
+ATTR_ACTUATIONS = "actuations"
+ATTR_ACTUATIONS_AVOIDED = "actuations_avoided"
+ATTR_HEATERS = "heaters"
+ATTR_THERMAL_MODEL = "thermal_model"
+ATTR_PREHEAT = "preheat"
+ATTR_WINDOW_OPEN = "window_open"
+ATTR_QUARANTINED_HEATERS = "quarantined_heaters"
+
+SERVICE_DUMP_METRICS = "dump_metrics"
+SERVICE_PREHEAT = "preheat"
+SERVICE_SET_ALL = "set_all"
+METRICS_FILE = "spzb0001_thermostat_metrics.json"
+
+# SPZB: number of our latest command contexts remembered to recognise their echoes
+OWN_CONTEXTS = 16
+
+# SPZB: seconds between the startup commands of inconsistent thermostats
+STARTUP_STAGGER = 3
+
+THERMOSTAT_SCHEMA = {
+    vol.Optional(CONF_TARGET_TEMP): vol.Coerce(float),
+    vol.Optional(CONF_INITIAL_HVAC_MODE): vol.In([HVAC_MODE_HEAT, HVAC_MODE_OFF]),
+    vol.Optional(CONF_AWAY_TEMP): vol.Coerce(float),
+    vol.Optional(CONF_COLD_TOLERANCE): vol.Coerce(float),
+    vol.Optional(CONF_HOT_TOLERANCE): vol.Coerce(float),
+    vol.Optional(CONF_MIN_DUR): cv.positive_time_period,
+    vol.Optional(CONF_CONTROL_MODE): vol.In(CONTROL_MODES),
+    vol.Optional(CONF_TPI_CYCLE): cv.positive_time_period,
+    vol.Optional(CONF_TPI_COEFFICIENT): vol.All(
+        vol.Coerce(float), vol.Range(min=0, min_included=False)
+    ),
+    vol.Optional(CONF_SENSOR_DEBOUNCE): cv.positive_time_period,
+    vol.Optional(CONF_SENSOR_AGGREGATE): vol.In(AGGREGATES),
+    vol.Optional(CONF_SENSOR_WINDOW): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional(CONF_SENSOR_MAX_AGE): cv.positive_time_period,
+    vol.Optional(CONF_SENSOR_EMA_ALPHA): vol.All(
+        vol.Coerce(float), vol.Range(min=0, max=1, min_included=False)
+    ),
+    vol.Optional(CONF_OVERSHOOT_GUARD): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_OPEN_WINDOW_SLOPE): vol.All(
+        vol.Coerce(float), vol.Range(min=0, min_included=False)
+    ),
+    vol.Optional(CONF_OPEN_WINDOW_TIME): cv.positive_time_period,
+}
+
+# SPZB: applied to every thermostat, options of a zone override the options of the platform
+THERMOSTAT_DEFAULTS = {
+    CONF_NAME: DEFAULT_NAME,
+    CONF_COLD_TOLERANCE: DEFAULT_TOLERANCE,
+    CONF_HOT_TOLERANCE: DEFAULT_TOLERANCE,
+    CONF_CONTROL_MODE: CONTROL_MODE_HYSTERESIS,
+    CONF_TPI_CYCLE: DEFAULT_TPI_CYCLE,
+    CONF_TPI_COEFFICIENT: DEFAULT_TPI_COEFFICIENT,
+    CONF_SENSOR_DEBOUNCE: DEFAULT_SENSOR_DEBOUNCE,
+    CONF_SENSOR_AGGREGATE: AGGREGATE_MEAN,
+    CONF_SENSOR_WINDOW: DEFAULT_SENSOR_WINDOW,
+    CONF_SENSOR_EMA_ALPHA: DEFAULT_SENSOR_EMA_ALPHA,
+    CONF_OVERSHOOT_GUARD: DEFAULT_OVERSHOOT_GUARD,
+    CONF_OPEN_WINDOW_TIME: DEFAULT_OPEN_WINDOW_TIME,
+}
+
+HEATERS_SCHEMA = vol.All(cv.entity_ids, vol.Length(min=1))
+SENSORS_SCHEMA = vol.All(cv.entity_ids, vol.Length(min=1))
+VALVES_SCHEMA = vol.All(cv.ensure_list, [cv.entity_domain(VALVE_DOMAINS)])
+
+
+SET_ALL_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(ATTR_ENTITY_ID): cv.entity_ids,
+            vol.Optional(ATTR_HVAC_MODE): vol.In([HVAC_MODE_HEAT, HVAC_MODE_OFF]),
+            vol.Optional(ATTR_PRESET_MODE): vol.In([PRESET_NONE, PRESET_AWAY]),
+            vol.Optional(ATTR_TEMPERATURE): vol.Coerce(float),
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_HVAC_MODE, ATTR_PRESET_MODE, ATTR_TEMPERATURE),
 )
 
 
+def _valid_valves(config):
+    """Validate that every heater has a valve entity if valves are configured."""
+    valves = config.get(CONF_VALVE)
+    if valves is not None and len(valves) != len(config[CONF_HEATER]):
+        raise vol.Invalid(f"{CONF_VALVE} needs one entity per {CONF_HEATER}")
+    return config
+
+
+ZONE_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Required(CONF_NAME): cv.string,
+            vol.Required(CONF_HEATER): HEATERS_SCHEMA,
+            vol.Required(CONF_SENSOR): SENSORS_SCHEMA,
+            vol.Optional(CONF_VALVE): VALVES_SCHEMA,
+            **THERMOSTAT_SCHEMA,
+        }
+    ),
+    _valid_valves,
+)
+
+
+def _valid_thermostats(config):
+    """Validate that either a single thermostat or zones are configured."""
+    if CONF_ZONES in config:
+        if CONF_HEATER in config or CONF_SENSOR in config or CONF_VALVE in config:
+            raise vol.Invalid(
+                f"{CONF_HEATER}, {CONF_SENSOR} and {CONF_VALVE} are configured per zone when {CONF_ZONES} are used"
+            )
+    elif CONF_HEATER not in config or CONF_SENSOR not in config:
+        raise vol.Invalid(f"{CONF_HEATER} and {CONF_SENSOR} or {CONF_ZONES} are required")
+    else:
+        _valid_valves(config)
+    return config
+
+
+PLATFORM_SCHEMA = vol.All(
+    PLATFORM_SCHEMA.extend(
+        {
+            vol.Optional(CONF_HEATER): HEATERS_SCHEMA,
+            vol.Optional(CONF_SENSOR): SENSORS_SCHEMA,
+            vol.Optional(CONF_VALVE): VALVES_SCHEMA,
+            vol.Optional(CONF_NAME): cv.string,
+            **THERMOSTAT_SCHEMA,
+            vol.Optional(CONF_ZONES): vol.All(
+                cv.ensure_list, [ZONE_SCHEMA], vol.Length(min=1)
+            ),
+            vol.Optional(CONF_COMMAND_RATE, default=DEFAULT_COMMAND_RATE): vol.All(
+                vol.Coerce(float), vol.Range(min=0.1)
+            ),
+            vol.Optional(CONF_COMMAND_BURST, default=DEFAULT_COMMAND_BURST): vol.All(
+                vol.Coerce(int), vol.Range(min=1)
+            ),
+            vol.Optional(
+                CONF_RECONCILE_INTERVAL, default=DEFAULT_RECONCILE_INTERVAL
+            ): cv.positive_time_period,
+            vol.Optional(CONF_TRACE_FILE): cv.string,
+            vol.Optional(CONF_TRACE_SIZE, default=DEFAULT_TRACE_SIZE): vol.All(
+                vol.Coerce(float), vol.Range(min=0, min_included=False)
+            ),
+        }
+    ),
+    _valid_thermostats,
+)
+
+
+# SPZB: options shared by all thermostats, they are not compared per thermostat on reload
+PLATFORM_OPTIONS = (
+    CONF_PLATFORM,
+    CONF_ZONES,
+    CONF_COMMAND_RATE,
+    CONF_COMMAND_BURST,
+    CONF_RECONCILE_INTERVAL,
+    CONF_TRACE_FILE,
+    CONF_TRACE_SIZE,
+)
+# SPZB: options of the tracked entities, a thermostat is created anew on reload if they change
+ENTITY_OPTIONS = (CONF_HEATER, CONF_SENSOR, CONF_VALVE)
+# SPZB: options of the temperature aggregate, its readings are only dropped on reload if they change
+AGGREGATE_OPTIONS = (
+    CONF_SENSOR_AGGREGATE,
+    CONF_SENSOR_WINDOW,
+    CONF_SENSOR_MAX_AGE,
+    CONF_SENSOR_EMA_ALPHA,
+)
+
+
+def _zone_configs(config):
+    """Return the configuration of every thermostat of a platform entry."""
+    zones = config.get(CONF_ZONES)
+    if zones is None:
+        return [{**THERMOSTAT_DEFAULTS, **config}]
+    return [{**THERMOSTAT_DEFAULTS, **config, **zone} for zone in zones]
+
+
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up the SPZB0001 thermostat platform."""
 
-    await async_setup_reload_service(hass, DOMAIN, PLATFORMS)
+    domain_data = hass.data.get(DOMAIN)
+    if domain_data is None:
+        # SPZB: shared by all thermostats and kept on reload
+        thermostats = {}
+        domain_data = hass.data[DOMAIN] = {
+            # SPZB: one scheduler for all thermostats, it shares the Zigbee airtime between them
+            DATA_SCHEDULER: AirtimeScheduler(
+                hass, config[CONF_COMMAND_RATE], config[CONF_COMMAND_BURST]
+            ),
+            DATA_DISPATCHER: StateChangeDispatcher(hass),
+            DATA_METRICS: Metrics(),
+            DATA_THERMOSTATS: thermostats,
+            DATA_RECONCILER: HeaterReconciler(
+                hass, thermostats, config[CONF_RECONCILE_INTERVAL]
+            ),
+            DATA_RELOAD_LOCK: asyncio.Lock(),
+            DATA_TRACE: TraceRecorder(hass),
+            DATA_REQUEST_LISTENERS: [],
+        }
+        domain_data[DATA_RECONCILER].async_start()
+
+        async def _async_stop(_):
+            """Stop all background work before Home Assistant stops."""
+            domain_data[DATA_RECONCILER].async_stop()
+            # SPZB: a heater in backoff would otherwise keep its pipeline waiting through the shutdown
+            await asyncio.gather(
+                *(
+                    thermostat.async_stop_commands()
+                    for thermostat in thermostats.values()
+                )
+            )
+            domain_data[DATA_SCHEDULER].async_stop()
+            # SPZB: write the buffered trace records last, nothing is recorded after the commands stopped
+            await domain_data[DATA_TRACE].async_stop()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_stop)
+        await _async_configure_trace(hass, domain_data[DATA_TRACE], config)
+        _async_setup_services(hass, domain_data)
+
+    # SPZB: entity services are handled for the entities of all platform entries
+    entity_platform.async_get_current_platform().async_register_entity_service(
+        SERVICE_PREHEAT,
+        {
+            vol.Required(ATTR_TEMPERATURE): vol.Coerce(float),
+            vol.Required(ATTR_TIME): vol.Any(cv.time, cv.datetime),
+        },
+        "async_preheat",
+    )
+
+    async_add_entities(
+        [
+            _create_thermostat(hass, zone_config, domain_data)
+            for zone_config in _zone_configs(config)
+        ]
+    )
+
+
+@callback
+def _async_setup_services(hass, domain_data):
+    """Register the services of the platform."""
+
+    async def _async_dump_metrics(call):
+        """Write the metrics of the platform and all thermostats to a file."""
+        metrics = {
+            "platform": {
+                **domain_data[DATA_METRICS].as_dict(),
+                ATTR_COMMAND_QUEUE: domain_data[DATA_SCHEDULER].statistics,
+                DATA_RECONCILER: domain_data[DATA_RECONCILER].statistics,
+                DATA_TRACE: domain_data[DATA_TRACE].statistics,
+            },
+            "thermostats": {
+                entity_id: thermostat.statistics
+                for entity_id, thermostat in domain_data[DATA_THERMOSTATS].items()
+            },
+        }
+        path = hass.config.path(METRICS_FILE)
+        await hass.async_add_executor_job(_write_json, path, metrics)
+        _LOGGER.info("Wrote metrics to %s", path)
+
+    hass.services.async_register(DOMAIN, SERVICE_DUMP_METRICS, _async_dump_metrics)
+
+    async def _async_set_all(call):
+        """Change all thermostats at once and send their commands grouped."""
+        entity_ids = call.data.get(ATTR_ENTITY_ID)
+        thermostats = [
+            thermostat
+            for entity_id, thermostat in domain_data[DATA_THERMOSTATS].items()
+            if entity_ids is None or entity_id in entity_ids
+        ]
+        requests = {}
+        for thermostat in thermostats:
+            thermostat.async_plan(
+                requests,
+                call.data.get(ATTR_HVAC_MODE),
+                call.data.get(ATTR_PRESET_MODE),
+                call.data.get(ATTR_TEMPERATURE),
+            )
+        # SPZB: heaters that need the same step share every service call and wait
+        groups = {}
+        for pipeline, opening in requests.items():
+            groups.setdefault((pipeline.driver.group_key, opening), []).append(
+                pipeline
+            )
+        owners = {
+            heater_entity_id: thermostat
+            for thermostat in thermostats
+            for heater_entity_id in thermostat.heater_entity_ids
+        }
+        for (_, opening), pipelines in groups.items():
+            batch = CommandBatch(
+                hass,
+                type(pipelines[0].driver),
+                [pipeline.heater_entity_id for pipeline in pipelines],
+                opening,
+                partial(
+                    _async_group_call,
+                    domain_data[DATA_SCHEDULER],
+                    domain_data[DATA_TRACE],
+                    owners,
+                ),
+            )
+            for pipeline in pipelines:
+                pipeline.async_request(opening, batch=batch, priority=PRIORITY_USER)
+        _LOGGER.debug(
+            "set_all: %s heaters in %s groups", len(requests), len(groups)
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_ALL, _async_set_all, schema=SET_ALL_SCHEMA
+    )
+
+    async def _async_reload(call):
+        """Apply the changed configuration, keeping unchanged thermostats running."""
+        try:
+            unprocessed = await conf_util.async_hass_config_yaml(hass)
+        except HomeAssistantError as err:
+            _LOGGER.error(err)
+            return
+        conf = await conf_util.async_process_component_config(
+            hass, unprocessed, await async_get_integration(hass, CLIMATE_DOMAIN)
+        )
+        if conf is None:
+            # SPZB: invalid configuration, keep the running thermostats
+            return
+        configs = [
+            p_config
+            for p_type, p_config in config_per_platform(conf, CLIMATE_DOMAIN)
+            if p_type == DOMAIN
+        ]
+        async with domain_data[DATA_RELOAD_LOCK]:
+            await _async_reload_thermostats(hass, domain_data, configs)
+        hass.bus.async_fire(f"event_{DOMAIN}_reloaded", context=call.context)
+
+    async_register_admin_service(hass, DOMAIN, SERVICE_RELOAD, _async_reload)
+
+
+async def _async_reload_thermostats(hass, domain_data, configs):
+    """Diff the thermostats with the reloaded platform entries.
+
+    Thermostats are matched by name. Unchanged ones are kept as they are,
+    changed options are applied in place and only thermostats that are new,
+    gone or track other entities are created or removed.
+    """
+    if configs:
+        # SPZB: like on setup the shared options are taken from the first entry
+        domain_data[DATA_SCHEDULER].async_configure(
+            configs[0][CONF_COMMAND_RATE], configs[0][CONF_COMMAND_BURST]
+        )
+        domain_data[DATA_RECONCILER].async_set_interval(
+            configs[0][CONF_RECONCILE_INTERVAL]
+        )
+        await _async_configure_trace(hass, domain_data[DATA_TRACE], configs[0])
+    running = {}
+    for thermostat in domain_data[DATA_THERMOSTATS].values():
+        running.setdefault(thermostat.name, []).append(thermostat)
+    removed = []
+    added = []
+    updated = []
+    for config in configs:
+        for zone_config in _zone_configs(config):
+            candidates = running.get(zone_config[CONF_NAME])
+            thermostat = candidates.pop(0) if candidates else None
+            if thermostat is None:
+                added.append(_create_thermostat(hass, zone_config, domain_data))
+            elif any(
+                thermostat.zone_config.get(key) != zone_config.get(key)
+                for key in ENTITY_OPTIONS
+            ):
+                removed.append(thermostat)
+                added.append(_create_thermostat(hass, zone_config, domain_data))
+            elif thermostat.zone_config != _thermostat_options(zone_config):
+                updated.append((thermostat, zone_config))
+    for candidates in running.values():
+        removed.extend(candidates)
+
+    _LOGGER.debug(
+        "Reload: %s thermostats added, %s removed, %s updated",
+        len(added),
+        len(removed),
+        len(updated),
+    )
+    await asyncio.gather(*(thermostat.async_remove() for thermostat in removed))
+    for thermostat, zone_config in updated:
+        await thermostat.async_update_options(zone_config)
+    if added:
+        platform = _async_get_platform(hass)
+        if platform is None:
+            _LOGGER.error("Unable to add thermostats, %s is not set up", DOMAIN)
+            return
+        await platform.async_add_entities(added)
+
+
+@callback
+def _async_get_platform(hass):
+    """Return the entity platform of the thermostats."""
+    for platform in entity_platform.async_get_platforms(hass, DOMAIN):
+        if platform.domain == CLIMATE_DOMAIN and platform.config_entry is None:
+            return platform
+    return None
+
+
+def _thermostat_options(config):
+    """Return the options of a thermostat without the shared options."""
+    return {key: value for key, value in config.items() if key not in PLATFORM_OPTIONS}
+
+
+async def _async_configure_trace(hass, trace, config):
+    """Record the actuation trace to the configured file, if any."""
+    path = config.get(CONF_TRACE_FILE)
+    await trace.async_configure(
+        hass.config.path(path) if path is not None else None,
+        config[CONF_TRACE_SIZE] * 1024 * 1024,
+    )
+
+
+async def _async_group_call(
+    scheduler, trace, owners, heater_entity_ids, domain, service, data, **kwargs
+):
+    """Call a service for the heaters of several thermostats at once."""
+    thermostats = {}
+    for heater_entity_id in heater_entity_ids:
+        thermostat = owners[heater_entity_id]
+        thermostats[thermostat] = thermostats.get(thermostat, 0) + 1
+    context = Context()
+    for thermostat in thermostats:
+        thermostat.async_remember_context(context)
+    started = scheduler.hass.loop.time()
+    await scheduler.async_call(
+        tuple(heater_entity_ids),
+        domain,
+        service,
+        data,
+        # SPZB: grouped commands are only sent for the set_all service
+        priority=PRIORITY_USER,
+        cost=len(heater_entity_ids),
+        context=context,
+        **kwargs,
+    )
+    duration = scheduler.hass.loop.time() - started
+    for heater_entity_id in heater_entity_ids:
+        trace.async_record(KIND_COMMAND, heater_entity_id, duration)
+    for thermostat, commands in thermostats.items():
+        thermostat.metrics.increment(COUNTER_COMMANDS_SENT, commands)
+        thermostat.metrics.observe(f"{domain}.{service}", duration)
+
+
+def _write_json(path, data):
+    """Write data as JSON to path."""
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+
+
+def _create_aggregate(config):
+    """Create the temperature aggregate of a single zone."""
+    sensor_max_age = config.get(CONF_SENSOR_MAX_AGE)
+    return TemperatureAggregate(
+        config.get(CONF_SENSOR),
+        config.get(CONF_SENSOR_AGGREGATE),
+        config.get(CONF_SENSOR_WINDOW),
+        sensor_max_age.total_seconds() if sensor_max_age is not None else None,
+        config.get(CONF_SENSOR_EMA_ALPHA),
+    )
+
+
+def _create_window_detector(config):
+    """Create the open window detector of a single zone, if configured."""
+    if config.get(CONF_OPEN_WINDOW_SLOPE) is None:
+        return None
+    return WindowDetector(
+        config.get(CONF_SENSOR),
+        config.get(CONF_OPEN_WINDOW_TIME).total_seconds(),
+        config.get(CONF_OPEN_WINDOW_SLOPE),
+    )
+
 
+def _create_thermostat(hass, config, domain_data):
+    """Create the thermostat entity of a single zone."""
     name = config.get(CONF_NAME)
-    heater_entity_id = config.get(CONF_HEATER)
-    sensor_entity_id = config.get(CONF_SENSOR)
+    heater_entity_ids = config.get(CONF_HEATER)
+    sensor_entity_ids = config.get(CONF_SENSOR)
+    valve_entity_ids = config.get(CONF_VALVE)
     min_temp = 5.0  # SPZB: hard coded temperature for EUROTRONIC thermostats due to the implementation in deCONZ
     max_temp = 30.0  # SPZB: hard coded temperature for EUROTRONIC thermostats due to the implementation in deCONZ
     target_temp = config.get(CONF_TARGET_TEMP)
     initial_hvac_mode = config.get(CONF_INITIAL_HVAC_MODE)
     away_temp = config.get(CONF_AWAY_TEMP)
+    cold_tolerance = config.get(CONF_COLD_TOLERANCE)
+    hot_tolerance = config.get(CONF_HOT_TOLERANCE)
+    min_cycle_duration = config.get(CONF_MIN_DUR)
+    control_mode = config.get(CONF_CONTROL_MODE)
+    tpi_cycle = config.get(CONF_TPI_CYCLE)
+    tpi_coefficient = config.get(CONF_TPI_COEFFICIENT)
+    sensor_debounce = config.get(CONF_SENSOR_DEBOUNCE)
+    aggregate = _create_aggregate(config)
+    window_detector = _create_window_detector(config)
     precision = 0.5  # SPZB: hard coded precision for EUROTRONIC thermostats due to the implementation in deCONZ
     unit = hass.config.units.temperature_unit
 
-    async_add_entities(
-        [
-            SPZB0001Thermostat(
-                name,
-                heater_entity_id,
-                sensor_entity_id,
-                min_temp,
-                max_temp,
-                target_temp,
-                initial_hvac_mode,
-                away_temp,
-                precision,
-                unit,
-            )
-        ]
+    thermostat = SPZB0001Thermostat(
+        name,
+        heater_entity_ids,
+        sensor_entity_ids,
+        valve_entity_ids,
+        min_temp,
+        max_temp,
+        target_temp,
+        initial_hvac_mode,
+        away_temp,
+        cold_tolerance,
+        hot_tolerance,
+        min_cycle_duration,
+        control_mode,
+        tpi_cycle,
+        tpi_coefficient,
+        sensor_debounce,
+        aggregate,
+        config.get(CONF_OVERSHOOT_GUARD),
+        window_detector,
+        precision,
+        unit,
+        domain_data[DATA_SCHEDULER],
+        domain_data[DATA_DISPATCHER],
+        domain_data[DATA_METRICS],
+        domain_data[DATA_TRACE],
+        domain_data[DATA_REQUEST_LISTENERS],
+    )
+    thermostat.zone_config = _thermostat_options(config)
+    return thermostat
+
+
+def _came_back(old_state, new_state):
+    """Return True if an entity reports a state again after it had none."""
+    return (
+        old_state is not None
+        and new_state is not None
+        and old_state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN)
+        and new_state.state not in (STATE_UNAVAILABLE, STATE_UNKNOWN)
     )
 
 
@@ -108,27 +698,43 @@ class SPZB0001Thermostat(ClimateEntity, RestoreEntity):
     def __init__(
         self,
         name,
-        heater_entity_id,
-        sensor_entity_id,
+        heater_entity_ids,
+        sensor_entity_ids,
+        valve_entity_ids,
         min_temp,
         max_temp,
         target_temp,
         initial_hvac_mode,
         away_temp,
+        cold_tolerance,
+        hot_tolerance,
+        min_cycle_duration,
+        control_mode,
+        tpi_cycle,
+        tpi_coefficient,
+        sensor_debounce,
+        aggregate,
+        overshoot_guard,
+        window_detector,
         precision,
         unit,
+        scheduler,
+        dispatcher,
+        platform_metrics,
+        trace,
+        request_listeners,
     ):
         """Initialize the thermostat."""
         self._name = name
-        self.heater_entity_id = heater_entity_id
-        self.sensor_entity_id = sensor_entity_id
+        self.heater_entity_ids = heater_entity_ids
+        self.sensor_entity_ids = sensor_entity_ids
+        self.valve_entity_ids = valve_entity_ids
         self._hvac_mode = initial_hvac_mode
         self._saved_target_temp = target_temp or away_temp
         self._temp_precision = precision
         self._hvac_list = [HVAC_MODE_HEAT, HVAC_MODE_OFF]
         self._active = False
         self._cur_temp = None
-        self._temp_lock = asyncio.Lock()
         self._min_temp = min_temp
         self._max_temp = max_temp
         self._target_temp = target_temp
@@ -138,33 +744,111 @@ class SPZB0001Thermostat(ClimateEntity, RestoreEntity):
             self._support_flags = SUPPORT_FLAGS | SUPPORT_PRESET_MODE
         self._away_temp = away_temp
         self._is_away = False
-        self.startup = True  # SPZB: introduced to be able to shutdown EUROTRONIC thermostats after HA restart to avoid inconsistant states
+        self._cold_tolerance = cold_tolerance
+        self._hot_tolerance = hot_tolerance
+        self._min_cycle_duration = min_cycle_duration
+        self._control_mode = control_mode
+        self._tpi_cycle = tpi_cycle
+        self._tpi_coefficient = tpi_coefficient
+        self._tpi_on = False
+        self._tpi_unsubs = []
+        self._recheck_unsub = None
+        self._last_actuation = None
+        self._actuation_counter = ActuationCounter()
+        self._sensor_debounce = sensor_debounce.total_seconds()
+        self._aggregate = aggregate
+        self._debounce_unsub = None
+        self._model = ThermalModel()
+        self._overshoot_guard = overshoot_guard
+        self._preheat = None
+        self._preheat_unsub = None
+        self._window_detector = window_detector
+        self._window_unsub = None
+        self._proportional = valve_entity_ids is not None
+        self._pipelines = {}
+        self._valve_drivers = {}
+        self._valve_openings = {}
+        self._heater_states = {}
+        self._unreconciled = set(heater_entity_ids)
+        self._intended_opening = None
+        self._scheduler = scheduler
+        self._dispatcher = dispatcher
+        self.metrics = Metrics(platform_metrics)
+        self._trace = trace
+        self._request_listeners = request_listeners
+        self._traced_target = None
+        self._sensor_received = None
+        self._own_contexts = deque(maxlen=OWN_CONTEXTS)
+        self.zone_config = None
+        self.startup = True  # SPZB: introduced to be able to reconcile EUROTRONIC thermostats after HA restart to avoid inconsistant states
 
     async def async_added_to_hass(self):
         """Run when entity about to be added."""
         await super().async_added_to_hass()
 
-        # Add listener
-        self.async_on_remove(
-            async_track_state_change_event(
-                self.hass, [self.sensor_entity_id], self._async_sensor_changed
+        for index, heater_entity_id in enumerate(self.heater_entity_ids):
+            if self._proportional:
+                valve_entity_id = self.valve_entity_ids[index]
+                driver = ValvePositionDriver(
+                    self.hass,
+                    heater_entity_id,
+                    self._async_heater_call,
+                    valve_entity_id,
+                )
+                self._valve_drivers[valve_entity_id] = driver
+                self._valve_openings[valve_entity_id] = driver.opening(
+                    self.hass.states.get(valve_entity_id)
+                )
+            else:
+                driver = ModeSequenceDriver(
+                    self.hass,
+                    heater_entity_id,
+                    self._async_heater_call,
+                    self.min_temp,
+                    self.max_temp,
+                    self.metrics,
+                )
+            # SPZB: heater commands run in the background, one pipeline per heater, see _async_control_heating
+            self._pipelines[heater_entity_id] = HeaterCommandPipeline(
+                self.hass, driver, self.metrics, self._request_listeners
             )
-        )
-        self.async_on_remove(
-            async_track_state_change_event(
-                self.hass, [self.heater_entity_id], self._async_switch_changed
+            self._heater_states[heater_entity_id] = parse_heater_state(
+                self.hass.states.get(heater_entity_id), self.min_temp
             )
+
+        thermostats = self.hass.data[DOMAIN][DATA_THERMOSTATS]
+        thermostats[self.entity_id] = self
+        self.async_on_remove(lambda: thermostats.pop(self.entity_id, None))
+        self._trace.async_define(
+            self.entity_id, self.sensor_entity_ids, self.heater_entity_ids
         )
 
+        # Add listener
+        for sensor_entity_id in self.sensor_entity_ids:
+            self.async_on_remove(
+                self._dispatcher.async_track(
+                    sensor_entity_id, self._async_sensor_changed
+                )
+            )
+        for heater_entity_id in self.heater_entity_ids:
+            self.async_on_remove(
+                self._dispatcher.async_track(
+                    heater_entity_id, self._async_switch_changed
+                )
+            )
+        for valve_entity_id in self._valve_drivers:
+            self.async_on_remove(
+                self._dispatcher.async_track(
+                    valve_entity_id, self._async_valve_changed
+                )
+            )
+
         @callback
         def _async_startup(*_):
             """Init on startup."""
-            sensor_state = self.hass.states.get(self.sensor_entity_id)
-            if sensor_state and sensor_state.state not in (
-                STATE_UNAVAILABLE,
-                STATE_UNKNOWN,
-            ):
-                self._async_update_temp(sensor_state)
+            for sensor_entity_id in self.sensor_entity_ids:
+                self._async_add_reading(self.hass.states.get(sensor_entity_id))
+            if self._async_update_temp():
                 self.async_write_ha_state()
 
         if self.hass.state == CoreState.running:
@@ -190,6 +874,10 @@ class SPZB0001Thermostat(ClimateEntity, RestoreEntity):
                 self._is_away = True
             if not self._hvac_mode and old_state.state:
                 self._hvac_mode = old_state.state
+            # SPZB: the learned thermal model survives restarts in the state attributes
+            self._model = ThermalModel.from_dict(
+                old_state.attributes.get(ATTR_THERMAL_MODEL)
+            )
 
         else:
             # No previous state, try and restore defaults
@@ -203,6 +891,29 @@ class SPZB0001Thermostat(ClimateEntity, RestoreEntity):
         if not self._hvac_mode:
             self._hvac_mode = HVAC_MODE_OFF
 
+    async def async_will_remove_from_hass(self):
+        """Run when entity will be removed from hass."""
+        self._async_cancel_tpi_cycle()
+        if self._recheck_unsub is not None:
+            self._recheck_unsub()
+            self._recheck_unsub = None
+        if self._debounce_unsub is not None:
+            self._debounce_unsub()
+            self._debounce_unsub = None
+        if self._preheat_unsub is not None:
+            self._preheat_unsub()
+            self._preheat_unsub = None
+        if self._window_unsub is not None:
+            self._window_unsub()
+            self._window_unsub = None
+        await self.async_stop_commands()
+
+    async def async_stop_commands(self):
+        """Cancel the pending and running heater commands for good."""
+        await asyncio.gather(
+            *(pipeline.async_stop() for pipeline in self._pipelines.values())
+        )
+
     @property
     def should_poll(self):
         """Return the polling state."""
@@ -278,11 +989,11 @@ class SPZB0001Thermostat(ClimateEntity, RestoreEntity):
         """Set hvac mode."""
         if hvac_mode == HVAC_MODE_HEAT:
             self._hvac_mode = HVAC_MODE_HEAT
-            await self._async_control_heating()
+            await self._async_control_heating(force=True, priority=PRIORITY_USER)
         elif hvac_mode == HVAC_MODE_OFF:
             self._hvac_mode = HVAC_MODE_OFF
-            if self._is_device_active:
-                await self._async_heater_turn_off()
+            self._async_cancel_tpi_cycle()
+            self._async_request_heaters(0.0, priority=PRIORITY_USER)
         else:
             _LOGGER.error("Unrecognized hvac mode: %s", hvac_mode)
             return
@@ -295,8 +1006,136 @@ class SPZB0001Thermostat(ClimateEntity, RestoreEntity):
         if temperature is None:
             return
         self._target_temp = temperature
+        await self._async_control_heating(force=True, priority=PRIORITY_USER)
+        self.async_write_ha_state()
+
+    async def async_preheat(self, temperature, time):
+        """Reach temperature at time, starting to heat as early as needed.
+
+        time is a datetime or the next occurrence of a time of day. The start
+        is planned with the heating rate of the thermal model and planned
+        again on every temperature change. Until a heating rate is learned
+        the target temperature is simply set at time.
+        """
+        now = dt_util.now()
+        if isinstance(time, dt_time):
+            due = datetime.combine(now.date(), time, now.tzinfo)
+            if due <= now:
+                due += timedelta(days=1)
+        else:
+            due = dt_util.as_local(time) if time.tzinfo else time.replace(tzinfo=now.tzinfo)
+        # SPZB: planned on the loop clock like every other timer of the thermostat
+        self._preheat = (
+            temperature,
+            self.hass.loop.time() + max(0.0, (due - now).total_seconds()),
+        )
+        if self._async_plan_preheat():
+            await self._async_control_heating(force=True, priority=PRIORITY_USER)
+        self.async_write_ha_state()
+
+    @callback
+    def _async_plan_preheat(self):
+        """Schedule the start of the pending preheat.
+
+        Returns True if it started now and set the target temperature.
+        """
+        if self._preheat_unsub is not None:
+            self._preheat_unsub()
+            self._preheat_unsub = None
+        if self._preheat is None:
+            return False
+        temperature, due = self._preheat
+        lead = None
+        if self._cur_temp is not None:
+            lead = self._model.preheat_time(self._cur_temp, temperature)
+        remaining = due - (lead or 0.0) - self.hass.loop.time()
+        if remaining > 0:
+            self._preheat_unsub = async_call_later(
+                self.hass, remaining, self._async_preheat_due
+            )
+            return False
+        _LOGGER.debug("Preheating %s to %s, %s seconds ahead", self.entity_id, temperature, lead) #SPZB: log for debugging
+        self._preheat = None
+        self._target_temp = temperature
+        return True
+
+    async def _async_preheat_due(self, _):
+        """Start the preheat once its planned start is reached."""
+        self._preheat_unsub = None
+        if self._async_plan_preheat():
+            await self._async_control_heating(force=True)
+            self.async_write_ha_state()
+
+    async def async_update_options(self, zone_config):
+        """Apply the changed options of a reload.
+
+        Pipelines, heater states and the learned model are kept, so commands
+        in flight continue. The readings are kept unless the aggregation
+        options changed, an open window stays open unless open window
+        detection was removed. target_temp and initial_hvac_mode only apply
+        on startup and are not taken over.
+        """
+        options = _thermostat_options(zone_config)
+        rebuild = any(
+            self.zone_config.get(key) != options.get(key) for key in AGGREGATE_OPTIONS
+        )
+        self.zone_config = options
+        away_temp = zone_config.get(CONF_AWAY_TEMP)
+        if self._is_away:
+            if away_temp:
+                self._target_temp = away_temp
+            else:
+                self._is_away = False
+                self._target_temp = self._saved_target_temp
+        self._away_temp = away_temp
+        self._support_flags = SUPPORT_FLAGS
+        if away_temp:
+            self._support_flags = SUPPORT_FLAGS | SUPPORT_PRESET_MODE
+        self._cold_tolerance = zone_config.get(CONF_COLD_TOLERANCE)
+        self._hot_tolerance = zone_config.get(CONF_HOT_TOLERANCE)
+        self._min_cycle_duration = zone_config.get(CONF_MIN_DUR)
+        self._control_mode = zone_config.get(CONF_CONTROL_MODE)
+        self._tpi_cycle = zone_config.get(CONF_TPI_CYCLE)
+        self._tpi_coefficient = zone_config.get(CONF_TPI_COEFFICIENT)
+        self._sensor_debounce = zone_config.get(CONF_SENSOR_DEBOUNCE).total_seconds()
+        self._overshoot_guard = zone_config.get(CONF_OVERSHOOT_GUARD)
+        seeded = []
+        if rebuild:
+            self._aggregate = _create_aggregate(zone_config)
+            seeded.append(self._aggregate)
+        if self._window_unsub is not None:
+            self._window_unsub()
+            self._window_unsub = None
+        if zone_config.get(CONF_OPEN_WINDOW_SLOPE) is None:
+            self._window_detector = None
+        elif self._window_detector is not None:
+            # SPZB: keep the slopes and the open window, only the options change
+            self._window_detector.configure(
+                zone_config.get(CONF_OPEN_WINDOW_TIME).total_seconds(),
+                zone_config.get(CONF_OPEN_WINDOW_SLOPE),
+            )
+        else:
+            self._window_detector = _create_window_detector(zone_config)
+            seeded.append(self._window_detector)
+        # SPZB: new buffers start with the current readings
+        now = self.hass.loop.time()
+        for sensor_entity_id in self.sensor_entity_ids:
+            value = self._reading(self.hass.states.get(sensor_entity_id))
+            if value is None:
+                continue
+            for buffer in seeded:
+                buffer.push(sensor_entity_id, now, value)
+        self._async_update_temp()
+        if self._window_open:
+            # SPZB: check the open window again after the new span
+            self._window_unsub = async_call_later(
+                self.hass, self._window_detector.span, self._async_window_recheck
+            )
+        # SPZB: a new TPI cycle starts with the new options
+        self._async_cancel_tpi_cycle()
         await self._async_control_heating()
         self.async_write_ha_state()
+        _LOGGER.debug("Options of %s updated on reload", self.entity_id) #SPZB: log for debugging
 
     @property
     def min_temp(self):
@@ -321,231 +1160,612 @@ class SPZB0001Thermostat(ClimateEntity, RestoreEntity):
         new_state = event.data.get("new_state")
         if new_state is None or new_state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN):
             return
+        old_state = event.data.get("old_state")
+        if old_state is not None and old_state.state == new_state.state:
+            # SPZB: attribute only update, the temperature did not change but is still current
+            self._async_add_reading(new_state, refresh=True)
+            return
 
         _LOGGER.debug("_async_sensor_changed runs for %s with state %s", new_state.name, new_state) #SPZB: log for debugging
-        _LOGGER.debug("_async_sensor_changed runs for %s", new_state.name) #SPZB: log for debugging
-        self._async_update_temp(new_state)
+        if not self._async_add_reading(new_state):
+            return
+        self._trace.async_record(
+            KIND_READING, new_state.entity_id, float(new_state.state)
+        )
+        if self._window_detector is not None:
+            # SPZB: fast path, an open window closes the heaters before any debounce
+            await self._async_check_window()
+        if self._sensor_received is None:
+            self._sensor_received = self.hass.loop.time()
+        if self._sensor_debounce:
+            # SPZB: readings within the debounce window are collected, the decision runs once
+            if self._debounce_unsub is None:
+                self._debounce_unsub = async_call_later(
+                    self.hass, self._sensor_debounce, self._async_sensor_debounced
+                )
+            return
+        await self._async_process_sensor()
+
+    async def _async_sensor_debounced(self, _):
+        """Handle the readings of the debounce window."""
+        self._debounce_unsub = None
+        await self._async_process_sensor()
+
+    async def _async_process_sensor(self):
+        """Control heating with the aggregated temperature."""
+        received, self._sensor_received = self._sensor_received, None
+        shown = self._shown_temp
+        if not self._async_update_temp() and not self.startup:
+            # SPZB: the aggregated temperature did not change, nothing to decide or write
+            return
+        # SPZB: a changed temperature moves the start of a pending preheat
+        self._async_plan_preheat()
+        startup = self.startup
         await self._async_control_heating()
-        self.async_write_ha_state()
+        if received is not None:
+            self.metrics.observe(
+                HISTOGRAM_SENSOR_TO_DECISION, self.hass.loop.time() - received
+            )
+        if startup or self._shown_temp != shown:
+            # SPZB: the state shows the temperature at precision resolution, smaller changes are not written
+            self.async_write_ha_state()
 
     @callback
-    # SPZB: made async to be able to call async functions for EUROTRONIC thermostat
-    async def _async_switch_changed(self, event):
+    def _async_switch_changed(self, event):
         """Handle heater switch state changes."""
         # SPZB: also get old state for handling EUROTRONIC thermostat HVAC modes
+        heater_entity_id = event.data.get(ATTR_ENTITY_ID)
         old_state = event.data.get("old_state")
         new_state = event.data.get("new_state")
+        self._heater_states[heater_entity_id] = parse_heater_state(
+            new_state, self.min_temp
+        )
+        if not self._proportional:
+            self._trace.async_record(
+                KIND_HEATER_STATE,
+                heater_entity_id,
+                self._device_opening(heater_entity_id),
+            )
         # SPZB: also check if old state is ok
         if new_state is None or old_state is None:
             return
-        # SPZB: handle EUROTRONIC SPIRIT ZIGBEE thermostat
-        # SPZB: Service set HVAC mode back to auto if set from auto to heat (e.g. manually)
+        if _came_back(old_state, new_state):
+            self._async_heater_back(heater_entity_id)
         # if old_state.state != new_state.state: #SPZB: log for debugging (needs this and next line to work properly)
         _LOGGER.debug("Changed state from %s to %s for %s.", old_state.state, new_state.state, new_state.name) #SPZB: log for debugging
-        if old_state.state == "auto" and new_state.state == "heat":
-            data_auto = {
-                ATTR_ENTITY_ID: self.heater_entity_id,
-                ATTR_HVAC_MODE: HVAC_MODE_AUTO,
-            }
-            await self.hass.services.async_call(
-                CLIMATE_DOMAIN,
-                SERVICE_SET_HVAC_MODE,
-                data_auto,
-                blocking=True,
-            )
-            await asyncio.sleep(
-                5
-            )  # SPZB: wait for 5 seconds due to issues with sending command too fast
-            # SPZB: Service set temperature to max_temp
-            data_temp = {
-                ATTR_ENTITY_ID: self.heater_entity_id,
-                ATTR_TEMPERATURE: self.max_temp,
-            }
-            await self.hass.services.async_call(
-                CLIMATE_DOMAIN,
-                SERVICE_SET_TEMPERATURE,
-                data_temp,
-                blocking=True,
-            )
-            await asyncio.sleep(
-                25
-            )  # SPZB: wait for 25 seconds to let the thermostat finish before sending another command
-            _LOGGER.debug("Something tried to switch from auto to heat for %s, so we revert HVAC mode to auto", self.heater_entity_id) #SPZB: log for debugging
-        # SPZB: Service set HVAC mode back to auto if set from off to heat (e.g. manually)
-        elif old_state.state == "off" and new_state.state == "heat":
-            data_auto = {
-                ATTR_ENTITY_ID: self.heater_entity_id,
-                ATTR_HVAC_MODE: HVAC_MODE_AUTO,
-            }
-            await self.hass.services.async_call(
-                CLIMATE_DOMAIN,
-                SERVICE_SET_HVAC_MODE,
-                data_auto,
-                blocking=True,
-            )
-            _LOGGER.debug("data_auto: %s", data_auto) # SPZB: log for debugging
-            await asyncio.sleep(
-                5
-            )  # SPZB: wait for 5 seconds due to issues with sending command too fast
-            # SPZB: Service set temperature to max_temp
-            data_temp = {
-                ATTR_ENTITY_ID: self.heater_entity_id,
-                ATTR_TEMPERATURE: self.max_temp,
-            }
-            await self.hass.services.async_call(
-                CLIMATE_DOMAIN,
-                SERVICE_SET_TEMPERATURE,
-                data_temp,
-                blocking=True,
-            )
-            await asyncio.sleep(
-                25
-            )  # SPZB: wait for 25 seconds to let the thermostat finish before sending another command
-            _LOGGER.debug("data_temp: %s", data_temp) #SPZB: log for debugging
-            _LOGGER.debug("Something tried to switch from off to heat for %s, so we change HVAC mode to auto", self.heater_entity_id) #SPZB: log for debugging
+        # SPZB: handle EUROTRONIC SPIRIT ZIGBEE thermostat
+        # SPZB: Service set HVAC mode back to auto if set from auto or off to heat (e.g. manually)
+        if (
+            not self._proportional
+            and new_state.state == HVAC_MODE_HEAT
+            and old_state.state in (HVAC_MODE_AUTO, HVAC_MODE_OFF)
+        ):
+            pipeline = self._pipelines[heater_entity_id]
+            if new_state.context.id in self._own_contexts or pipeline.sending:
+                # SPZB: caused by our own commands, the running sequence sets the mode anyway
+                self.metrics.increment(COUNTER_ECHOES_IGNORED)
+                _LOGGER.debug("Ignoring switch from %s to heat for %s caused by our own commands", old_state.state, heater_entity_id) #SPZB: log for debugging
+            else:
+                self.metrics.increment(COUNTER_HEATER_REVERTS)
+                # SPZB: the turn on sequence sets auto and max_temp, it coalesces with a revert already in flight
+                pipeline.async_request(1.0, priority=PRIORITY_RECONCILE)
+                _LOGGER.debug("Something tried to switch from %s to heat for %s, so we revert HVAC mode to auto", old_state.state, heater_entity_id) #SPZB: log for debugging
         self.async_write_ha_state()
 
     @callback
-    def _async_update_temp(self, state):
-        """Update thermostat with latest state from sensor."""
+    def _async_valve_changed(self, event):
+        """Handle valve position changes."""
+        valve_entity_id = event.data.get(ATTR_ENTITY_ID)
+        new_state = event.data.get("new_state")
+        driver = self._valve_drivers[valve_entity_id]
+        self._valve_openings[valve_entity_id] = driver.opening(new_state)
+        self._trace.async_record(
+            KIND_HEATER_STATE,
+            driver.heater_entity_id,
+            self._device_opening(driver.heater_entity_id),
+        )
+        if _came_back(event.data.get("old_state"), new_state):
+            self._async_heater_back(driver.heater_entity_id)
+        self.async_write_ha_state()
+
+    @callback
+    def _async_heater_back(self, heater_entity_id):
+        """Bring a heater that reports again into the intended state at once."""
+        pipeline = self._pipelines[heater_entity_id]
+        # SPZB: the heater is reachable again, retry at once instead of after the backoff
+        pipeline.async_wake()
+        if (
+            not self.startup
+            and self._intended_opening is not None
+            and not pipeline.busy
+            and self._heater_drifted(heater_entity_id)
+        ):
+            pipeline.async_request(self._intended_opening, priority=PRIORITY_RECONCILE)
+
+    @callback
+    @staticmethod
+    def _reading(state):
+        """Return the temperature of a sensor state, None if it holds none."""
+        if state is None or state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+            return None
         try:
-            self._cur_temp = float(state.state)
-            _LOGGER.debug("_async_update_temp: %s for %s", self._cur_temp, self.heater_entity_id) #SPZB: log for debugging
+            value = float(state.state)
+            if not math.isfinite(value):
+                raise ValueError(f"{state.state} is no temperature")
         except ValueError as ex:
             _LOGGER.error("Unable to update from sensor: %s", ex)
+            return None
+        return value
+
+    def _async_add_reading(self, state, refresh=False):
+        """Add the reading of a sensor to the aggregate.
+
+        With refresh the reading repeats the latest one and only keeps it from
+        getting stale. Returns False if the state holds no temperature.
+        """
+        value = self._reading(state)
+        if value is None:
+            return False
+        now = self.hass.loop.time()
+        if refresh:
+            self._aggregate.touch(state.entity_id, now, value)
+            return True
+        self._aggregate.push(state.entity_id, now, value)
+        if self._window_detector is not None:
+            self._window_detector.push(state.entity_id, now, value)
+        return True
 
-    async def _async_control_heating(self):
-        """Check if we need to turn heating on or off."""
+    async def _async_check_window(self):
+        """Suspend heating while a window is open, resume once it is closed."""
+        detector = self._window_detector
+        if detector is None:
+            # SPZB: open window detection was removed by a reload
+            return
+        if not detector.update(self.hass.loop.time()):
+            return
+        if self._window_unsub is not None:
+            self._window_unsub()
+            self._window_unsub = None
+        if not detector.is_open:
+            _LOGGER.debug("Window closed for %s, resuming heating", self.entity_id) #SPZB: log for debugging
+            await self._async_control_heating(force=True)
+            self.async_write_ha_state()
+            return
+        _LOGGER.debug("Window open for %s, suspending heating", self.entity_id) #SPZB: log for debugging
+        self.metrics.increment(COUNTER_WINDOW_OPENINGS)
+        # SPZB: sensors only report changes, check again once the readings of the drop are too old
+        self._window_unsub = async_call_later(
+            self.hass, self._window_detector.span, self._async_window_recheck
+        )
+        self._intended_opening = 0.0
+        for heater_entity_id, pipeline in self._pipelines.items():
+            if (
+                self._heater_opening(heater_entity_id) != 0.0
+                or self._device_opening(heater_entity_id) != 0.0
+            ):
+                pipeline.async_request(0.0, priority=PRIORITY_SAFETY)
+        self.async_write_ha_state()
+
+    async def _async_window_recheck(self, _):
+        """Check the open window again without new readings."""
+        self._window_unsub = None
+        await self._async_check_window()
+        if self._window_open and self._window_unsub is None:
+            self._window_unsub = async_call_later(
+                self.hass, self._window_detector.span, self._async_window_recheck
+            )
+
+    @callback
+    def _async_update_temp(self):
+        """Update thermostat with the aggregated temperature of the sensors.
+
+        The temperature is kept at full resolution, so tolerances finer than
+        the precision apply. Returns True if the temperature changed.
+        """
+        now = self.hass.loop.time()
+        cur_temp = self._aggregate.value(now)
+        if cur_temp is None:
+            # SPZB: every sensor is stale, keep the last temperature
+            return False
+        self._model.observe(now, cur_temp, self._is_device_active)
+        if cur_temp == self._cur_temp:
+            return False
+        self._cur_temp = cur_temp
+        _LOGGER.debug("_async_update_temp: %s for %s", self._cur_temp, self.entity_id) #SPZB: log for debugging
+        return True
+
+    @property
+    def _shown_temp(self):
+        """Return the current temperature at precision resolution."""
+        if self._cur_temp is None:
+            return None
+        return round(self._cur_temp / self.precision)
+
+    async def _async_control_heating(self, force=False, priority=PRIORITY_CONTROL):
+        """Check if we need to turn heating on or off.
+
+        Only decides on the desired heater state, the commands are sent by the
+        heater command pipeline in the background. force is set for user
+        actions, they ignore min_cycle_duration and start a new TPI cycle.
+        priority is the priority class of the commands, see pipeline.py.
+        """
+        reconcile = set()
         if self.startup == True:  # SPZB: check if HA was freshly initialized
-            await self._async_init_shutdown_thermostat()  # SPZB: turn of the corresponding EUROTRONIC thermostat on startup
-        _LOGGER.debug("_async_control_heating running for %s", self.heater_entity_id) #SPZB: log for debugging
-        async with self._temp_lock:
-            if not self._active and None not in (self._cur_temp, self._target_temp):
-                self._active = True
-                _LOGGER.debug(
-                    "Obtained current and target temperature. "
-                    "SPZB0001 thermostat active. %s, %s",
+            reconcile = self._async_init_reconcile_thermostat()
+        _LOGGER.debug("_async_control_heating running for %s", self.entity_id) #SPZB: log for debugging
+        # SPZB: deciding never awaits, so no lock is needed against concurrent decisions
+        self._async_decide(force, reconcile, priority=priority)
+
+    @callback
+    def _async_decide(self, force, reconcile, group=None, priority=PRIORITY_CONTROL):
+        """Decide on the heater opening and hand it to the pipelines.
+
+        reconcile holds the heaters found inconsistent after startup, they get
+        the decided opening even if they seem to have it already. With group
+        the openings are collected there instead, see async_plan.
+        """
+        if not self._active and None not in (self._cur_temp, self._target_temp):
+            self._active = True
+            _LOGGER.debug(
+                "Obtained current and target temperature. "
+                "SPZB0001 thermostat active. %s, %s",
+                self._cur_temp,
+                self._target_temp,
+            )
+
+        heater_on = self._is_heater_on
+        controlled = False
+        if (
+            not self._active
+            or self._hvac_mode == HVAC_MODE_OFF
+            or self._window_open
+        ):
+            opening = 0.0
+            self._actuation_counter.reset()
+        else:
+            controlled = True
+            self._actuation_counter.observe(
+                self._cur_temp, self._target_temp, heater_on
+            )
+            if self._control_mode == CONTROL_MODE_TPI and self._proportional:
+                # SPZB: a valve taking positions opens by the duty instead of cycling
+                opening = round(
+                    tpi_duty(self._cur_temp, self._target_temp, self._tpi_coefficient),
+                    OPENING_DECIMALS,
+                )
+            elif self._control_mode == CONTROL_MODE_TPI:
+                if force or not self._tpi_unsubs:
+                    self._async_start_tpi_cycle()
+                opening = float(self._tpi_on)
+            else:
+                turn_on = hysteresis_decision(
                     self._cur_temp,
                     self._target_temp,
+                    heater_on,
+                    self._cold_tolerance,
+                    self._hot_tolerance - self._overshoot_allowance(),
                 )
+                if turn_on != heater_on and not (force or reconcile):
+                    turn_on = self._async_check_min_cycle(turn_on, heater_on)
+                opening = float(turn_on)
+
+        if self._async_request_heaters(opening, reconcile, group, priority) and controlled:
+            # SPZB: one actuation of the thermostat, however many heaters it moves
+            self._actuation_counter.actuated()
+
+    @callback
+    def _async_request_heaters(
+        self, opening, reconcile=(), group=None, priority=PRIORITY_CONTROL
+    ):
+        """Hand the opening to the pipelines of all heaters not having it.
 
-            if not self._active or self._hvac_mode == HVAC_MODE_OFF:
-                self._async_heater_turn_off()
-                return
-
-            too_cold = self._target_temp >= self._cur_temp
-            too_hot = self._cur_temp >= self._target_temp
-            # SPZB: log for debugging
-            if self._is_device_active:
-                if too_hot:
-                    _LOGGER.debug("Turning off heater %s", self.heater_entity_id)
-                    await self._async_heater_turn_off()
+        With group the pipelines are added to it with the opening instead.
+        Returns True if any heater gets the opening.
+        """
+        self._async_trace_decision(opening)
+        self._intended_opening = opening
+        requested = False
+        for heater_entity_id, pipeline in self._pipelines.items():
+            if group is not None:
+                if opening == self._heater_opening(heater_entity_id):
+                    continue
+                group[pipeline] = opening
+            elif heater_entity_id in reconcile:
+                # SPZB: bring an inconsistent EUROTRONIC thermostat into the decided state
+                _LOGGER.debug(
+                    "Reconciling inconsistent heater %s to %s",
+                    heater_entity_id,
+                    opening,
+                )
+                pipeline.async_request(
+                    opening,
+                    self._scheduler.async_stagger(STARTUP_STAGGER),
+                    # SPZB: startup commands give way to everything but background work
+                    priority=PRIORITY_RECONCILE
+                    if priority == PRIORITY_CONTROL
+                    else priority,
+                )
+            elif opening != self._heater_opening(heater_entity_id):
+                _LOGGER.debug("Opening heater %s to %s", heater_entity_id, opening)
+                pipeline.async_request(opening, priority=priority)
             else:
-                if too_cold:
-                    _LOGGER.debug("Turning on heater %s", self.heater_entity_id)
-                    await self._async_heater_turn_on()
+                continue
+            requested = True
+        if requested:
+            self._last_actuation = self.hass.loop.time()
+        return requested
+
+    @callback
+    def _async_trace_decision(self, opening):
+        """Record the decided opening and the target it was decided for."""
+        target = self._target_temp if self._hvac_mode != HVAC_MODE_OFF else None
+        if target != self._traced_target:
+            self._traced_target = target
+            self._trace.async_record(
+                KIND_TARGET, self.entity_id, math.nan if target is None else target
+            )
+        self._trace.async_record(KIND_DECISION, self.entity_id, opening)
+
+    def _overshoot_allowance(self):
+        """Return how much earlier the heater is turned off against overshoot.
+
+        The learned rise after turning off, limited by overshoot_guard and by
+        the tolerances so the heater never turns off below the temperature it
+        turns on at.
+        """
+        if not self._overshoot_guard or not self._model.overshoot:
+            return 0.0
+        return max(
+            0.0,
+            min(
+                self._model.overshoot,
+                self._overshoot_guard,
+                self._cold_tolerance + self._hot_tolerance,
+            ),
+        )
+
+    @callback
+    def async_plan(self, group, hvac_mode=None, preset_mode=None, temperature=None):
+        """Apply a change of the set_all service without sending commands.
+
+        The pipelines of the heaters needing another opening are added to
+        group with that opening, set_all sends the commands of all
+        thermostats grouped.
+        """
+        if hvac_mode == HVAC_MODE_OFF:
+            self._hvac_mode = HVAC_MODE_OFF
+            self._async_cancel_tpi_cycle()
+        elif hvac_mode == HVAC_MODE_HEAT:
+            self._hvac_mode = HVAC_MODE_HEAT
+        if preset_mode == PRESET_AWAY and not self._is_away and self._away_temp:
+            self._is_away = True
+            self._saved_target_temp = self._target_temp
+            self._target_temp = self._away_temp
+        elif preset_mode == PRESET_NONE and self._is_away:
+            self._is_away = False
+            self._target_temp = self._saved_target_temp
+        if temperature is not None:
+            self._target_temp = temperature
+        self._async_decide(True, set(), group)
+        self.async_write_ha_state()
+
+    @callback
+    def _async_check_min_cycle(self, turn_on, heater_on):
+        """Keep the heater state until min_cycle_duration has passed."""
+        if self._min_cycle_duration is None or self._last_actuation is None:
+            return turn_on
+        remaining = self._min_cycle_duration.total_seconds() - (
+            self.hass.loop.time() - self._last_actuation
+        )
+        if remaining <= 0:
+            return turn_on
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(
+                "Keeping heaters of %s %s for another %.0f seconds",
+                self.entity_id,
+                "on" if heater_on else "off",
+                remaining,
+            )
+        # SPZB: decide again once the cycle is over, even without new sensor readings
+        if self._recheck_unsub is not None:
+            self._recheck_unsub()
+        self._recheck_unsub = async_call_later(
+            self.hass, remaining, self._async_min_cycle_elapsed
+        )
+        return heater_on
+
+    async def _async_min_cycle_elapsed(self, _):
+        """Decide again after min_cycle_duration kept the heater state."""
+        self._recheck_unsub = None
+        await self._async_control_heating()
+
+    @callback
+    def _async_start_tpi_cycle(self):
+        """Start a time proportional cycle with the current temperatures."""
+        self._async_cancel_tpi_cycle()
+        cycle = self._tpi_cycle.total_seconds()
+        on_time = cycle * tpi_duty(
+            self._cur_temp, self._target_temp, self._tpi_coefficient
+        )
+        if self._min_cycle_duration is not None:
+            # SPZB: no on or off phase shorter than min_cycle_duration
+            min_cycle = self._min_cycle_duration.total_seconds()
+            if on_time < min_cycle:
+                on_time = 0
+            elif cycle - on_time < min_cycle:
+                on_time = cycle
+        _LOGGER.debug(
+            "TPI cycle for %s: heater on for %.0f of %.0f seconds",
+            self.entity_id,
+            on_time,
+            cycle,
+        )
+        self._tpi_on = on_time > 0
+        self._tpi_unsubs.append(
+            async_call_later(self.hass, cycle, self._async_tpi_cycle_elapsed)
+        )
+        if 0 < on_time < cycle:
+            self._tpi_unsubs.append(
+                async_call_later(self.hass, on_time, self._async_tpi_on_time_elapsed)
+            )
+
+    @callback
+    def _async_cancel_tpi_cycle(self):
+        """Cancel the running time proportional cycle."""
+        while self._tpi_unsubs:
+            self._tpi_unsubs.pop()()
+
+    async def _async_tpi_on_time_elapsed(self, _):
+        """Turn the heater off for the rest of the TPI cycle."""
+        self._tpi_on = False
+        await self._async_control_heating()
+
+    async def _async_tpi_cycle_elapsed(self, _):
+        """Start the next TPI cycle."""
+        self._tpi_unsubs.clear()
+        await self._async_control_heating()
+
+    def _heater_opening(self, heater_entity_id):
+        """Return the opening a heater has once pending commands are sent."""
+        # SPZB: the device state lags behind while the pipeline sends commands
+        target = self._pipelines[heater_entity_id].target
+        if target is not None:
+            return target
+        return self._device_opening(heater_entity_id)
+
+    def _device_opening(self, heater_entity_id):
+        """Return the opening a heater currently reports."""
+        if self._proportional:
+            valve_entity_id = self._pipelines[heater_entity_id].driver.valve_entity_id
+            return self._valve_openings[valve_entity_id] or 0.0
+        # SPZB: read from the snapshot kept up to date by _async_switch_changed
+        return 1.0 if self._heater_states[heater_entity_id].active else 0.0
+
+    @callback
+    def async_reconcile(self):
+        """Queue commands for heaters that drifted from the intended opening.
+
+        Called by the platform reconciler, returns the number of drifted heaters.
+        """
+        if self._intended_opening is None or self.startup:
+            return 0
+        drifted = 0
+        for heater_entity_id, pipeline in self._pipelines.items():
+            # SPZB: a busy pipeline is still bringing the heater into the intended state
+            if pipeline.busy or not self._heater_drifted(heater_entity_id):
+                continue
+            _LOGGER.debug(
+                "%s drifted from opening %s", heater_entity_id, self._intended_opening
+            )
+            pipeline.async_request(self._intended_opening, priority=PRIORITY_RECONCILE)
+            drifted += 1
+        if drifted:
+            self.metrics.increment(COUNTER_HEATER_DRIFTS, drifted)
+        return drifted
+
+    def _heater_drifted(self, heater_entity_id):
+        """Return True if a heater reports another state than intended."""
+        opening = self._intended_opening
+        if self._proportional:
+            valve_entity_id = self._pipelines[heater_entity_id].driver.valve_entity_id
+            reported = self._valve_openings[valve_entity_id]
+            return reported is not None and reported != opening
+        heater_state = self._heater_states[heater_entity_id]
+        if heater_state.mode in (None, STATE_UNAVAILABLE, STATE_UNKNOWN):
+            return False
+        # SPZB: compare with the states the turn on and turn off sequences leave behind
+        if opening > 0:
+            return not (
+                heater_state.mode == HVAC_MODE_AUTO
+                and heater_state.setpoint == self.max_temp
+            )
+        return not (
+            heater_state.mode == HVAC_MODE_OFF
+            or (
+                heater_state.mode == HVAC_MODE_AUTO
+                and heater_state.setpoint == self.min_temp
+            )
+        )
+
+    @property
+    def _window_open(self):
+        """If heating is suspended for an open window."""
+        return self._window_detector is not None and self._window_detector.is_open
+
+    @property
+    def _is_heater_on(self):
+        """If any heater is or will be on once pending commands are sent."""
+        return any(
+            self._heater_opening(heater_entity_id) > 0
+            for heater_entity_id in self.heater_entity_ids
+        )
 
     @property
     def _is_device_active(self):
-        """If the toggleable device is currently active."""
-        # SPZB: check for state == "heat"/"auto"/"off" instead of STATE_ON for EUROTRONIC Thermostat ...
-        # SPZB: also check set temperature if device is set to "auto", if it is set to 5°C then it's off
-        state_off = self.hass.states.is_state(self.heater_entity_id, "off")
-        state_heat = self.hass.states.is_state(self.heater_entity_id, "heat")
-        state_auto = self.hass.states.is_state(self.heater_entity_id, "auto")
-        state_temp = self.hass.states.get(self.heater_entity_id)
-        _LOGGER.debug("%s.state = %s", self.heater_entity_id, state_temp) #SPZB: log for debugging
-        _LOGGER.debug("%s.SetPointTemp = %s", self.heater_entity_id, state_temp.attributes[ATTR_TEMPERATURE] if state_temp != None else None) #SPZB: log for debugging
-        if (state_auto and state_temp.attributes[ATTR_TEMPERATURE] == 5.0) or state_off:
-            _LOGGER.debug("state_auto: %s and %s.SetPointTemp = %s", state_auto, self.heater_entity_id, state_temp.attributes[ATTR_TEMPERATURE]) #SPZB: log for debugging
-            return False
-        elif state_heat:
-            _LOGGER.debug("state_heat: %s for %s", state_heat, self.heater_entity_id) #SPZB: log for debugging
-            return state_heat
-        elif state_auto:
-            _LOGGER.debug("state_auto: %s for %s", state_auto, self.heater_entity_id) #SPZB: log for debugging
-            return state_auto
+        """If any toggleable device is currently active."""
+        return any(
+            self._device_opening(heater_entity_id) > 0
+            for heater_entity_id in self.heater_entity_ids
+        )
 
     @property
     def supported_features(self):
         """Return the list of supported features."""
         return self._support_flags
 
-    async def _async_heater_turn_on(self):
-        """Turn heater toggleable device on."""
-        # SPZB: handle EUROTRONIC SPIRIT ZIGBEE thermostat
-        # SPZB: Service set HVAC mode to auto
-        data_auto = {
-            ATTR_ENTITY_ID: self.heater_entity_id,
-            ATTR_HVAC_MODE: HVAC_MODE_AUTO,
-        }
-        await self.hass.services.async_call(
-            CLIMATE_DOMAIN,
-            SERVICE_SET_HVAC_MODE,
-            data_auto,
-            blocking=True,
-        )
-        await asyncio.sleep(
-            5
-        )  # SPZB: wait for 5 seconds due to issues with sending command too fast
-        _LOGGER.debug("data_auto: %s for %s", data_auto, self.heater_entity_id) #SPZB: log for debugging
-        # SPZB: Service set temperature to max_temp
-        data_temp = {
-            ATTR_ENTITY_ID: self.heater_entity_id,
-            ATTR_TEMPERATURE: self.max_temp,
-        }
-        await self.hass.services.async_call(
-            CLIMATE_DOMAIN,
-            SERVICE_SET_TEMPERATURE,
-            data_temp,
-            blocking=True,
-        )
-        await asyncio.sleep(
-            25
-        )  # SPZB: wait for 25 seconds to let the thermostat finish before sending another command
-        _LOGGER.debug("data_temp: %s for %s", data_temp, self.heater_entity_id) #SPZB: log for debugging
-        _LOGGER.debug("_async_heater_turn_on executed for %s", self.heater_entity_id) #SPZB: log for debugging
-
-    async def _async_heater_turn_off(self):
-        """Turn heater toggleable device off."""
-        # SPZB: handle EUROTRONIC SPIRIT ZIGBEE thermostat
-        # SPZB: Service set temperature to min_temp
-        data_temp = {
-            ATTR_ENTITY_ID: self.heater_entity_id,
-            ATTR_TEMPERATURE: self.min_temp,
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes of the thermostat."""
+        # SPZB: only values that change rarely, every change is stored by the recorder
+        return {
+            ATTR_THERMAL_MODEL: self._model.as_dict(),
+            ATTR_PREHEAT: self._preheat[0] if self._preheat is not None else None,
+            ATTR_WINDOW_OPEN: self._window_open,
+            ATTR_QUARANTINED_HEATERS: [
+                heater_entity_id
+                for heater_entity_id, pipeline in self._pipelines.items()
+                if pipeline.health == HEALTH_QUARANTINED
+            ],
         }
-        await self.hass.services.async_call(
-            CLIMATE_DOMAIN,
-            SERVICE_SET_TEMPERATURE,
-            data_temp,
-            blocking=True,
-        )
-        await asyncio.sleep(
-            25
-        )  # SPZB: wait for 25 seconds due to issues with sending command too fast
-        # SPZB: Service set HVAC mode to off
-        data_off = {
-            ATTR_ENTITY_ID: self.heater_entity_id,
-            ATTR_HVAC_MODE: HVAC_MODE_OFF,
+
+    @property
+    def statistics(self):
+        """Return the metrics, actuations and heater statistics for dump_metrics."""
+        return {
+            **self.metrics.as_dict(),
+            ATTR_ACTUATIONS: self._actuation_counter.actuations,
+            ATTR_ACTUATIONS_AVOIDED: self._actuation_counter.avoided,
+            ATTR_HEATERS: {
+                heater_entity_id: pipeline.statistics
+                for heater_entity_id, pipeline in self._pipelines.items()
+            },
         }
-        await self.hass.services.async_call(
-            CLIMATE_DOMAIN,
-            SERVICE_SET_HVAC_MODE,
-            data_off,
-            blocking=True,
-        )
-        await asyncio.sleep(
-            5
-        )  # SPZB: wait for 5 seconds due to issues with sending command too fast
-        # SPZB: Service send off to thermostat
-        data = {ATTR_ENTITY_ID: self.heater_entity_id}
-        await self.hass.services.async_call(
-            HA_DOMAIN, SERVICE_TURN_OFF, data, context=self._context
+
+    async def _async_heater_call(self, heater_entity_id, domain, service, data, **kwargs):
+        """Call a service for the heater and record its duration."""
+        started = self.hass.loop.time()
+        # SPZB: tag the command so _async_switch_changed recognises its echo
+        context = Context()
+        self.async_remember_context(context)
+        await self._scheduler.async_call(
+            heater_entity_id,
+            domain,
+            service,
+            data,
+            # SPZB: e.g. closing for an open window skips the commands of other thermostats
+            priority=self._pipelines[heater_entity_id].priority,
+            context=context,
+            **kwargs,
         )
-        await asyncio.sleep(
-            30
-        )  # SPZB: wait for 30 seconds to let the thermostat finish before sending another command
-        _LOGGER.debug("_async_heater_turn_off executed for %s", self.heater_entity_id) #SPZB: log for debugging
+        duration = self.hass.loop.time() - started
+        self.metrics.increment(COUNTER_COMMANDS_SENT)
+        self.metrics.observe(f"{domain}.{service}", duration)
+        self._trace.async_record(KIND_COMMAND, heater_entity_id, duration)
+
+    @callback
+    def async_remember_context(self, context):
+        """Remember the context of a command to recognise its echo."""
+        self._own_contexts.append(context.id)
 
     async def async_set_preset_mode(self, preset_mode: str):
         """Set new preset mode."""
@@ -553,18 +1773,40 @@ class SPZB0001Thermostat(ClimateEntity, RestoreEntity):
             self._is_away = True
             self._saved_target_temp = self._target_temp
             self._target_temp = self._away_temp
-            await self._async_control_heating()
+            await self._async_control_heating(force=True, priority=PRIORITY_USER)
         elif preset_mode == PRESET_NONE and self._is_away:
             self._is_away = False
             self._target_temp = self._saved_target_temp
-            await self._async_control_heating()
+            await self._async_control_heating(force=True, priority=PRIORITY_USER)
 
         self.async_write_ha_state()
 
-    async def _async_init_shutdown_thermostat(
+    @callback
+    def _async_init_reconcile_thermostat(
         self,
     ):  # SPZB: new function for avoiding inconsistency on startup
-        """Shutdown the connected SPZB0001 thermostat after restart of HA to prevent wrong state"""
-        await self._async_heater_turn_off()  # turn of the corresponding EUROTRONIC thermostat on startup
-        self.startup = False
-        _LOGGER.debug("_async_init_shutdown_thermostat running for %s", self.heater_entity_id) #SPZB: log for debugging
+        """Check the connected SPZB0001 thermostat after restart of HA for a wrong state.
+
+        Returns the heaters that are in none of the states this integration
+        leaves them in and therefore need commands.
+        """
+        if self._proportional:
+            # SPZB: a valve position is compared with the decision like any other state
+            self.startup = False
+            return set()
+        inconsistent = set()
+        for heater_entity_id in list(self._unreconciled):
+            heater_state = self._heater_states[heater_entity_id]
+            if heater_state.mode in (None, STATE_UNAVAILABLE, STATE_UNKNOWN):
+                # SPZB: try again once the thermostat reports a state
+                continue
+            self._unreconciled.discard(heater_entity_id)
+            consistent = heater_state.mode == HVAC_MODE_OFF or (
+                heater_state.mode == HVAC_MODE_AUTO
+                and heater_state.setpoint in (self.min_temp, self.max_temp)
+            )
+            _LOGGER.debug("_async_init_reconcile_thermostat running for %s, consistent: %s", heater_entity_id, consistent) #SPZB: log for debugging
+            if not consistent:
+                inconsistent.add(heater_entity_id)
+        self.startup = bool(self._unreconciled)
+        return inconsistent
@@ -0,0 +1,64 @@
+"""Control strategies for SPZB0001 thermostat units."""
+
+CONTROL_MODE_HYSTERESIS = "hysteresis"
+CONTROL_MODE_TPI = "tpi"
+CONTROL_MODES = [CONTROL_MODE_HYSTERESIS, CONTROL_MODE_TPI]
+
+
+def hysteresis_decision(cur_temp, target_temp, heater_on, cold_tolerance, hot_tolerance):
+    """Return if the heater should be on.
+
+    A heater that is on stays on until the temperature reaches target plus
+    hot_tolerance, a heater that is off stays off until the temperature drops
+    to target minus cold_tolerance.
+    """
+    if heater_on:
+        return cur_temp < target_temp + hot_tolerance
+    return cur_temp <= target_temp - cold_tolerance
+
+
+def tpi_duty(cur_temp, target_temp, coefficient):
+    """Return the share of a time proportional cycle the heater should be on."""
+    return min(1.0, max(0.0, (target_temp - cur_temp) * coefficient))
+
+
+class ActuationCounter:
+    """Count heater actuations against a controller without tolerances.
+
+    The baseline is the behaviour of the original control loop, which switches
+    on as soon as the temperature is at or below target and off as soon as it
+    is at or above target. Actuations avoided is the difference between the
+    baseline and the actuations actually requested. Only decisions of the
+    control loop are counted, while it does not run, e.g. with HVAC mode off,
+    the baseline is reset and starts again from the heater state.
+    """
+
+    def __init__(self):
+        """Initialize the counter."""
+        self.actuations = 0
+        self.baseline_actuations = 0
+        self._baseline_on = None
+
+    @property
+    def avoided(self):
+        """Return how many actuations the baseline would have needed more."""
+        return max(0, self.baseline_actuations - self.actuations)
+
+    def observe(self, cur_temp, target_temp, heater_on):
+        """Advance the baseline controller with a new reading."""
+        if self._baseline_on is None:
+            self._baseline_on = heater_on
+        baseline_on = hysteresis_decision(
+            cur_temp, target_temp, self._baseline_on, 0.0, 0.0
+        )
+        if baseline_on != self._baseline_on:
+            self._baseline_on = baseline_on
+            self.baseline_actuations += 1
+
+    def reset(self):
+        """Forget the baseline state while the control loop does not decide."""
+        self._baseline_on = None
+
+    def actuated(self):
+        """Record an actuation requested by the real controller."""
+        self.actuations += 1
@@ -0,0 +1,75 @@
+"""Shared state change subscription for SPZB0001 thermostat units."""
+import logging
+
+from homeassistant.const import ATTR_ENTITY_ID, EVENT_STATE_CHANGED
+from homeassistant.core import HassJob, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StateChangeDispatcher:
+    """Route state changed events to the thermostats watching the entity.
+
+    All thermostats share one event bus listener, the watched entities are
+    looked up in a dict so the cost per event does not grow with the number
+    of zones.
+    """
+
+    def __init__(self, hass):
+        """Initialize the dispatcher."""
+        self.hass = hass
+        self._jobs = {}
+        self._unsub = None
+
+    @callback
+    def async_track(self, entity_id, action):
+        """Call action with the state changed events of entity_id.
+
+        Returns a function to stop tracking.
+        """
+        # SPZB: entity ids are lowercase in events, as in async_track_state_change_event
+        entity_id = entity_id.lower()
+        job = HassJob(action)
+        self._jobs.setdefault(entity_id, []).append(job)
+        if self._unsub is None:
+            self._unsub = self.hass.bus.async_listen(
+                EVENT_STATE_CHANGED,
+                self._async_dispatch,
+                event_filter=self._async_filter,
+                run_immediately=True,
+            )
+
+        @callback
+        def _async_remove():
+            jobs = self._jobs.get(entity_id)
+            if jobs is None or job not in jobs:
+                return
+            jobs.remove(job)
+            if not jobs:
+                del self._jobs[entity_id]
+            if not self._jobs and self._unsub is not None:
+                self._unsub()
+                self._unsub = None
+
+        return _async_remove
+
+    @callback
+    def _async_filter(self, event):
+        """Only pass on state changed events of watched entities."""
+        return event.data.get(ATTR_ENTITY_ID) in self._jobs
+
+    @callback
+    def _async_dispatch(self, event):
+        """Hand a state changed event to the actions watching the entity."""
+        entity_id = event.data.get(ATTR_ENTITY_ID)
+        jobs = self._jobs.get(entity_id)
+        if jobs is None:
+            return
+        for job in list(jobs):
+            try:
+                self.hass.async_run_hass_job(job, event)
+            except Exception:  # pylint: disable=broad-except
+                # SPZB: one failing thermostat must not keep the event from the others
+                _LOGGER.exception(
+                    "Error while dispatching event for %s to %s", entity_id, job
+                )
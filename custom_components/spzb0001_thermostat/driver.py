@@ -0,0 +1,351 @@
+"""Backends that move the valve of SPZB0001 thermostat units."""
+import asyncio
+import logging
+
+from homeassistant.components.climate import (
+    DOMAIN as CLIMATE_DOMAIN,
+    SERVICE_SET_HVAC_MODE,
+    SERVICE_SET_TEMPERATURE,
+)
+from homeassistant.components.climate.const import (
+    ATTR_HVAC_MODE,
+    HVAC_MODE_AUTO,
+    HVAC_MODE_OFF,
+)
+from homeassistant.const import (
+    ATTR_ENTITY_ID,
+    ATTR_TEMPERATURE,
+    SERVICE_TURN_OFF,
+    STATE_UNAVAILABLE,
+    STATE_UNKNOWN,
+)
+from homeassistant.core import DOMAIN as HA_DOMAIN, split_entity_id
+
+from .heater import (
+    async_wait_for_heaters,
+    hvac_mode_is,
+    temperature_is,
+)
+from .metrics import COUNTER_COMMANDS_RETRIED
+
+_LOGGER = logging.getLogger(__name__)
+
+# SPZB: timeouts in seconds to wait for the EUROTRONIC thermostat to acknowledge a command
+MODE_ACK_TIMEOUT = 5
+TEMP_ACK_TIMEOUT = 25
+OFF_ACK_TIMEOUT = 30
+VALVE_ACK_TIMEOUT = 25
+
+VALVE_DOMAIN = "valve"
+VALVE_DOMAINS = ["number", "input_number", VALVE_DOMAIN]
+SERVICE_SET_VALUE = "set_value"
+SERVICE_SET_VALVE_POSITION = "set_valve_position"
+ATTR_VALUE = "value"
+ATTR_POSITION = "position"
+ATTR_CURRENT_POSITION = "current_position"
+
+# SPZB: openings are compared at this many decimals, finer steps are not worth a command
+OPENING_DECIMALS = 2
+
+
+class HeaterDriver:
+    """Interface of the backends moving a heater.
+
+    A driver moves the heater to an opening between 0 (closed) and 1 (fully
+    open) with async_apply, which returns False if the heater did not report
+    the opening in time. Drivers without valve positions treat every opening
+    above 0 as fully open.
+
+    Backends implement async_apply_group, which moves several heaters with
+    one service call per step. async_apply moves a single heater with it, and
+    drivers with the same group_key can be moved together.
+    """
+
+    def __init__(self, hass, heater_entity_id, call):
+        """Initialize the driver.
+
+        call(heater_entity_id, domain, service, data, **kwargs) sends a
+        command for the heater.
+        """
+        self.hass = hass
+        self.heater_entity_id = heater_entity_id
+        self._call = call
+
+    @property
+    def group_key(self):
+        """Return the key of the drivers that can be moved together."""
+        return (type(self),)
+
+    async def async_apply(self, opening):
+        """Move the heater to opening, return True if acknowledged."""
+        acknowledged = await self.async_apply_group(
+            [self], opening, _single_call(self._call)
+        )
+        return self.heater_entity_id in acknowledged
+
+    @classmethod
+    async def async_apply_group(cls, drivers, opening, call):
+        """Move the heaters of drivers to opening.
+
+        call(heater_entity_ids, domain, service, data, **kwargs) sends a
+        command for several heaters. Returns the acknowledged heaters.
+        """
+        raise NotImplementedError
+
+
+class ModeSequenceDriver(HeaterDriver):
+    """Switch the heater with HVAC mode and setpoint sequences.
+
+    This is the workaround for deCONZ which cannot set the valve position:
+    auto with max_temp opens the valve, min_temp followed by off closes it.
+    """
+
+    def __init__(self, hass, heater_entity_id, call, min_temp, max_temp, metrics):
+        """Initialize the driver."""
+        super().__init__(hass, heater_entity_id, call)
+        self.min_temp = min_temp
+        self.max_temp = max_temp
+        self.metrics = metrics
+
+    @property
+    def group_key(self):
+        """Return the key of the drivers that can be moved together."""
+        return (type(self), self.min_temp, self.max_temp)
+
+    @classmethod
+    async def async_apply_group(cls, drivers, opening, call):
+        """Turn the heaters on for any opening above 0, else off."""
+        if opening > 0:
+            return await cls.async_turn_on(drivers, call)
+        return await cls.async_turn_off(drivers, call)
+
+    @staticmethod
+    async def async_turn_on(drivers, call):
+        """Turn heater toggleable devices on."""
+        hass = drivers[0].hass
+        max_temp = drivers[0].max_temp
+        heater_entity_ids = [driver.heater_entity_id for driver in drivers]
+        # SPZB: handle EUROTRONIC SPIRIT ZIGBEE thermostat
+        # SPZB: Service set HVAC mode to auto
+        data_auto = {
+            ATTR_ENTITY_ID: _service_entity_id(heater_entity_ids),
+            ATTR_HVAC_MODE: HVAC_MODE_AUTO,
+        }
+        await call(
+            heater_entity_ids,
+            CLIMATE_DOMAIN,
+            SERVICE_SET_HVAC_MODE,
+            data_auto,
+            blocking=True,
+        )
+        # SPZB: wait for the thermostats to report auto before sending the next command
+        await async_wait_for_heaters(
+            hass,
+            heater_entity_ids,
+            hvac_mode_is(HVAC_MODE_AUTO),
+            MODE_ACK_TIMEOUT,
+        )
+        _LOGGER.debug("data_auto: %s", data_auto) #SPZB: log for debugging
+        # SPZB: Service set temperature to max_temp
+        data_temp = {
+            ATTR_ENTITY_ID: _service_entity_id(heater_entity_ids),
+            ATTR_TEMPERATURE: max_temp,
+        }
+        await call(
+            heater_entity_ids,
+            CLIMATE_DOMAIN,
+            SERVICE_SET_TEMPERATURE,
+            data_temp,
+            blocking=True,
+        )
+        # SPZB: wait for the thermostats to report max_temp before sending another command
+        acknowledged = await async_wait_for_heaters(
+            hass,
+            heater_entity_ids,
+            temperature_is(max_temp),
+            TEMP_ACK_TIMEOUT,
+        )
+        _LOGGER.debug("data_temp: %s", data_temp) #SPZB: log for debugging
+        _LOGGER.debug("async_turn_on executed for %s", heater_entity_ids) #SPZB: log for debugging
+        return acknowledged
+
+    @staticmethod
+    async def async_turn_off(drivers, call):
+        """Turn heater toggleable devices off."""
+        hass = drivers[0].hass
+        min_temp = drivers[0].min_temp
+        heater_entity_ids = [driver.heater_entity_id for driver in drivers]
+        # SPZB: handle EUROTRONIC SPIRIT ZIGBEE thermostat
+        # SPZB: Service set temperature to min_temp
+        data_temp = {
+            ATTR_ENTITY_ID: _service_entity_id(heater_entity_ids),
+            ATTR_TEMPERATURE: min_temp,
+        }
+        await call(
+            heater_entity_ids,
+            CLIMATE_DOMAIN,
+            SERVICE_SET_TEMPERATURE,
+            data_temp,
+            blocking=True,
+        )
+        # SPZB: wait for the thermostats to report min_temp before sending the next command
+        await async_wait_for_heaters(
+            hass,
+            heater_entity_ids,
+            temperature_is(min_temp),
+            TEMP_ACK_TIMEOUT,
+        )
+        # SPZB: Service set HVAC mode to off
+        data_off = {
+            ATTR_ENTITY_ID: _service_entity_id(heater_entity_ids),
+            ATTR_HVAC_MODE: HVAC_MODE_OFF,
+        }
+        await call(
+            heater_entity_ids,
+            CLIMATE_DOMAIN,
+            SERVICE_SET_HVAC_MODE,
+            data_off,
+            blocking=True,
+        )
+        # SPZB: wait for the thermostats to report off before sending the next command
+        acknowledged = await async_wait_for_heaters(
+            hass,
+            heater_entity_ids,
+            hvac_mode_is(HVAC_MODE_OFF),
+            MODE_ACK_TIMEOUT,
+        )
+        # SPZB: only thermostats that missed the off command get it again
+        missed = [
+            driver for driver in drivers if driver.heater_entity_id not in acknowledged
+        ]
+        if missed:
+            missed_entity_ids = [driver.heater_entity_id for driver in missed]
+            # SPZB: Service send off to thermostat
+            for driver in missed:
+                driver.metrics.increment(COUNTER_COMMANDS_RETRIED)
+            data = {ATTR_ENTITY_ID: _service_entity_id(missed_entity_ids)}
+            await call(
+                missed_entity_ids,
+                HA_DOMAIN,
+                SERVICE_TURN_OFF,
+                data,
+            )
+            # SPZB: wait for the thermostats to report off before sending another command
+            acknowledged |= await async_wait_for_heaters(
+                hass,
+                missed_entity_ids,
+                hvac_mode_is(HVAC_MODE_OFF),
+                OFF_ACK_TIMEOUT,
+            )
+        _LOGGER.debug("async_turn_off executed for %s", heater_entity_ids) #SPZB: log for debugging
+        return acknowledged
+
+
+class ValvePositionDriver(HeaterDriver):
+    """Set the valve position of the heater with a single command.
+
+    valve_entity_id is a number or input_number entity taking the raw valve
+    position between its min and max (0 to 255 for EUROTRONIC thermostats),
+    or a valve entity taking a position in percent.
+    """
+
+    def __init__(self, hass, heater_entity_id, call, valve_entity_id):
+        """Initialize the driver."""
+        super().__init__(hass, heater_entity_id, call)
+        self.valve_entity_id = valve_entity_id
+        self._domain = split_entity_id(valve_entity_id)[0]
+
+    def opening(self, state):
+        """Return the opening reported by a valve entity state, None if unknown."""
+        if state is None or state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+            return None
+        try:
+            if self._domain == VALVE_DOMAIN:
+                return round(
+                    float(state.attributes[ATTR_CURRENT_POSITION]) / 100,
+                    OPENING_DECIMALS,
+                )
+            minimum, maximum = self._range(state)
+            return round(
+                (float(state.state) - minimum) / (maximum - minimum),
+                OPENING_DECIMALS,
+            )
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            return None
+
+    def _range(self, state):
+        """Return the raw positions of a closed and a fully open valve."""
+        if state is None:
+            return 0.0, 255.0
+        return (
+            float(state.attributes.get("min", 0)),
+            float(state.attributes.get("max", 255)),
+        )
+
+    @property
+    def group_key(self):
+        """Return the key of the drivers that can be moved together."""
+        return (type(self), self._domain)
+
+    def _position(self, opening):
+        """Return service, attribute and value setting the valve to opening."""
+        if self._domain == VALVE_DOMAIN:
+            return SERVICE_SET_VALVE_POSITION, ATTR_POSITION, round(opening * 100)
+        minimum, maximum = self._range(self.hass.states.get(self.valve_entity_id))
+        return (
+            SERVICE_SET_VALUE,
+            ATTR_VALUE,
+            round(minimum + opening * (maximum - minimum)),
+        )
+
+    @classmethod
+    async def async_apply_group(cls, drivers, opening, call):
+        """Set the valve positions for opening, one call per raw position."""
+        positions = {}
+        for driver in drivers:
+            positions.setdefault(driver._position(opening), []).append(driver)
+        calls = []
+        for (service, attribute, value), position_drivers in positions.items():
+            data = {
+                ATTR_ENTITY_ID: _service_entity_id(
+                    [driver.valve_entity_id for driver in position_drivers]
+                ),
+                attribute: value,
+            }
+            calls.append(
+                call(
+                    [driver.heater_entity_id for driver in position_drivers],
+                    drivers[0]._domain,
+                    service,
+                    data,
+                    blocking=True,
+                )
+            )
+        await asyncio.gather(*calls)
+        # SPZB: wait for the positions to be reported, the pipelines send nothing meanwhile
+        valves = {driver.valve_entity_id: driver for driver in drivers}
+        expected = round(opening, OPENING_DECIMALS)
+        acknowledged = await async_wait_for_heaters(
+            drivers[0].hass,
+            list(valves),
+            lambda state: valves[state.entity_id].opening(state) == expected,
+            VALVE_ACK_TIMEOUT,
+        )
+        _LOGGER.debug("%s set to %s", list(valves), opening) #SPZB: log for debugging
+        return {valves[valve_entity_id].heater_entity_id for valve_entity_id in acknowledged}
+
+
+def _service_entity_id(heater_entity_ids):
+    """Return the entity_id of the service data for one or several heaters."""
+    if len(heater_entity_ids) == 1:
+        return heater_entity_ids[0]
+    return list(heater_entity_ids)
+
+
+def _single_call(call):
+    """Adapt the call of a single heater to the call of a group."""
+
+    async def _async_call(heater_entity_ids, domain, service, data, **kwargs):
+        await call(heater_entity_ids[0], domain, service, data, **kwargs)
+
+    return _async_call
@@ -0,0 +1,92 @@
+"""Helpers to talk to EUROTRONIC SPZB0001 heater entities."""
+import asyncio
+from collections import namedtuple
+import logging
+
+from homeassistant.components.climate.const import (
+    HVAC_MODE_AUTO,
+    HVAC_MODE_HEAT,
+)
+from homeassistant.const import ATTR_TEMPERATURE
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_state_change_event
+
+_LOGGER = logging.getLogger(__name__)
+
+HeaterState = namedtuple("HeaterState", ["mode", "setpoint", "active"])
+HeaterState.__doc__ = """Compact snapshot of a heater entity state."""
+
+HEATER_STATE_UNKNOWN = HeaterState(None, None, False)
+
+
+def parse_heater_state(state, min_temp):
+    """Return the snapshot of a heater entity state."""
+    if state is None:
+        return HEATER_STATE_UNKNOWN
+    mode = state.state
+    setpoint = state.attributes.get(ATTR_TEMPERATURE)
+    # SPZB: check for state == "heat"/"auto"/"off" instead of STATE_ON for EUROTRONIC Thermostat ...
+    # SPZB: also check set temperature if device is set to "auto", if it is set to min_temp then it's off
+    if mode == HVAC_MODE_AUTO:
+        active = setpoint != min_temp
+    else:
+        active = mode == HVAC_MODE_HEAT
+    return HeaterState(mode, setpoint, active)
+
+
+def hvac_mode_is(hvac_mode):
+    """Return a state predicate matching the given HVAC mode."""
+    return lambda state: state.state == hvac_mode
+
+
+def temperature_is(temperature):
+    """Return a state predicate matching the given setpoint."""
+    return lambda state: state.attributes.get(ATTR_TEMPERATURE) == temperature
+
+
+async def async_wait_for_heaters(hass, heater_entity_ids, predicate, timeout):
+    """Wait until the states of all heaters match predicate.
+
+    A single listener waits for all heaters. Returns the heaters that
+    reported the expected state, as soon as all did or after timeout seconds.
+    """
+    acknowledged = set()
+    for heater_entity_id in heater_entity_ids:
+        state = hass.states.get(heater_entity_id)
+        if state is not None and predicate(state):
+            acknowledged.add(heater_entity_id)
+    waiting = [
+        heater_entity_id
+        for heater_entity_id in heater_entity_ids
+        if heater_entity_id not in acknowledged
+    ]
+    if not waiting:
+        return acknowledged
+
+    done = hass.loop.create_future()
+
+    @callback
+    def _async_heater_changed(event):
+        new_state = event.data.get("new_state")
+        if new_state is None or not predicate(new_state):
+            return
+        acknowledged.add(new_state.entity_id)
+        if len(acknowledged) == len(heater_entity_ids) and not done.done():
+            done.set_result(None)
+
+    unsub = async_track_state_change_event(hass, waiting, _async_heater_changed)
+    try:
+        await asyncio.wait_for(done, timeout)
+    except asyncio.TimeoutError:
+        _LOGGER.debug(
+            "%s did not acknowledge within %s seconds",
+            [
+                heater_entity_id
+                for heater_entity_id in heater_entity_ids
+                if heater_entity_id not in acknowledged
+            ],
+            timeout,
+        )
+    finally:
+        unsub()
+    return set(acknowledged)
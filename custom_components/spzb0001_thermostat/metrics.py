@@ -0,0 +1,90 @@
+"""Runtime metrics of SPZB0001 thermostat units."""
+from bisect import bisect_left
+
+# SPZB: seconds, covers everything from an event handler to a full turn off sequence
+LATENCY_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+
+HISTOGRAM_SENSOR_TO_DECISION = "sensor_to_decision"
+# SPZB: from a request until the heater acknowledged it, per priority class
+HISTOGRAM_PRIORITY_LATENCY = "{}_latency"
+
+COUNTER_COMMANDS_SENT = "commands_sent"
+COUNTER_COMMANDS_RETRIED = "commands_retried"
+COUNTER_COMMANDS_SUPERSEDED = "commands_superseded"
+COUNTER_COMMANDS_FAILED = "commands_failed"
+COUNTER_COMMANDS_PREEMPTED = "commands_preempted"
+COUNTER_HEATER_REVERTS = "heater_reverts"
+COUNTER_HEATER_DRIFTS = "heater_drifts"
+COUNTER_HEATER_QUARANTINES = "heater_quarantines"
+COUNTER_ECHOES_IGNORED = "echoes_ignored"
+COUNTER_WINDOW_OPENINGS = "window_openings"
+
+
+class Histogram:
+    """Count observed durations in fixed buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Initialize the histogram."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """Add an observed duration."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def summary(self):
+        """Return count, mean and max."""
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+        }
+
+    def as_dict(self):
+        """Return the summary and the bucket counts."""
+        buckets = {f"le_{bound}": count for bound, count in zip(self.buckets, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {**self.summary(), "buckets": buckets}
+
+
+class Metrics:
+    """Histograms and counters of a thermostat or of the whole platform.
+
+    Everything observed is also observed by the parent, so the platform
+    metrics add up the metrics of all thermostats.
+    """
+
+    def __init__(self, parent=None):
+        """Initialize the metrics."""
+        self.parent = parent
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value):
+        """Add a duration to the histogram name."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+        if self.parent is not None:
+            self.parent.observe(name, value)
+
+    def increment(self, name, value=1):
+        """Increment the counter name."""
+        self.counters[name] = self.counters.get(name, 0) + value
+        if self.parent is not None:
+            self.parent.increment(name, value)
+
+    def as_dict(self):
+        """Return all counters and histograms."""
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: hist.as_dict() for name, hist in self.histograms.items()},
+        }
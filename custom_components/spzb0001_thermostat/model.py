@@ -0,0 +1,118 @@
+"""Learned thermal model of rooms heated by SPZB0001 thermostat units."""
+
+# SPZB: weight of a new measurement in the learned values
+MODEL_ALPHA = 0.2
+# SPZB: seconds a heater state must last before its rate is learned, shorter
+# SPZB: segments are dominated by the latency of the valve and the radiator
+MIN_SEGMENT = 600
+# SPZB: long segments are learned in parts so the model follows the seasons
+MAX_SEGMENT = 3600
+
+
+class ThermalModel:
+    """Heating rate, cooling rate and overshoot of a room, learned online.
+
+    Temperatures are observed with the heater state. The average rate of
+    every segment with the heater on or off updates heating_rate or
+    cooling_rate (degrees per hour). After the heater turned off the further
+    rise of the temperature updates overshoot. Only these few numbers are
+    kept, so the model is cheap to store in the state attributes.
+    """
+
+    def __init__(self, heating_rate=None, cooling_rate=None, overshoot=None, samples=0):
+        """Initialize the model."""
+        self.heating_rate = heating_rate
+        self.cooling_rate = cooling_rate
+        self.overshoot = overshoot
+        self.samples = samples
+        self._segment = None
+        self._off_temp = None
+        self._peak = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return a model restored from as_dict, a new one if data is invalid."""
+        if not isinstance(data, dict):
+            return cls()
+        try:
+            return cls(
+                _optional_float(data.get("heating_rate")),
+                _optional_float(data.get("cooling_rate")),
+                _optional_float(data.get("overshoot")),
+                int(data.get("samples", 0)),
+            )
+        except (TypeError, ValueError):
+            return cls()
+
+    def as_dict(self):
+        """Return the learned values."""
+        return {
+            "heating_rate": _optional_round(self.heating_rate),
+            "cooling_rate": _optional_round(self.cooling_rate),
+            "overshoot": _optional_round(self.overshoot),
+            "samples": self.samples,
+        }
+
+    def observe(self, time, temperature, heater_on):
+        """Learn from a temperature observed at time (seconds)."""
+        self._observe_overshoot(temperature, heater_on)
+        segment = self._segment
+        if segment is None or segment[2] != heater_on:
+            if segment is not None and heater_on is False:
+                # SPZB: the heater just turned off, watch how far the temperature keeps rising
+                self._off_temp = self._peak = temperature
+            self._close_segment(time, temperature, MIN_SEGMENT)
+            self._segment = (time, temperature, heater_on)
+        elif time - segment[0] >= MAX_SEGMENT:
+            self._close_segment(time, temperature, MAX_SEGMENT)
+            self._segment = (time, temperature, heater_on)
+
+    def _close_segment(self, time, temperature, min_duration):
+        """Learn the rate of the running segment if it lasted long enough."""
+        segment = self._segment
+        if segment is None or time - segment[0] < min_duration:
+            return
+        rate = (temperature - segment[1]) / (time - segment[0]) * 3600
+        if segment[2]:
+            self.heating_rate = _learn(self.heating_rate, rate)
+        else:
+            self.cooling_rate = _learn(self.cooling_rate, rate)
+        self.samples += 1
+
+    def _observe_overshoot(self, temperature, heater_on):
+        """Learn how far the temperature rises after the heater turned off."""
+        if self._peak is None:
+            return
+        if not heater_on and temperature >= self._peak:
+            self._peak = temperature
+            return
+        self.overshoot = _learn(self.overshoot, self._peak - self._off_temp)
+        self._off_temp = self._peak = None
+
+    def preheat_time(self, temperature, target_temp):
+        """Return the seconds needed to heat from temperature to target_temp.
+
+        Returns None as long as no positive heating rate was learned.
+        """
+        if temperature >= target_temp:
+            return 0.0
+        if self.heating_rate is None or self.heating_rate <= 0:
+            return None
+        return (target_temp - temperature) / self.heating_rate * 3600
+
+
+def _learn(value, measured):
+    """Return value moved towards measured."""
+    if value is None:
+        return measured
+    return value + MODEL_ALPHA * (measured - value)
+
+
+def _optional_float(value):
+    """Return value as float, None stays None."""
+    return None if value is None else float(value)
+
+
+def _optional_round(value):
+    """Return value rounded for the state attributes, None stays None."""
+    return None if value is None else round(value, 3)
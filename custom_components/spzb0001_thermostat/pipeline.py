@@ -0,0 +1,310 @@
+"""Per-heater command pipeline for SPZB0001 thermostat units."""
+import asyncio
+import logging
+import random
+
+from homeassistant.core import callback
+
+from .metrics import (
+    COUNTER_COMMANDS_FAILED,
+    COUNTER_COMMANDS_PREEMPTED,
+    COUNTER_COMMANDS_SUPERSEDED,
+    COUNTER_HEATER_QUARANTINES,
+    HISTOGRAM_PRIORITY_LATENCY,
+)
+from .scheduler import PRIORITY_CONTROL, PRIORITY_USER, outranks
+
+_LOGGER = logging.getLogger(__name__)
+
+HEALTH_OK = "ok"
+HEALTH_DEGRADED = "degraded"
+HEALTH_QUARANTINED = "quarantined"
+
+# SPZB: seconds to wait before the first retry, doubled with every further failure
+BACKOFF_BASE = 30
+BACKOFF_MAX = 1800
+# SPZB: share of the backoff drawn at random, spreads the retries of many heaters
+BACKOFF_JITTER = 0.5
+# SPZB: failures in a row after which a heater only gets a command every BACKOFF_MAX
+QUARANTINE_FAILURES = 5
+
+
+class HeaterCommandPipeline:
+    """Run heater command sequences in the background, newest request wins.
+
+    Control decisions only hand the desired heater opening to the pipeline.
+    A single worker per heater applies it with the driver; requests arriving
+    while a sequence is running replace each other, so only the newest one is
+    applied once the running sequence is finished.
+
+    Sequences that raise or are not acknowledged by the heater count as
+    failures of this heater. After a failure the pipeline holds back for an
+    exponential backoff with jitter and retries the opening, newer requests
+    replace the retry but wait for the backoff too. After
+    QUARANTINE_FAILURES failures in a row the heater is quarantined: it is
+    not retried any more and requests are sent once per BACKOFF_MAX only.
+
+    Every request has a priority class. A request more urgent than the
+    running sequence cancels it for another opening: the command in flight
+    is completed, the steps after it are not sent. The time from a request
+    until the heater acknowledged it is observed per priority class.
+
+    A request with a batch moves the heater together with the other heaters
+    of the batch instead of on its own.
+
+    Every request is also handed to the listeners, callbacks taking the
+    heater and the opening.
+    """
+
+    def __init__(self, hass, driver, metrics=None, listeners=()):
+        """Initialize the pipeline."""
+        self.hass = hass
+        self.driver = driver
+        self.heater_entity_id = driver.heater_entity_id
+        self.metrics = metrics
+        self.listeners = listeners
+        self.failures = 0
+        self.consecutive_failures = 0
+        self._desired = None
+        self._desired_priority = PRIORITY_CONTROL
+        self._requested = None
+        self._batch = None
+        self._running = None
+        self._priority = PRIORITY_CONTROL
+        self._worker = None
+        self._hold_until = 0.0
+        self._wake = None
+        self._stopped = False
+
+    @property
+    def busy(self):
+        """Return True if a sequence is running or waiting to run."""
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def sending(self):
+        """Return True while a sequence is being sent."""
+        return self._running is not None
+
+    @property
+    def target(self):
+        """Return the newest opening handed to the pipeline, None if idle."""
+        if self._desired is not None:
+            return self._desired
+        return self._running
+
+    @property
+    def priority(self):
+        """Return the priority class of the sequence being sent or pending."""
+        return self._priority
+
+    @property
+    def health(self):
+        """Return if the heater acknowledges its commands."""
+        if self.consecutive_failures >= QUARANTINE_FAILURES:
+            return HEALTH_QUARANTINED
+        if self.consecutive_failures:
+            return HEALTH_DEGRADED
+        return HEALTH_OK
+
+    @property
+    def statistics(self):
+        """Return the pending opening and the failures of the heater."""
+        return {
+            "opening": self.target,
+            "priority": self._priority if self.busy else None,
+            "health": self.health,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+    @callback
+    def async_request(self, opening, delay=0, batch=None, priority=PRIORITY_CONTROL):
+        """Request the heater to be moved to opening.
+
+        An idle pipeline waits delay seconds before it starts sending, requests
+        arriving meanwhile still replace this one. A request more urgent than
+        the sequence running for another opening preempts it and skips the
+        delay, user and safety requests also skip the backoff. A stopped
+        pipeline ignores all requests.
+        """
+        if self._stopped:
+            return
+        for listener in self.listeners:
+            listener(self.heater_entity_id, opening)
+        if self._desired == opening:
+            # SPZB: the same opening again, the earlier request is the one waiting longer
+            requested = self._requested
+            if outranks(self._desired_priority, priority):
+                priority = self._desired_priority
+        else:
+            requested = self.hass.loop.time()
+            if self._desired is not None:
+                self._async_superseded()
+                if _LOGGER.isEnabledFor(logging.DEBUG):
+                    _LOGGER.debug(
+                        "Superseded pending opening %s for %s",
+                        self._desired,
+                        self.heater_entity_id,
+                    )
+        self._desired = opening
+        self._desired_priority = priority
+        self._requested = requested
+        self._batch = batch
+        if not outranks(PRIORITY_USER, priority):
+            self.async_wake()
+        if not self.busy:
+            self._priority = priority
+            self._worker = self.hass.async_create_task(self._async_worker(delay))
+        elif outranks(priority, self._priority) and self._running != opening:
+            if self.metrics is not None:
+                self.metrics.increment(COUNTER_COMMANDS_PREEMPTED)
+            _LOGGER.debug(
+                "Preempting %s opening %s for %s with %s opening %s",
+                self._priority,
+                self._running,
+                self.heater_entity_id,
+                priority,
+                opening,
+            )
+            self._priority = priority
+            preempted = self._worker
+            preempted.cancel()
+            self._worker = self.hass.async_create_task(
+                self._async_worker(preempted=preempted)
+            )
+
+    @callback
+    def async_wake(self):
+        """End the backoff, e.g. because the heater reported again."""
+        self._hold_until = 0.0
+        if self._wake is not None and not self._wake.done():
+            self._wake.set_result(None)
+
+    async def _async_worker(self, delay=0, preempted=None):
+        """Apply the newest desired opening until nothing is pending."""
+        applied = None
+        if preempted is not None:
+            # SPZB: the preempted sequence stops once its command in flight is sent
+            await asyncio.wait((preempted,))
+        if delay:
+            await asyncio.sleep(delay)
+        while self._desired is not None:
+            await self._async_hold()
+            desired, self._desired = self._desired, None
+            batch, self._batch = self._batch, None
+            priority = self._priority = self._desired_priority
+            requested = self._requested
+            if desired == applied:
+                # SPZB: request flipped back while the last sequence was running
+                self._async_superseded()
+                _LOGGER.debug(
+                    "Dropped opening %s for %s, already applied",
+                    desired,
+                    self.heater_entity_id,
+                )
+                continue
+            self._running = desired
+            try:
+                if batch is not None:
+                    acknowledged = await batch.async_join(self.driver)
+                else:
+                    acknowledged = await self.driver.async_apply(desired)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception(
+                    "Error while sending commands to %s", self.heater_entity_id
+                )
+                acknowledged = False
+            finally:
+                self._running = None
+            self._async_completed(acknowledged, desired, priority, requested)
+            applied = desired if acknowledged else None
+
+    async def _async_hold(self):
+        """Wait for the backoff after failed commands, async_wake ends it."""
+        loop = self.hass.loop
+        while True:
+            remaining = self._hold_until - loop.time()
+            if remaining <= 0:
+                return
+            self._wake = loop.create_future()
+            try:
+                await asyncio.wait_for(self._wake, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._wake = None
+
+    @callback
+    def _async_completed(self, acknowledged, opening, priority, requested):
+        """Count a sequence the heater did not acknowledge as failure.
+
+        A failed opening is retried after the backoff unless a newer request
+        replaced it or the heater is quarantined.
+        """
+        if acknowledged:
+            if self.metrics is not None:
+                self.metrics.observe(
+                    HISTOGRAM_PRIORITY_LATENCY.format(priority),
+                    self.hass.loop.time() - requested,
+                )
+            if self.consecutive_failures >= QUARANTINE_FAILURES:
+                _LOGGER.info("%s acknowledges again", self.heater_entity_id)
+            self.consecutive_failures = 0
+            self._hold_until = 0.0
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_COMMANDS_FAILED)
+        if self.consecutive_failures >= QUARANTINE_FAILURES:
+            backoff = BACKOFF_MAX
+            if self.consecutive_failures == QUARANTINE_FAILURES:
+                if self.metrics is not None:
+                    self.metrics.increment(COUNTER_HEATER_QUARANTINES)
+                _LOGGER.warning(
+                    "%s did not acknowledge %s commands in a row, quarantined",
+                    self.heater_entity_id,
+                    self.consecutive_failures,
+                )
+        else:
+            backoff = min(
+                BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.consecutive_failures - 1)
+            )
+            if self._desired is None:
+                self._desired = opening
+                self._desired_priority = priority
+                self._requested = requested
+        backoff *= 1 - BACKOFF_JITTER * random.random()
+        self._hold_until = self.hass.loop.time() + backoff
+        _LOGGER.debug(
+            "%s did not acknowledge, %s failures in a row, holding back for %.0f seconds",
+            self.heater_entity_id,
+            self.consecutive_failures,
+            backoff,
+        )
+
+    @callback
+    def _async_superseded(self):
+        """Count a command that will not be sent."""
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_COMMANDS_SUPERSEDED)
+
+    async def async_stop(self):
+        """Cancel pending and running commands, later requests are ignored."""
+        self._stopped = True
+        await self._async_cancel()
+
+    async def _async_cancel(self):
+        """Cancel pending and running commands."""
+        self._desired = None
+        self._batch = None
+        if self.busy:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
@@ -0,0 +1,78 @@
+"""Periodic reconciliation of SPZB0001 thermostat units."""
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class HeaterReconciler:
+    """Correct heaters that drifted from the opening their thermostat intends.
+
+    One timer checks all thermostats in a single pass. Thermostats compare
+    the intended opening with their cached heater states and only queue
+    commands for heaters that diverge, so a pass without drift sends nothing.
+    """
+
+    def __init__(self, hass, thermostats, interval):
+        """Initialize the reconciler."""
+        self.hass = hass
+        self.thermostats = thermostats
+        self.interval = interval
+        self.passes = 0
+        self.drifted = 0
+        self.last_drifted = 0
+        self._unsub = None
+
+    @property
+    def statistics(self):
+        """Return the number of passes and drifted heaters."""
+        return {
+            "passes": self.passes,
+            "drifted": self.drifted,
+            "last_drifted": self.last_drifted,
+        }
+
+    @callback
+    def async_start(self):
+        """Start the periodic passes."""
+        if self._unsub is None:
+            self._async_schedule()
+
+    @callback
+    def async_stop(self):
+        """Stop the periodic passes."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def async_set_interval(self, interval):
+        """Change the time between passes, the next pass is planned anew."""
+        if interval == self.interval:
+            return
+        self.interval = interval
+        if self._unsub is not None:
+            self.async_stop()
+            self._async_schedule()
+
+    @callback
+    def _async_schedule(self):
+        """Schedule the next pass."""
+        self._unsub = async_call_later(
+            self.hass, self.interval.total_seconds(), self._async_reconcile
+        )
+
+    @callback
+    def _async_reconcile(self, _):
+        """Let every thermostat correct its drifted heaters."""
+        self._async_schedule()
+        drifted = 0
+        for thermostat in self.thermostats.values():
+            drifted += thermostat.async_reconcile()
+        self.passes += 1
+        self.drifted += drifted
+        self.last_drifted = drifted
+        if drifted:
+            _LOGGER.debug("Reconciled %s drifted heaters", drifted)
@@ -0,0 +1,201 @@
+"""Shared Zigbee airtime scheduler for SPZB0001 thermostat units."""
+import asyncio
+import logging
+
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+
+# SPZB: priority classes of heater commands, most urgent first
+PRIORITY_SAFETY = "safety"
+PRIORITY_USER = "user"
+PRIORITY_CONTROL = "control"
+PRIORITY_RECONCILE = "reconcile"
+PRIORITIES = (PRIORITY_SAFETY, PRIORITY_USER, PRIORITY_CONTROL, PRIORITY_RECONCILE)
+_RANKS = {priority: rank for rank, priority in enumerate(PRIORITIES)}
+
+
+def outranks(priority, other):
+    """Return True if priority is more urgent than other."""
+    return _RANKS[priority] < _RANKS[other]
+
+
+class AirtimeScheduler:
+    """Rate limit heater commands of all SPZB0001 thermostats.
+
+    Commands are released by a token bucket refilled with rate tokens per
+    second up to burst tokens. Waiting commands are released round robin per
+    heater, so a heater with several queued commands cannot starve the others.
+    Commands of a more urgent priority class skip the line, they are released
+    before all commands of less urgent classes. A command for several heaters
+    costs one token per heater, the tokens may run into debt which the
+    following commands wait for.
+    """
+
+    def __init__(self, hass, rate, burst):
+        """Initialize the scheduler."""
+        self.hass = hass
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = hass.loop.time()
+        self._queues = {priority: {} for priority in PRIORITIES}
+        self._costs = {}
+        self._worker = None
+        self._granted = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._stagger_slot = 0.0
+
+    @property
+    def queue_depth(self):
+        """Return the number of commands waiting for airtime."""
+        return sum(
+            len(queue) for queues in self._queues.values() for queue in queues.values()
+        )
+
+    @property
+    def statistics(self):
+        """Return queue depth and wait time statistics."""
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self._max_queue_depth,
+            "commands": self._granted,
+            "average_wait": round(self._total_wait / self._granted, 3)
+            if self._granted
+            else 0.0,
+            "max_wait": round(self._max_wait, 3),
+        }
+
+    @callback
+    def async_configure(self, rate, burst):
+        """Change rate and burst, the tokens earned so far are kept."""
+        self._async_refill()
+        self.rate = rate
+        self.burst = burst
+        self._tokens = min(self._tokens, burst)
+
+    @callback
+    def async_stop(self):
+        """Drop all waiting commands and stop releasing commands."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for queues in self._queues.values():
+            for queue in queues.values():
+                for granted in queue:
+                    # SPZB: the callers waiting for airtime see a cancellation
+                    granted.cancel()
+            queues.clear()
+        self._costs.clear()
+
+    @callback
+    def async_stagger(self, spacing):
+        """Return the delay until the next free slot spacing seconds apart."""
+        now = self.hass.loop.time()
+        self._stagger_slot = max(now, self._stagger_slot + spacing)
+        return self._stagger_slot - now
+
+    async def async_call(
+        self,
+        heater_entity_id,
+        domain,
+        service,
+        data,
+        priority=PRIORITY_CONTROL,
+        cost=1,
+        **kwargs,
+    ):
+        """Wait for airtime and call a service for the heater.
+
+        heater_entity_id is a tuple for a command sent to several heaters.
+        Cancelling while waiting for airtime drops the command. Once it is
+        sent it is completed even if the caller is cancelled, the caller only
+        stops after the service call returned.
+        """
+        await self.async_acquire(heater_entity_id, priority, cost)
+        call = self.hass.async_create_task(
+            self.hass.services.async_call(domain, service, data, **kwargs)
+        )
+        try:
+            await asyncio.shield(call)
+        except asyncio.CancelledError:
+            # SPZB: a preempted sequence stops after the command in flight, the
+            # SPZB: preempting sequence waits for the caller, so it never interleaves
+            await asyncio.wait((call,))
+            if not call.cancelled() and call.exception() is not None:
+                _LOGGER.error(
+                    "Error in the command for %s sent before it was preempted: %s",
+                    heater_entity_id,
+                    call.exception(),
+                )
+            raise
+
+    async def async_acquire(self, heater_entity_id, priority=PRIORITY_CONTROL, cost=1):
+        """Wait until the heater may send the next command."""
+        loop = self.hass.loop
+        granted = loop.create_future()
+        self._costs[granted] = cost
+        queues = self._queues[priority]
+        queue = queues.get(heater_entity_id)
+        if queue is None:
+            queue = queues[heater_entity_id] = []
+        queue.append(granted)
+        self._max_queue_depth = max(self._max_queue_depth, self.queue_depth)
+        if self._worker is None or self._worker.done():
+            self._worker = self.hass.async_create_task(self._async_worker())
+
+        queued = loop.time()
+        try:
+            await granted
+        except asyncio.CancelledError:
+            self._costs.pop(granted, None)
+            self._async_discard(self._queues[priority], heater_entity_id, granted)
+            raise
+        wait = loop.time() - queued
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+
+    @callback
+    def _async_discard(self, queues, heater_entity_id, granted):
+        """Remove a cancelled command from the queues of its priority class."""
+        queue = queues.get(heater_entity_id)
+        if queue and granted in queue:
+            queue.remove(granted)
+            if not queue:
+                del queues[heater_entity_id]
+
+    @callback
+    def _async_refill(self):
+        """Add the tokens earned since the last refill."""
+        now = self.hass.loop.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def _async_worker(self):
+        """Release queued commands while tokens are available."""
+        while any(self._queues.values()):
+            self._async_refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+
+            queues = next(queues for queues in self._queues.values() if queues)
+            # SPZB: round robin, the served heater moves to the end of the line
+            heater_entity_id = next(iter(queues))
+            queue = queues.pop(heater_entity_id)
+            granted = queue.pop(0)
+            if queue:
+                queues[heater_entity_id] = queue
+            cost = self._costs.pop(granted, 1)
+            if granted.done():
+                # SPZB: the command was cancelled while waiting
+                continue
+            self._tokens -= cost
+            self._granted += 1
+            granted.set_result(None)
+            if self._tokens < 1 and any(self._queues.values()):
+                _LOGGER.debug(
+                    "Airtime exhausted, %s commands waiting", self.queue_depth
+                )
@@ -0,0 +1,226 @@
+"""Actuation trace of SPZB0001 thermostat units."""
+import asyncio
+import logging
+import math
+import os
+import struct
+import time
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+_LOGGER = logging.getLogger(__name__)
+
+TRACE_MAGIC = b"SPZBTRC1"
+# SPZB: time in seconds since the epoch, kind, entity index and value of a record
+RECORD = struct.Struct("<dBHf")
+# SPZB: definitions are followed by the length and the UTF-8 bytes of the entity id
+NAME_LENGTH = struct.Struct("<H")
+
+# SPZB: definitions carry the index of the thermostat they belong to as value
+KIND_THERMOSTAT = 0
+KIND_SENSOR = 1
+KIND_HEATER = 2
+DEFINITIONS = (KIND_THERMOSTAT, KIND_SENSOR, KIND_HEATER)
+# SPZB: reading of a sensor
+KIND_READING = 3
+# SPZB: opening a heater reports
+KIND_HEATER_STATE = 4
+# SPZB: target temperature of a thermostat, NaN while it is off
+KIND_TARGET = 5
+# SPZB: opening a thermostat decided for its heaters
+KIND_DECISION = 6
+# SPZB: service call for a heater, the value is its duration in seconds
+KIND_COMMAND = 7
+# SPZB: the latest records of these kinds are repeated at the start of every file
+STATES = (KIND_HEATER_STATE, KIND_TARGET)
+
+DEFAULT_TRACE_SIZE = 10.0
+# SPZB: seconds between writes, records are buffered in memory until then
+FLUSH_INTERVAL = 60
+# SPZB: bytes of buffered records that are written without waiting for FLUSH_INTERVAL
+FLUSH_SIZE = 65536
+
+
+class TraceRecorder:
+    """Record sensor readings, decisions and heater commands to a file.
+
+    Records have a fixed size of RECORD.size bytes and are appended to path.
+    Entities are stored once as definitions and referred to by index. Once
+    the file reaches half of max_size it is moved to path.1, replacing the
+    older one, and a new file is started with all definitions and the latest
+    targets and heater states, so both files together stay within max_size
+    and each of them can be replayed on its own.
+
+    Records are buffered in memory and written in the executor every
+    FLUSH_INTERVAL seconds. Without a path nothing is recorded.
+    """
+
+    def __init__(self, hass):
+        """Initialize the recorder."""
+        self.hass = hass
+        self.path = None
+        self.max_size = 0
+        self.records = 0
+        self._indices = {}
+        self._definitions = []
+        self._states = {}
+        self._buffer = bytearray()
+        self._size = None
+        self._lock = asyncio.Lock()
+        self._unsub = None
+        # SPZB: loop time is monotonic, the offset turns it into wall clock time
+        self._offset = time.time() - hass.loop.time()
+
+    @property
+    def statistics(self):
+        """Return the file and the number of records."""
+        return {"path": self.path, "records": self.records}
+
+    async def async_configure(self, path, max_size):
+        """Record to path, keeping at most max_size bytes, None stops recording."""
+        if path == self.path:
+            self.max_size = max_size
+            return
+        await self.async_stop()
+        self.path = path
+        self.max_size = max_size
+        self._size = None
+        if path is not None:
+            _LOGGER.info("Recording the actuation trace to %s", path)
+            # SPZB: records of this session refer to the definitions made so far
+            self._buffer += b"".join(self._definitions)
+            self._async_schedule()
+
+    async def async_stop(self, *_):
+        """Write the buffered records and stop the periodic writes."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+        await self.async_flush()
+
+    @callback
+    def async_define(self, thermostat_entity_id, sensor_entity_ids, heater_entity_ids):
+        """Define the entities of a thermostat before recording for them."""
+        owner = self._async_define(KIND_THERMOSTAT, thermostat_entity_id, None)
+        for entity_id in sensor_entity_ids:
+            self._async_define(KIND_SENSOR, entity_id, owner)
+        for entity_id in heater_entity_ids:
+            self._async_define(KIND_HEATER, entity_id, owner)
+
+    @callback
+    def _async_define(self, kind, entity_id, owner):
+        """Store the definition of an entity, return its index."""
+        index = self._indices.get(entity_id)
+        if index is None:
+            index = self._indices[entity_id] = len(self._indices)
+        name = entity_id.encode()
+        definition = (
+            RECORD.pack(
+                self._now(), kind, index, index if owner is None else owner
+            )
+            + NAME_LENGTH.pack(len(name))
+            + name
+        )
+        self._definitions.append(definition)
+        if self.path is not None:
+            self._buffer += definition
+        return index
+
+    @callback
+    def async_record(self, kind, entity_id, value):
+        """Record a value of a defined entity."""
+        if self.path is None:
+            return
+        index = self._indices[entity_id]
+        record = RECORD.pack(self._now(), kind, index, value)
+        if kind in STATES:
+            self._states[(kind, index)] = record
+        self._buffer += record
+        self.records += 1
+        if len(self._buffer) >= FLUSH_SIZE:
+            self.hass.async_create_task(self.async_flush())
+
+    def _now(self):
+        """Return the wall clock time of the loop."""
+        return self.hass.loop.time() + self._offset
+
+    async def async_flush(self):
+        """Write the buffered records."""
+        async with self._lock:
+            if not self._buffer or self.path is None:
+                self._buffer.clear()
+                return
+            data, self._buffer = bytes(self._buffer), bytearray()
+            try:
+                await self.hass.async_add_executor_job(
+                    self._write,
+                    data,
+                    b"".join(self._definitions) + b"".join(self._states.values()),
+                )
+            except OSError as ex:
+                _LOGGER.error("Unable to write the actuation trace: %s", ex)
+
+    def _write(self, data, header_records):
+        """Append data to the file, rotating it at half of max_size."""
+        if self._size is None:
+            self._size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        header = b""
+        if self._size and self._size + len(data) > self.max_size / 2:
+            os.replace(self.path, f"{self.path}.1")
+            # SPZB: the definitions and states went with the rotated file, repeat them
+            header = TRACE_MAGIC + header_records
+            self._size = 0
+        elif not self._size:
+            header = TRACE_MAGIC
+        with open(self.path, "ab") as file:
+            file.write(header + data)
+        self._size += len(header) + len(data)
+
+    @callback
+    def _async_schedule(self):
+        """Plan the next periodic write."""
+        self._unsub = async_call_later(self.hass, FLUSH_INTERVAL, self._async_tick)
+
+    async def _async_tick(self, _):
+        """Write the buffered records and plan the next write."""
+        self._async_schedule()
+        await self.async_flush()
+
+
+def read_trace(path):
+    """Yield the records of a trace, starting with the rotated older file.
+
+    Records are (time, kind, entity_id, value). For definitions the value is
+    the entity id of the thermostat the entity belongs to. A record cut off
+    by a crash ends the file it is in.
+    """
+    for file_path in (f"{path}.1", path):
+        if os.path.exists(file_path):
+            with open(file_path, "rb") as file:
+                yield from _read_records(file.read(), file_path)
+
+
+def _read_records(data, file_path):
+    """Yield the records of the content of a single trace file."""
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError(f"{file_path} is no actuation trace")
+    names = {}
+    offset = len(TRACE_MAGIC)
+    while offset + RECORD.size <= len(data):
+        timestamp, kind, index, value = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if kind in DEFINITIONS:
+            if offset + NAME_LENGTH.size > len(data):
+                return
+            (length,) = NAME_LENGTH.unpack_from(data, offset)
+            offset += NAME_LENGTH.size
+            if offset + length > len(data):
+                return
+            names[index] = data[offset : offset + length].decode()
+            offset += length
+            yield timestamp, kind, names[index], names.get(int(value))
+            continue
+        entity_id = names.get(index)
+        if entity_id is not None:
+            yield timestamp, kind, entity_id, None if math.isnan(value) else value
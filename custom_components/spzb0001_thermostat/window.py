@@ -0,0 +1,146 @@
+"""Open window detection for SPZB0001 thermostat units."""
+
+# SPZB: readings kept per sensor, more readings within the span drop the oldest
+SLOPE_READINGS = 32
+# SPZB: a slope needs a few readings spread over half the span, a few noisy
+# SPZB: readings close together can look like any drop
+MIN_SLOPE_READINGS = 3
+MIN_SLOPE_COVERAGE = 0.5
+# SPZB: share of the open slope the drop must fall below before heating resumes
+RESUME_FACTOR = 0.25
+
+
+class TemperatureSlope:
+    """Least squares slope of the readings of one sensor within a time span.
+
+    Readings live in a preallocated ring buffer. The sums of the regression
+    are updated when readings are added or evicted, so every reading costs
+    constant time. They are recomputed from the buffer once per round of the
+    ring to drop the rounding errors the updates collect.
+    """
+
+    def __init__(self, span, size=SLOPE_READINGS):
+        """Initialize the slope."""
+        self.span = span
+        self.size = size
+        self.times = [0.0] * size
+        self.values = [0.0] * size
+        self.count = 0
+        self._head = 0
+        self._origin = 0.0
+        self._sum_t = 0.0
+        self._sum_v = 0.0
+        self._sum_tt = 0.0
+        self._sum_tv = 0.0
+
+    def push(self, time, value):
+        """Add a reading, evicting the readings that left the span."""
+        self.evict(time - self.span)
+        if self.count == self.size:
+            self._remove((self._head - self.count) % self.size)
+        head = self._head
+        self.times[head] = time
+        self.values[head] = value
+        self._head = (head + 1) % self.size
+        self._add(head)
+        if self._head == 0:
+            self._recompute()
+
+    def evict(self, before):
+        """Drop the readings older than before."""
+        while self.count and self.times[(self._head - self.count) % self.size] < before:
+            self._remove((self._head - self.count) % self.size)
+
+    def slope(self, now):
+        """Return the slope in degrees per hour, None without enough readings."""
+        self.evict(now - self.span)
+        if self.count < MIN_SLOPE_READINGS:
+            return None
+        newest = self.times[(self._head - 1) % self.size]
+        oldest = self.times[(self._head - self.count) % self.size]
+        if newest - oldest < self.span * MIN_SLOPE_COVERAGE:
+            return None
+        denominator = self.count * self._sum_tt - self._sum_t * self._sum_t
+        if denominator <= 0:
+            return None
+        return (
+            (self.count * self._sum_tv - self._sum_t * self._sum_v) / denominator * 3600
+        )
+
+    def _add(self, index):
+        """Add the reading at index to the sums."""
+        if not self.count:
+            # SPZB: times relative to the oldest reading keep the sums small
+            self._origin = self.times[index]
+        time = self.times[index] - self._origin
+        value = self.values[index]
+        self.count += 1
+        self._sum_t += time
+        self._sum_v += value
+        self._sum_tt += time * time
+        self._sum_tv += time * value
+
+    def _remove(self, index):
+        """Remove the oldest reading at index from the sums."""
+        time = self.times[index] - self._origin
+        value = self.values[index]
+        self.count -= 1
+        if not self.count:
+            self._sum_t = self._sum_v = self._sum_tt = self._sum_tv = 0.0
+            return
+        self._sum_t -= time
+        self._sum_v -= value
+        self._sum_tt -= time * time
+        self._sum_tv -= time * value
+
+    def _recompute(self):
+        """Compute the sums from the buffered readings again."""
+        count, self.count = self.count, 0
+        self._sum_t = self._sum_v = self._sum_tt = self._sum_tv = 0.0
+        tail = (self._head - count) % self.size
+        for offset in range(count):
+            self._add((tail + offset) % self.size)
+
+
+class WindowDetector:
+    """Detect an open window from the temperature slopes of the sensors.
+
+    A window is open as soon as the temperature of any sensor drops faster
+    than open_slope degrees per hour. It is closed again once no sensor drops
+    faster than a quarter of that, or no sensor has enough recent readings
+    for a slope.
+    """
+
+    def __init__(self, sensor_entity_ids, span, open_slope):
+        """Initialize the detector."""
+        self.span = span
+        self.open_slope = open_slope
+        self.slopes = {
+            entity_id: TemperatureSlope(span) for entity_id in sensor_entity_ids
+        }
+        self.is_open = False
+
+    def configure(self, span, open_slope):
+        """Change the options, the readings and is_open are kept."""
+        self.span = span
+        self.open_slope = open_slope
+        for slope in self.slopes.values():
+            slope.span = span
+
+    def push(self, entity_id, time, value):
+        """Add a reading of a sensor."""
+        self.slopes[entity_id].push(time, value)
+
+    def update(self, now):
+        """Update is_open, return True if it changed."""
+        threshold = -self.open_slope * (RESUME_FACTOR if self.is_open else 1.0)
+        dropping = False
+        for slope in self.slopes.values():
+            value = slope.slope(now)
+            if value is not None and value <= threshold:
+                dropping = True
+                break
+        if dropping == self.is_open:
+            return False
+        self.is_open = dropping
+        return True
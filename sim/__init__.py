@@ -0,0 +1,7 @@
+"""Offline simulation harness for the spzb0001_thermostat integration.
+
+Runs the integration against simulated EUROTRONIC SPZB0001 thermostats, rooms
+and temperature sensors on a virtual clock, so hours of heating run in
+seconds without Home Assistant being configured or any hardware attached.
+Only the homeassistant package has to be installed.
+"""
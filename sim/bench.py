@@ -0,0 +1,106 @@
+"""Benchmarks of the spzb0001_thermostat integration.
+
+Run from the repository root with ``python -m sim.bench``.
+"""
+import argparse
+import json
+import logging
+import time
+
+from . import clock
+from .simulation import Simulation
+
+ZONE_COUNTS = (1, 10, 100)
+
+
+async def async_bench_control(zones, hours, seed, config, options):
+    """Simulate a house and report latency and command statistics."""
+    simulation = Simulation(
+        zones=zones,
+        seed=seed,
+        config=config,
+        trv_options={"drop_rate": 0.02},
+        **options,
+    )
+    await simulation.async_setup()
+    started = time.perf_counter()
+    await simulation.async_run(hours * 3600)
+    result = simulation.report()
+    result["wall_seconds"] = round(time.perf_counter() - started, 2)
+    await simulation.async_stop()
+    return result
+
+
+async def async_bench_events(zones, events, seed, config, options):
+    """Report how many sensor events per second the thermostats process."""
+    simulation = Simulation(zones=zones, seed=seed, config=config, **options)
+    await simulation.async_setup()
+    hass = simulation.hass
+    started = time.perf_counter()
+    for index in range(events):
+        # SPZB: alternate far enough to pass the precision filter every time
+        reading = "17.0" if index % 2 else "23.0"
+        for room in simulation.rooms:
+            for sensor_entity_id in room.sensor_entity_ids:
+                hass.states.async_set(sensor_entity_id, reading)
+        await hass.async_block_till_done()
+    elapsed = time.perf_counter() - started
+    await simulation.async_stop()
+    return {
+        "zones": zones,
+        "events": events * zones,
+        "events_per_second": round(events * zones / elapsed, 1),
+    }
+
+
+async def async_main(args):
+    """Run all benchmarks."""
+    results = {"control": [], "events": []}
+    config = {
+        "control_mode": args.control_mode,
+        "sensor_aggregate": args.sensor_aggregate,
+        "sensor_window": args.sensor_window,
+    }
+    if args.open_window_slope is not None:
+        config["open_window_slope"] = args.open_window_slope
+    options = {
+        "valves": args.valves,
+        "heaters_per_zone": args.heaters,
+        "sensors_per_zone": args.sensors,
+    }
+    for zones in args.zones:
+        results["control"].append(
+            await async_bench_control(zones, args.hours, args.seed, config, options)
+        )
+        results["events"].append(
+            await async_bench_events(zones, args.events, args.seed, config, options)
+        )
+    return results
+
+
+def main():
+    """Parse the arguments, run the benchmarks and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--zones", type=int, nargs="+", default=list(ZONE_COUNTS))
+    parser.add_argument("--hours", type=float, default=12.0)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--control-mode", choices=["hysteresis", "tpi"], default="hysteresis"
+    )
+    parser.add_argument("--valves", action="store_true")
+    parser.add_argument("--heaters", type=int, default=1)
+    parser.add_argument("--sensors", type=int, default=1)
+    parser.add_argument(
+        "--sensor-aggregate", choices=["mean", "median", "ema"], default="mean"
+    )
+    parser.add_argument("--sensor-window", type=int, default=1)
+    parser.add_argument("--open-window-slope", type=float)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+    print(json.dumps(clock.run(async_main(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Virtual clock event loop."""
+import asyncio
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps to the next timer instead of waiting.
+
+    While executor jobs are running the loop waits for them in real time
+    without advancing the virtual clock, so their results arrive before any
+    timer scheduled after them fires.
+    """
+
+    def __init__(self, start=0.0):
+        """Initialize the event loop."""
+        super().__init__()
+        self._virtual_time = start
+        self._executor_jobs = 0
+        select = self._selector.select
+
+        def _select(timeout=None):
+            if self._executor_jobs:
+                return select(timeout)
+            events = select(0)
+            if not events and timeout:
+                self._virtual_time += timeout
+            return events
+
+        self._selector.select = _select
+
+    def time(self):
+        """Return the virtual time."""
+        return self._virtual_time
+
+    def run_in_executor(self, executor, func, *args):
+        """Run func in the executor and keep the clock still until it is done."""
+        future = super().run_in_executor(executor, func, *args)
+        self._executor_jobs += 1
+        future.add_done_callback(self._executor_job_done)
+        return future
+
+    def _executor_job_done(self, _):
+        """Count a finished executor job."""
+        self._executor_jobs -= 1
+
+
+def run(main):
+    """Run the coroutine main on a virtual clock and return its result."""
+    loop = VirtualClockEventLoop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,287 @@
+"""Simulated rooms, sensors and EUROTRONIC SPZB0001 thermostats."""
+import logging
+
+from homeassistant.components.climate.const import (
+    ATTR_HVAC_MODE,
+    HVAC_MODE_AUTO,
+    HVAC_MODE_HEAT,
+    HVAC_MODE_OFF,
+)
+from homeassistant.const import ATTR_ENTITY_ID, ATTR_TEMPERATURE, SERVICE_TURN_OFF
+from homeassistant.core import DOMAIN as HA_DOMAIN, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+CLIMATE_DOMAIN = "climate"
+NUMBER_DOMAIN = "number"
+MIN_TEMP = 5.0
+MAX_TEMP = 30.0
+MAX_POSITION = 255
+
+
+class SimulatedTRV:
+    """EUROTRONIC SPZB0001 thermostat as deCONZ exposes it.
+
+    Commands arrive after a random radio latency or get lost with drop_rate.
+    The thermostat leaves HVAC_MODE_HEAT for HVAC_MODE_AUTO on its own after
+    drift_after seconds, like the real device does. With valve_entity_id the
+    valve position is set by the host through that number entity (0 to 255)
+    instead of by the HVAC mode and setpoint.
+    """
+
+    def __init__(
+        self,
+        hass,
+        entity_id,
+        rng,
+        latency=(0.5, 3.0),
+        drop_rate=0.0,
+        drift_after=600.0,
+        hvac_mode=HVAC_MODE_OFF,
+        setpoint=MIN_TEMP,
+        valve_entity_id=None,
+    ):
+        """Initialize the thermostat."""
+        self.hass = hass
+        self.entity_id = entity_id
+        self.rng = rng
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.drift_after = drift_after
+        self.hvac_mode = hvac_mode
+        self.setpoint = setpoint
+        self.valve_entity_id = valve_entity_id
+        self.position = 0
+        self.local_temp = None
+        self.commands = 0
+        self.dropped = 0
+        self.on_change = None
+        self._drift = None
+        self.async_write_state()
+
+    @property
+    def active(self):
+        """Return True if the integration considers the heater on."""
+        if self.valve_entity_id is not None:
+            return self.position > 0
+        if self.hvac_mode == HVAC_MODE_AUTO:
+            return self.setpoint != MIN_TEMP
+        return self.hvac_mode == HVAC_MODE_HEAT
+
+    @property
+    def opening(self):
+        """Return the opening as the integration sees it."""
+        if self.valve_entity_id is not None:
+            return round(self.position / MAX_POSITION, 2)
+        return 1.0 if self.active else 0.0
+
+    def valve(self, room_temp):
+        """Return the valve opening between 0 and 1."""
+        if self.valve_entity_id is not None:
+            return self.position / MAX_POSITION
+        if self.hvac_mode == HVAC_MODE_HEAT:
+            return 1.0
+        if self.hvac_mode == HVAC_MODE_AUTO and self.setpoint > room_temp:
+            return 1.0
+        return 0.0
+
+    @callback
+    def async_write_state(self, context=None):
+        """Publish the thermostat state."""
+        self.hass.states.async_set(
+            self.entity_id,
+            self.hvac_mode,
+            {
+                ATTR_TEMPERATURE: self.setpoint,
+                "current_temperature": self.local_temp,
+                "hvac_modes": [HVAC_MODE_OFF, HVAC_MODE_AUTO, HVAC_MODE_HEAT],
+                "min_temp": MIN_TEMP,
+                "max_temp": MAX_TEMP,
+            },
+            context=context,
+        )
+        if self.valve_entity_id is not None:
+            self.hass.states.async_set(
+                self.valve_entity_id,
+                self.position,
+                {"min": 0, "max": MAX_POSITION, "step": 1},
+                context=context,
+            )
+        if self.on_change is not None:
+            self.on_change(self)
+
+    @callback
+    def async_command(self, hvac_mode=None, setpoint=None, position=None, context=None):
+        """Receive a command over the air."""
+        self.commands += 1
+        if self.rng.random() < self.drop_rate:
+            self.dropped += 1
+            return
+        self.hass.loop.call_later(
+            self.rng.uniform(*self.latency),
+            self._async_apply,
+            hvac_mode,
+            setpoint,
+            position,
+            context,
+        )
+
+    @callback
+    def _async_apply(self, hvac_mode, setpoint, position, context):
+        """Apply a command that reached the thermostat."""
+        if hvac_mode is not None:
+            self.async_set_hvac_mode(hvac_mode)
+        if setpoint is not None:
+            self.setpoint = setpoint
+        if position is not None:
+            self.position = position
+        self.async_write_state(context)
+
+    @callback
+    def async_set_hvac_mode(self, hvac_mode):
+        """Change the mode, e.g. by hand at the device."""
+        self.hvac_mode = hvac_mode
+        if self._drift is not None:
+            self._drift.cancel()
+            self._drift = None
+        if hvac_mode == HVAC_MODE_HEAT and self.drift_after is not None:
+            self._drift = self.hass.loop.call_later(self.drift_after, self._async_drift)
+
+    @callback
+    def _async_drift(self):
+        """Fall back from heat to auto like the real thermostat."""
+        self._drift = None
+        self.hvac_mode = HVAC_MODE_AUTO
+        self.async_write_state()
+
+
+class TRVFleet:
+    """Route climate service calls to the simulated thermostats."""
+
+    def __init__(self, hass):
+        """Initialize the fleet."""
+        self.hass = hass
+        self.trvs = {}
+        self._valves = {}
+
+    def add(self, trv):
+        """Add a thermostat."""
+        self.trvs[trv.entity_id] = trv
+        if trv.valve_entity_id is not None:
+            self._valves[trv.valve_entity_id] = trv
+
+    @property
+    def commands(self):
+        """Return the number of commands sent to all thermostats."""
+        return sum(trv.commands for trv in self.trvs.values())
+
+    @property
+    def dropped(self):
+        """Return the number of commands lost on the way."""
+        return sum(trv.dropped for trv in self.trvs.values())
+
+    @callback
+    def async_register_services(self):
+        """Register the services the integration calls."""
+        self.hass.services.async_register(
+            CLIMATE_DOMAIN, "set_hvac_mode", self._async_set_hvac_mode
+        )
+        self.hass.services.async_register(
+            CLIMATE_DOMAIN, "set_temperature", self._async_set_temperature
+        )
+        self.hass.services.async_register(
+            NUMBER_DOMAIN, "set_value", self._async_set_value
+        )
+        self.hass.services.async_register(
+            CLIMATE_DOMAIN, SERVICE_TURN_OFF, self._async_turn_off
+        )
+        self.hass.services.async_register(
+            HA_DOMAIN, SERVICE_TURN_OFF, self._async_turn_off
+        )
+
+    def _targets(self, call):
+        """Return the thermostats a service call is for."""
+        entity_ids = call.data[ATTR_ENTITY_ID]
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        return [self.trvs[entity_id] for entity_id in entity_ids]
+
+    async def _async_set_hvac_mode(self, call):
+        """Handle climate.set_hvac_mode."""
+        for trv in self._targets(call):
+            trv.async_command(
+                hvac_mode=call.data[ATTR_HVAC_MODE], context=call.context
+            )
+
+    async def _async_set_temperature(self, call):
+        """Handle climate.set_temperature."""
+        for trv in self._targets(call):
+            trv.async_command(
+                setpoint=call.data[ATTR_TEMPERATURE], context=call.context
+            )
+
+    async def _async_set_value(self, call):
+        """Handle number.set_value for the valve positions."""
+        entity_ids = call.data[ATTR_ENTITY_ID]
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        for entity_id in entity_ids:
+            self._valves[entity_id].async_command(
+                position=int(call.data["value"]), context=call.context
+            )
+
+    async def _async_turn_off(self, call):
+        """Handle climate.turn_off and homeassistant.turn_off."""
+        for trv in self._targets(call):
+            trv.async_command(hvac_mode=HVAC_MODE_OFF, context=call.context)
+
+
+class SimulatedRoom:
+    """Room heated by one or more thermostats and measured by one or more sensors.
+
+    The temperature rises by heat_rate degrees per hour with all valves fully
+    open and loses loss_rate of the difference to outdoor per hour. Every
+    sensor reports with its own noise.
+    """
+
+    def __init__(
+        self,
+        hass,
+        sensor_entity_ids,
+        trvs,
+        rng,
+        temperature=18.0,
+        outdoor=5.0,
+        heat_rate=3.0,
+        loss_rate=0.15,
+        noise=0.05,
+    ):
+        """Initialize the room."""
+        self.hass = hass
+        self.sensor_entity_ids = sensor_entity_ids
+        self.trvs = trvs
+        self.rng = rng
+        self.temperature = temperature
+        self.outdoor = outdoor
+        self.heat_rate = heat_rate
+        self.loss_rate = loss_rate
+        self.noise = noise
+
+    @callback
+    def async_step(self, seconds):
+        """Advance the room temperature."""
+        hours = seconds / 3600
+        valve = sum(trv.valve(self.temperature) for trv in self.trvs) / len(self.trvs)
+        self.temperature += (
+            valve * self.heat_rate
+            - self.loss_rate * (self.temperature - self.outdoor)
+        ) * hours
+        for trv in self.trvs:
+            trv.local_temp = round(self.temperature, 1)
+
+    @callback
+    def async_report(self):
+        """Publish a reading of every sensor."""
+        for sensor_entity_id in self.sensor_entity_ids:
+            reading = self.temperature + self.rng.gauss(0, self.noise)
+            self.hass.states.async_set(sensor_entity_id, f"{reading:.1f}")
@@ -0,0 +1,37 @@
+"""Stand-in Home Assistant instance for the simulation."""
+import logging
+
+from homeassistant import config_entries
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import (
+    area_registry as ar,
+    device_registry as dr,
+    entity,
+    entity_registry as er,
+    restore_state as rs,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_create_hass(config_dir):
+    """Return a running Home Assistant core without any integration set up.
+
+    Only the state machine, service registry, event bus and the registries
+    entities need are available, nothing is read from configuration.yaml.
+    """
+    try:
+        hass = HomeAssistant(config_dir)
+    except TypeError:
+        # Home Assistant before 2024.2 sets the config dir afterwards
+        hass = HomeAssistant()
+    hass.config.config_dir = config_dir
+    hass.config.skip_pip = True
+    hass.config_entries = config_entries.ConfigEntries(hass, {})
+    entity.async_setup(hass)
+    await ar.async_load(hass)
+    await dr.async_load(hass)
+    await er.async_load(hass)
+    await rs.async_load(hass)
+    await hass.async_start()
+    return hass
@@ -0,0 +1,353 @@
+"""Replay of recorded actuation traces against the spzb0001_thermostat integration.
+
+Run from the repository root with ``python -m sim.replay <trace_file>``.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import tempfile
+import time
+
+from homeassistant.components.climate.const import HVAC_MODE_HEAT, HVAC_MODE_OFF
+from homeassistant.const import CONF_NAME
+import yaml
+
+from custom_components.spzb0001_thermostat import climate
+from custom_components.spzb0001_thermostat.model import ThermalModel
+from custom_components.spzb0001_thermostat.trace import (
+    KIND_COMMAND,
+    KIND_DECISION,
+    KIND_HEATER,
+    KIND_HEATER_STATE,
+    KIND_READING,
+    KIND_SENSOR,
+    KIND_TARGET,
+    KIND_THERMOSTAT,
+    read_trace,
+)
+
+from . import clock
+from .devices import SimulatedTRV, TRVFleet
+from .hass import async_create_hass
+from .simulation import Simulation
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RecordedZone:
+    """Thermostat of a trace with its sensors and heaters."""
+
+    def __init__(self, entity_id):
+        """Initialize the zone."""
+        self.entity_id = entity_id
+        self.sensor_entity_ids = []
+        self.heater_entity_ids = []
+        self.readings = {}
+        self.openings = {}
+        self.target = None
+        self.thermostat = None
+        self.gain = 0.0
+        self.offset = 0.0
+
+    @property
+    def temperature(self):
+        """Return the mean of the latest recorded readings."""
+        if not self.readings:
+            return None
+        return statistics.mean(self.readings.values())
+
+    @property
+    def opening(self):
+        """Return the mean of the latest recorded heater openings."""
+        if not self.openings:
+            return 0.0
+        return statistics.mean(self.openings.values())
+
+
+class TraceReplay(Simulation):
+    """Run a recorded trace through the thermostats with other options.
+
+    The recorded readings are fed to the thermostats on the virtual clock and
+    their commands go to simulated thermostats. The room does not follow the
+    replayed heaters by itself: a thermal model learned from the trace gives
+    the difference between heating and not heating, and every reading is
+    shifted by the heat the replayed heaters added or saved compared to the
+    recorded ones. Recorded and replayed commands, actuations, latencies and
+    comfort errors are reported side by side.
+    """
+
+    def __init__(self, path, config=None, trv_options=None, step=10.0, valves=False):
+        """Initialize the replay."""
+        super().__init__(config=config, trv_options=trv_options, step=step, valves=valves)
+        self.path = path
+        self.records = []
+        self.recorded = {
+            "commands": 0,
+            "actuations": 0,
+            "latencies": [],
+            "comfort_error": 0.0,
+        }
+        self._zones = {}
+        self._owners = {}
+        self._decisions = {}
+        self._pending = {}
+
+    def load(self):
+        """Read the trace and learn the thermal model of every zone."""
+        models = {}
+        for record in read_trace(self.path):
+            timestamp, kind, entity_id, value = record
+            if kind == KIND_THERMOSTAT:
+                self._zones.setdefault(entity_id, RecordedZone(entity_id))
+                models.setdefault(entity_id, ThermalModel())
+                continue
+            if kind in (KIND_SENSOR, KIND_HEATER):
+                zone = self._zones[value]
+                entity_ids = (
+                    zone.sensor_entity_ids
+                    if kind == KIND_SENSOR
+                    else zone.heater_entity_ids
+                )
+                if entity_id not in entity_ids:
+                    entity_ids.append(entity_id)
+                self._owners[entity_id] = zone
+                continue
+            self.records.append(record)
+            zone = self._owners.get(entity_id) or self._zones.get(entity_id)
+            if kind == KIND_READING:
+                zone.readings[entity_id] = value
+                models[zone.entity_id].observe(
+                    timestamp, zone.temperature, zone.opening > 0
+                )
+            elif kind == KIND_HEATER_STATE:
+                zone.openings[entity_id] = value
+        for entity_id, zone in self._zones.items():
+            model = models[entity_id]
+            if model.heating_rate is None or model.cooling_rate is None:
+                _LOGGER.warning(
+                    "No thermal model learned for %s, readings are replayed unchanged",
+                    entity_id,
+                )
+            else:
+                zone.gain = model.heating_rate - model.cooling_rate
+            zone.readings.clear()
+            zone.openings.clear()
+        self.zones = len(self._zones)
+
+    async def async_setup(self):
+        """Create hass, the simulated thermostats and the thermostat entities."""
+        self._tempdir = tempfile.TemporaryDirectory()
+        self.hass = hass = await async_create_hass(self._tempdir.name)
+        self.fleet = TRVFleet(hass)
+        self.fleet.async_register_services()
+
+        targets = {}
+        readings = {}
+        for _, kind, entity_id, value in self.records:
+            if kind == KIND_READING:
+                readings.setdefault(entity_id, value)
+            elif kind == KIND_TARGET:
+                targets.setdefault(entity_id, value)
+        # SPZB: the thermostats start with the first recorded readings
+        for entity_id, value in readings.items():
+            hass.states.async_set(entity_id, round(value, 2))
+
+        zones = []
+        for zone in self._zones.values():
+            trvs = []
+            for heater_entity_id in zone.heater_entity_ids:
+                object_id = heater_entity_id.split(".", 1)[1]
+                trv = SimulatedTRV(
+                    hass,
+                    heater_entity_id,
+                    self.rng,
+                    valve_entity_id=f"number.{object_id}_valve" if self.valves else None,
+                    **self.trv_options,
+                )
+                trv.on_change = self._async_trv_changed
+                self.fleet.add(trv)
+                trvs.append(trv)
+            target = targets.get(zone.entity_id)
+            config = {
+                CONF_NAME: zone.entity_id.split(".", 1)[1],
+                climate.CONF_HEATER: zone.heater_entity_ids,
+                climate.CONF_SENSOR: zone.sensor_entity_ids,
+                climate.CONF_INITIAL_HVAC_MODE: HVAC_MODE_OFF
+                if target is None
+                else HVAC_MODE_HEAT,
+            }
+            if target is not None:
+                config[climate.CONF_TARGET_TEMP] = target
+            if self.valves:
+                config[climate.CONF_VALVE] = [trv.valve_entity_id for trv in trvs]
+            zones.append(config)
+        await self._async_add_thermostats(zones)
+        for zone, thermostat in zip(self._zones.values(), self.thermostats):
+            zone.thermostat = thermostat
+
+    async def async_replay(self):
+        """Feed the recorded records to the thermostats on the virtual clock."""
+        if not self.records:
+            return
+        loop = self.hass.loop
+        started = loop.time()
+        first = self.records[0][0]
+        self._timers.append(loop.call_later(self.step, self._async_step))
+        for timestamp, kind, entity_id, value in self.records:
+            delay = timestamp - first - (loop.time() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._async_apply(timestamp, kind, entity_id, value)
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        await self.hass.async_block_till_done()
+
+    async def _async_apply(self, timestamp, kind, entity_id, value):
+        """Apply a single record."""
+        if kind == KIND_READING:
+            zone = self._owners[entity_id]
+            zone.readings[entity_id] = value
+            self.hass.states.async_set(entity_id, round(value + zone.offset, 2))
+        elif kind == KIND_HEATER_STATE:
+            self._owners[entity_id].openings[entity_id] = value
+            pending = self._pending.get(entity_id)
+            if pending is not None and pending[1] == value:
+                self.recorded["latencies"].append(timestamp - pending[0])
+                del self._pending[entity_id]
+        elif kind == KIND_COMMAND:
+            self.recorded["commands"] += 1
+        elif kind == KIND_DECISION:
+            if self._decisions.get(entity_id) != value:
+                self._decisions[entity_id] = value
+                self.recorded["actuations"] += 1
+                for heater_entity_id in self._zones[entity_id].heater_entity_ids:
+                    self._pending[heater_entity_id] = (timestamp, value)
+        elif kind == KIND_TARGET:
+            self._zones[entity_id].target = value
+            await self._async_set_target(self._zones[entity_id], value)
+
+    async def _async_set_target(self, zone, target):
+        """Give the replayed thermostat the recorded target temperature."""
+        thermostat = zone.thermostat
+        if target is None:
+            if thermostat.hvac_mode != HVAC_MODE_OFF:
+                await thermostat.async_set_hvac_mode(HVAC_MODE_OFF)
+            return
+        if thermostat.target_temperature != target:
+            await thermostat.async_set_temperature(temperature=target)
+        if thermostat.hvac_mode != HVAC_MODE_HEAT:
+            await thermostat.async_set_hvac_mode(HVAC_MODE_HEAT)
+
+    def _async_step(self):
+        """Shift the zones by the heat of the replayed heaters."""
+        self.simulated += self.step
+        hours = self.step / 3600
+        for zone in self._zones.values():
+            temperature = zone.temperature
+            if temperature is None:
+                continue
+            replayed = statistics.mean(
+                self.fleet.trvs[heater_entity_id].valve(temperature + zone.offset)
+                for heater_entity_id in zone.heater_entity_ids
+            )
+            zone.offset += (replayed - zone.opening) * zone.gain * hours
+            if zone.target is not None:
+                self.recorded["comfort_error"] += abs(zone.target - temperature) * hours
+                self.comfort_error += (
+                    abs(zone.target - temperature - zone.offset) * hours
+                )
+        self._timers.append(self.hass.loop.call_later(self.step, self._async_step))
+
+    def report(self):
+        """Return the recorded and the replayed results."""
+        hours = self.simulated / 3600 or 1
+        zones = self.zones or 1
+        return {
+            "zones": self.zones,
+            "replayed_hours": round(self.simulated / 3600, 2),
+            "recorded": {
+                "commands": self.recorded["commands"],
+                "actuations": self.recorded["actuations"],
+                **_latency(self.recorded["latencies"]),
+                "comfort_error": round(self.recorded["comfort_error"] / hours / zones, 3),
+            },
+            "replayed": {
+                "commands": self.fleet.commands,
+                "actuations": len(self.latencies),
+                **_latency(self.latencies),
+                "comfort_error": round(self.comfort_error / hours / zones, 3),
+            },
+        }
+
+
+def _latency(latencies):
+    """Return mean and 95th percentile of latencies."""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"latency_mean": None, "latency_p95": None}
+    return {
+        "latency_mean": round(statistics.mean(latencies), 2),
+        "latency_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+
+
+async def async_main(args):
+    """Replay the trace with the given options."""
+    config = {
+        "control_mode": args.control_mode,
+        "sensor_aggregate": args.sensor_aggregate,
+        "sensor_window": args.sensor_window,
+    }
+    if args.open_window_slope is not None:
+        config["open_window_slope"] = args.open_window_slope
+    for option in args.set:
+        key, _, value = option.partition("=")
+        config[key] = yaml.safe_load(value)
+    replay = TraceReplay(
+        args.trace_file,
+        config=config,
+        trv_options={"drop_rate": args.drop_rate},
+        valves=args.valves,
+    )
+    replay.load()
+    await replay.async_setup()
+    started = time.perf_counter()
+    await replay.async_replay()
+    result = replay.report()
+    result["wall_seconds"] = round(time.perf_counter() - started, 2)
+    await replay.async_stop()
+    return result
+
+
+def main():
+    """Parse the arguments, replay the trace and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace_file")
+    parser.add_argument(
+        "--control-mode", choices=["hysteresis", "tpi"], default="hysteresis"
+    )
+    parser.add_argument("--valves", action="store_true")
+    parser.add_argument(
+        "--sensor-aggregate", choices=["mean", "median", "ema"], default="mean"
+    )
+    parser.add_argument("--sensor-window", type=int, default=1)
+    parser.add_argument("--open-window-slope", type=float)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="OPTION=VALUE",
+        help="any other thermostat option, e.g. hot_tolerance=0.3",
+    )
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+    print(json.dumps(clock.run(async_main(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
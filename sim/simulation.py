@@ -0,0 +1,211 @@
+"""Simulation of a house heated by spzb0001_thermostat zones."""
+import asyncio
+from datetime import timedelta
+import logging
+import random
+import statistics
+import tempfile
+
+from homeassistant.const import CONF_NAME, CONF_PLATFORM
+from homeassistant.helpers.entity_platform import EntityPlatform, current_platform
+
+from custom_components.spzb0001_thermostat import DOMAIN, climate
+
+from .devices import SimulatedRoom, SimulatedTRV, TRVFleet
+from .hass import async_create_hass
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Simulation:
+    """Run zones of the integration against simulated hardware.
+
+    Every zone has a room with sensors_per_zone temperature sensors and
+    heaters_per_zone SPZB0001 thermostats. With valves the thermostats are driven by their valve position entity.
+    Latency is measured from the moment a thermostat entity hands an opening
+    to its command pipeline until the simulated device reports that opening.
+    """
+
+    def __init__(
+        self,
+        zones=1,
+        seed=0,
+        config=None,
+        trv_options=None,
+        room_options=None,
+        sensor_interval=60.0,
+        step=10.0,
+        valves=False,
+        heaters_per_zone=1,
+        sensors_per_zone=1,
+    ):
+        """Initialize the simulation."""
+        self.zones = zones
+        self.rng = random.Random(seed)
+        self.config = config or {}
+        self.trv_options = trv_options or {}
+        self.room_options = room_options or {}
+        self.sensor_interval = sensor_interval
+        self.step = step
+        self.valves = valves
+        self.heaters_per_zone = heaters_per_zone
+        self.sensors_per_zone = sensors_per_zone
+        self.hass = None
+        self.fleet = None
+        self.rooms = []
+        self.thermostats = []
+        self.latencies = []
+        self.degree_hours = 0.0
+        self.comfort_error = 0.0
+        self.simulated = 0.0
+        self._requested = {}
+        self._tempdir = None
+        self._timers = []
+
+    async def async_setup(self):
+        """Create hass, the simulated devices and the thermostat entities."""
+        self._tempdir = tempfile.TemporaryDirectory()
+        self.hass = hass = await async_create_hass(self._tempdir.name)
+        self.fleet = TRVFleet(hass)
+        self.fleet.async_register_services()
+
+        zones = []
+        for index in range(self.zones):
+            trvs = []
+            for heater in range(self.heaters_per_zone):
+                name = f"trv_{index}" if heater == 0 else f"trv_{index}_{heater}"
+                trv = SimulatedTRV(
+                    hass,
+                    f"climate.{name}",
+                    self.rng,
+                    valve_entity_id=f"number.{name}_valve" if self.valves else None,
+                    **self.trv_options,
+                )
+                trv.on_change = self._async_trv_changed
+                self.fleet.add(trv)
+                trvs.append(trv)
+            room = SimulatedRoom(
+                hass,
+                [
+                    f"sensor.room_{index}_temperature"
+                    if sensor == 0
+                    else f"sensor.room_{index}_temperature_{sensor}"
+                    for sensor in range(self.sensors_per_zone)
+                ],
+                trvs,
+                self.rng,
+                **{"temperature": self.rng.uniform(16.0, 19.0), **self.room_options},
+            )
+            room.async_step(0)
+            room.async_report()
+            self.rooms.append(room)
+            zone = {
+                CONF_NAME: f"room_{index}",
+                climate.CONF_HEATER: [trv.entity_id for trv in trvs],
+                climate.CONF_SENSOR: room.sensor_entity_ids,
+            }
+            if self.valves:
+                zone[climate.CONF_VALVE] = [trv.valve_entity_id for trv in trvs]
+            zones.append(zone)
+        await self._async_add_thermostats(zones)
+
+    async def _async_add_thermostats(self, zones):
+        """Set up the platform with a thermostat for every zone."""
+        hass = self.hass
+        config = climate.PLATFORM_SCHEMA(
+            {
+                CONF_PLATFORM: DOMAIN,
+                climate.CONF_TARGET_TEMP: 20.0,
+                climate.CONF_INITIAL_HVAC_MODE: "heat",
+                **self.config,
+                climate.CONF_ZONES: zones,
+            }
+        )
+        platform = EntityPlatform(
+            hass=hass,
+            logger=_LOGGER,
+            domain="climate",
+            platform_name=DOMAIN,
+            platform=None,
+            scan_interval=timedelta(seconds=30),
+            entity_namespace=None,
+        )
+        # SPZB: like Home Assistant, set up the platform with its entity platform as the current one
+        current_platform.set(platform)
+        await climate.async_setup_platform(hass, config, self.thermostats.extend)
+        # SPZB: listen before the entities are added, they request openings on startup
+        hass.data[DOMAIN][climate.DATA_REQUEST_LISTENERS].append(self._async_requested)
+        await platform.async_add_entities(self.thermostats)
+        await hass.async_block_till_done()
+
+    def _async_requested(self, heater_entity_id, opening):
+        """Record when a thermostat requests a heater opening."""
+        pending = self._requested.get(heater_entity_id)
+        if pending is None or pending[1] != opening:
+            self._requested[heater_entity_id] = (self.hass.loop.time(), opening)
+
+    def _async_trv_changed(self, trv):
+        """Measure the latency of a requested opening reaching the device."""
+        pending = self._requested.get(trv.entity_id)
+        if pending is not None and pending[1] == trv.opening:
+            self.latencies.append(self.hass.loop.time() - pending[0])
+            del self._requested[trv.entity_id]
+
+    async def async_run(self, seconds):
+        """Simulate the given number of seconds."""
+        loop = self.hass.loop
+        self._timers.append(loop.call_later(self.step, self._async_step))
+        self._timers.append(loop.call_later(self.sensor_interval, self._async_report))
+        await asyncio.sleep(seconds)
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        await self.hass.async_block_till_done()
+
+    def _async_step(self):
+        """Advance all rooms."""
+        self.simulated += self.step
+        for room, thermostat in zip(self.rooms, self.thermostats):
+            room.async_step(self.step)
+            target = thermostat.target_temperature
+            if target is None:
+                continue
+            hours = self.step / 3600
+            self.degree_hours += max(0.0, target - room.outdoor) * hours
+            self.comfort_error += abs(target - room.temperature) * hours
+        self._timers.append(self.hass.loop.call_later(self.step, self._async_step))
+
+    def _async_report(self):
+        """Publish the readings of all sensors."""
+        for room in self.rooms:
+            room.async_report()
+        self._timers.append(
+            self.hass.loop.call_later(self.sensor_interval, self._async_report)
+        )
+
+    def report(self):
+        """Return the results of the simulation."""
+        latencies = sorted(self.latencies)
+        hours = self.simulated / 3600 or 1
+        return {
+            "zones": self.zones,
+            "simulated_hours": round(self.simulated / 3600, 2),
+            "actuations": len(latencies),
+            "latency_mean": round(statistics.mean(latencies), 2) if latencies else None,
+            "latency_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 2)
+            if latencies
+            else None,
+            "commands": self.fleet.commands,
+            "commands_dropped": self.fleet.dropped,
+            "commands_per_degree_hour": round(
+                self.fleet.commands / self.degree_hours, 4
+            )
+            if self.degree_hours
+            else None,
+            "comfort_error": round(self.comfort_error / hours / self.zones, 3),
+        }
+
+    async def async_stop(self):
+        """Stop hass."""
+        await self.hass.async_stop(force=True)
+        self._tempdir.cleanup()
@@ -0,0 +1,49 @@
+"""Fixtures of the spzb0001_thermostat tests."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim.clock import run  # noqa: E402
+from sim.hass import async_create_hass  # noqa: E402
+from sim.simulation import Simulation  # noqa: E402
+
+
+@pytest.fixture
+def run_with_hass(tmp_path):
+    """Return a runner of a coroutine function taking hass on a virtual clock."""
+
+    def _run(test):
+        async def _async_run():
+            hass = await async_create_hass(str(tmp_path))
+            try:
+                return await test(hass)
+            finally:
+                await hass.async_stop(force=True)
+
+        return run(_async_run())
+
+    return _run
+
+
+@pytest.fixture
+def simulate():
+    """Return a runner of a coroutine function taking a set up Simulation.
+
+    The arguments after the coroutine function are passed to Simulation.
+    """
+
+    def _simulate(test, *args, **kwargs):
+        async def _async_run():
+            simulation = Simulation(*args, **kwargs)
+            await simulation.async_setup()
+            try:
+                return await test(simulation)
+            finally:
+                await simulation.async_stop()
+
+        return run(_async_run())
+
+    return _simulate
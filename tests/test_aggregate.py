@@ -0,0 +1,116 @@
+"""Tests of the temperature aggregation."""
+import asyncio
+import random
+import statistics
+
+from custom_components.spzb0001_thermostat import climate
+from custom_components.spzb0001_thermostat.aggregate import (
+    AGGREGATE_EMA,
+    AGGREGATE_MEAN,
+    AGGREGATE_MEDIAN,
+    SensorWindow,
+    TemperatureAggregate,
+)
+
+SENSORS = ["sensor.a", "sensor.b", "sensor.c"]
+
+
+def test_mean_of_all_buffered_readings():
+    """mean averages the readings of all sensors."""
+    aggregate = TemperatureAggregate(SENSORS, AGGREGATE_MEAN, 2, None, 0.5)
+    aggregate.push("sensor.a", 0, 20.0)
+    aggregate.push("sensor.a", 1, 21.0)
+    aggregate.push("sensor.b", 1, 22.0)
+    assert aggregate.value(1) == 21.0
+    # SPZB: the window of sensor.a is full, the oldest reading is replaced
+    aggregate.push("sensor.a", 2, 23.0)
+    assert aggregate.value(2) == 22.0
+
+
+def test_median_matches_statistics_median():
+    """The sorted readings give the median of all buffered readings."""
+    rng = random.Random(1)
+    aggregate = TemperatureAggregate(SENSORS, AGGREGATE_MEDIAN, 4, 50, 0.5)
+    readings = {entity_id: [] for entity_id in SENSORS}
+    for time in range(200):
+        entity_id = rng.choice(SENSORS)
+        value = round(rng.uniform(18.0, 24.0), 1)
+        aggregate.push(entity_id, time, value)
+        readings[entity_id] = (readings[entity_id] + [(time, value)])[-4:]
+        fresh = [
+            value
+            for buffered in readings.values()
+            for reading_time, value in buffered
+            if reading_time >= time - 50
+        ]
+        assert aggregate.value(time) == statistics.median(fresh)
+        assert aggregate.ordered == sorted(fresh)
+
+
+def test_ema_averages_the_moving_averages():
+    """ema averages the moving averages of the sensors."""
+    aggregate = TemperatureAggregate(SENSORS, AGGREGATE_EMA, 4, None, 0.5)
+    aggregate.push("sensor.a", 0, 20.0)
+    aggregate.push("sensor.a", 1, 22.0)
+    aggregate.push("sensor.b", 1, 19.0)
+    assert aggregate.value(1) == 20.0
+
+
+def test_stale_readings_are_evicted():
+    """Readings older than max_age do not take part."""
+    aggregate = TemperatureAggregate(SENSORS, AGGREGATE_MEAN, 4, 60, 0.5)
+    aggregate.push("sensor.a", 0, 20.0)
+    aggregate.push("sensor.b", 50, 22.0)
+    assert aggregate.value(50) == 21.0
+    assert aggregate.value(100) == 22.0
+    assert aggregate.value(200) is None
+    assert aggregate.total == 0.0
+
+
+def test_touch_keeps_a_repeated_reading_fresh():
+    """A sensor reporting the same value again is not evicted."""
+    aggregate = TemperatureAggregate(SENSORS, AGGREGATE_MEDIAN, 4, 60, 0.5)
+    aggregate.push("sensor.a", 0, 20.0)
+    aggregate.touch("sensor.a", 50, 20.0)
+    assert aggregate.value(100) == 20.0
+    assert aggregate.windows["sensor.a"].count == 1
+    assert aggregate.value(200) is None
+    # SPZB: all readings were evicted, the repeated value is a new reading
+    aggregate.touch("sensor.a", 200, 20.0)
+    assert aggregate.value(200) == 20.0
+
+
+def test_window_push_reports_the_change_of_count_and_total():
+    """The aggregate keeps its running total from the returned changes."""
+    window = SensorWindow(2, 0.5)
+    assert window.push(0, 20.0) == (1, 20.0)
+    assert window.push(1, 21.0) == (1, 21.0)
+    assert window.push(2, 23.0) == (0, 3.0)
+    assert window.evict(2) == (-1, -21.0)
+
+
+def test_repeated_readings_stay_fresh(simulate):
+    """A sensor reporting the same temperature again is not dropped as stale."""
+
+    async def _async_test(simulation):
+        hass = simulation.hass
+        first, second = simulation.rooms[0].sensor_entity_ids
+        for index in range(5):
+            # SPZB: only the attributes of the first sensor change
+            hass.states.async_set(first, "22.0", {"battery": index})
+            hass.states.async_set(second, "23.6" if index % 2 else "23.5")
+            await hass.async_block_till_done()
+            await asyncio.sleep(300)
+        aggregate = simulation.thermostats[0]._aggregate
+        return aggregate.windows[first].count, aggregate.value(hass.loop.time() - 1)
+
+    count, value = simulate(
+        _async_test,
+        1,
+        2,
+        {climate.CONF_SENSOR_MAX_AGE: {"minutes": 10}},
+        sensors_per_zone=2,
+    )
+    # SPZB: the latest reading of each sensor, the first one was not evicted
+    assert count == 1
+    assert value == 22.75
@@ -0,0 +1,108 @@
+"""Tests of the grouped heater commands."""
+import asyncio
+
+from custom_components.spzb0001_thermostat.batch import (
+    BATCH_JOIN_TIMEOUT,
+    CommandBatch,
+)
+from custom_components.spzb0001_thermostat.driver import HeaterDriver
+
+
+class GroupDriver(HeaterDriver):
+    """Driver sending one command per opening, acknowledged by every heater."""
+
+    @classmethod
+    async def async_apply_group(cls, drivers, opening, call):
+        """Send the opening to all heaters at once."""
+        heater_entity_ids = [driver.heater_entity_id for driver in drivers]
+        await call(heater_entity_ids, "number", "set_value", {"value": opening})
+        return set(heater_entity_ids)
+
+
+def _recorder(hass, calls, duration=5):
+    """Return a call recording the heaters of every command and taking duration seconds."""
+
+    async def _async_call(heater_entity_ids, domain, service, data, **kwargs):
+        calls.append((hass.loop.time(), tuple(heater_entity_ids)))
+        await asyncio.sleep(duration)
+
+    return _async_call
+
+
+def _batch(hass, calls, heater_entity_ids, duration=5):
+    """Return the drivers of the heaters and a batch moving them to 1.0."""
+    call = _recorder(hass, calls, duration)
+
+    async def _async_single_call(heater_entity_id, domain, service, data, **kwargs):
+        await call([heater_entity_id], domain, service, data, **kwargs)
+
+    drivers = [
+        GroupDriver(hass, heater_entity_id, _async_single_call)
+        for heater_entity_id in heater_entity_ids
+    ]
+    return drivers, CommandBatch(hass, GroupDriver, heater_entity_ids, 1.0, call)
+
+
+def test_heaters_joining_together_share_one_call(run_with_hass):
+    """Once all heaters joined the batch starts with a single call."""
+
+    async def _async_test(hass):
+        calls = []
+        drivers, batch = _batch(hass, calls, ["number.a", "number.b", "number.c"])
+        acknowledged = await asyncio.gather(
+            *(batch.async_join(driver) for driver in drivers)
+        )
+        return acknowledged, calls
+
+    acknowledged, calls = run_with_hass(_async_test)
+    assert acknowledged == [True, True, True]
+    assert calls == [(0.0, ("number.a", "number.b", "number.c"))]
+
+
+def test_batch_starts_without_the_missing_heaters(run_with_hass):
+    """Heaters that did not join within BATCH_JOIN_TIMEOUT are left out."""
+
+    async def _async_test(hass):
+        calls = []
+        drivers, batch = _batch(hass, calls, ["number.a", "number.b", "number.c"])
+        acknowledged = await asyncio.gather(
+            *(batch.async_join(driver) for driver in drivers[:2])
+        )
+        return acknowledged, calls
+
+    acknowledged, calls = run_with_hass(_async_test)
+    assert acknowledged == [True, True]
+    assert calls == [(BATCH_JOIN_TIMEOUT, ("number.a", "number.b"))]
+
+
+def test_late_heater_applies_on_its_own(run_with_hass):
+    """A heater joining a started batch sends its own command."""
+
+    async def _async_test(hass):
+        calls = []
+        drivers, batch = _batch(hass, calls, ["number.a", "number.b"])
+        first = hass.async_create_task(batch.async_join(drivers[0]))
+        await asyncio.sleep(BATCH_JOIN_TIMEOUT + 1)
+        late = await batch.async_join(drivers[1])
+        return await first, late, calls
+
+    first, late, calls = run_with_hass(_async_test)
+    assert first and late
+    assert calls == [
+        (BATCH_JOIN_TIMEOUT, ("number.a",)),
+        (BATCH_JOIN_TIMEOUT + 1, ("number.b",)),
+    ]
+
+
+def test_cancelled_batch_releases_the_heaters(run_with_hass):
+    """The joined heaters are not acknowledged but do not wait forever."""
+
+    async def _async_test(hass):
+        calls = []
+        drivers, batch = _batch(hass, calls, ["number.a", "number.b"], 60)
+        joined = asyncio.gather(*(batch.async_join(driver) for driver in drivers))
+        await asyncio.sleep(1)
+        batch._task.cancel()
+        return await asyncio.wait_for(joined, 10)
+
+    assert run_with_hass(_async_test) == [False, False]
@@ -0,0 +1,252 @@
+"""Tests of the SPZB0001 thermostat entities."""
+import asyncio
+
+from homeassistant.const import (
+    CONF_NAME,
+    CONF_PLATFORM,
+    EVENT_CALL_SERVICE,
+    EVENT_STATE_CHANGED,
+)
+from homeassistant.core import Context
+
+from custom_components.spzb0001_thermostat import DOMAIN, climate
+from custom_components.spzb0001_thermostat.metrics import (
+    COUNTER_ECHOES_IGNORED,
+    COUNTER_HEATER_REVERTS,
+    HISTOGRAM_SENSOR_TO_DECISION,
+)
+
+
+def _record_calls(hass):
+    """Return the list the heater service calls are recorded to with their time."""
+    calls = []
+
+    def _async_called(event):
+        calls.append((hass.loop.time(), event.data["service_data"]["entity_id"]))
+
+    hass.bus.async_listen(EVENT_CALL_SERVICE, _async_called)
+    return calls
+
+
+def test_startup_leaves_consistent_heaters_alone(simulate):
+    """Heaters in a state of the integration get no commands on startup."""
+
+    async def _async_test(simulation):
+        calls = _record_calls(simulation.hass)
+        await simulation.async_run(600)
+        return calls, [thermostat.startup for thermostat in simulation.thermostats]
+
+    calls, startup = simulate(_async_test, 3, 0, {climate.CONF_TARGET_TEMP: 10.0})
+    assert calls == []
+    assert startup == [False, False, False]
+
+
+def test_startup_reconciles_inconsistent_heaters_staggered(simulate):
+    """Heaters left in heat are closed, STARTUP_STAGGER seconds apart."""
+
+    async def _async_test(simulation):
+        calls = _record_calls(simulation.hass)
+        await simulation.async_run(600)
+        first = {}
+        for time, entity_id in calls:
+            first.setdefault(entity_id, time)
+        return sorted(first.values()), [
+            (trv.hvac_mode, trv.setpoint) for trv in simulation.fleet.trvs.values()
+        ]
+
+    starts, states = simulate(
+        _async_test,
+        3,
+        0,
+        {climate.CONF_TARGET_TEMP: 10.0},
+        {"hvac_mode": "heat", "setpoint": 21.0, "drift_after": None},
+    )
+    assert len(starts) == 3
+    assert [later - earlier for earlier, later in zip(starts, starts[1:])] == [
+        climate.STARTUP_STAGGER,
+        climate.STARTUP_STAGGER,
+    ]
+    assert states == [("off", 5.0)] * 3
+
+
+def test_sensor_readings_are_debounced(simulate):
+    """Readings within sensor_debounce lead to a single decision on the latest."""
+
+    async def _async_test(simulation):
+        hass = simulation.hass
+        thermostat = simulation.thermostats[0]
+        sensor_entity_id = simulation.rooms[0].sensor_entity_ids[0]
+        before = thermostat.current_temperature
+        for reading in ("21.0", "21.4", "21.2"):
+            hass.states.async_set(sensor_entity_id, reading)
+            await hass.async_block_till_done()
+            await asyncio.sleep(5)
+        debounced = thermostat.current_temperature
+        await asyncio.sleep(30)
+        histogram = thermostat.metrics.histograms[HISTOGRAM_SENSOR_TO_DECISION]
+        return before, debounced, thermostat.current_temperature, histogram.summary()
+
+    before, debounced, decided, decisions = simulate(
+        _async_test, 1, 0, {climate.CONF_SENSOR_DEBOUNCE: {"seconds": 30}}
+    )
+    assert debounced == before
+    assert decided == 21.2
+    assert decisions == {"count": 1, "mean": 30.0, "max": 30.0}
+
+
+async def _async_switch_to_heat(simulation, context=None):
+    """Switch the open heater to heat and return its mode a while later."""
+    await simulation.async_run(600)
+    trv = simulation.fleet.trvs["climate.trv_0"]
+    assert (trv.hvac_mode, trv.setpoint) == ("auto", 30.0)
+    trv.async_set_hvac_mode("heat")
+    trv.async_write_state(context)
+    # SPZB: shorter than the reconcile interval, which corrects any heater in heat
+    await simulation.async_run(60)
+    return simulation.thermostats[0].metrics.counters, trv.hvac_mode
+
+
+def test_zones_override_the_platform_options():
+    """Every zone gets the platform options with its own on top."""
+    config = climate.PLATFORM_SCHEMA(
+        {
+            CONF_PLATFORM: DOMAIN,
+            climate.CONF_TARGET_TEMP: 20.0,
+            climate.CONF_AWAY_TEMP: 16.0,
+            climate.CONF_ZONES: [
+                {
+                    CONF_NAME: "kitchen",
+                    climate.CONF_HEATER: "climate.kitchen",
+                    climate.CONF_SENSOR: "sensor.kitchen",
+                    climate.CONF_TARGET_TEMP: 18.0,
+                },
+                {
+                    CONF_NAME: "bath",
+                    climate.CONF_HEATER: ["climate.bath", "climate.bath_2"],
+                    climate.CONF_SENSOR: "sensor.bath",
+                },
+            ],
+        }
+    )
+    kitchen, bath = climate._zone_configs(config)
+    assert kitchen[climate.CONF_TARGET_TEMP] == 18.0
+    assert bath[climate.CONF_TARGET_TEMP] == 20.0
+    assert kitchen[climate.CONF_AWAY_TEMP] == bath[climate.CONF_AWAY_TEMP] == 16.0
+    assert bath[climate.CONF_HEATER] == ["climate.bath", "climate.bath_2"]
+    assert kitchen[climate.CONF_HOT_TOLERANCE] == climate.DEFAULT_TOLERANCE
+
+
+def test_zones_share_one_state_listener(simulate):
+    """The thermostats of all zones are notified through one bus listener."""
+
+    def _listeners(zones):
+        async def _async_test(simulation):
+            return simulation.hass.bus.async_listeners()[EVENT_STATE_CHANGED]
+
+        return simulate(_async_test, zones)
+
+    assert _listeners(10) == _listeners(1)
+
+
+def test_echo_of_own_command_is_ignored(simulate):
+    """A switch to heat carrying the context of our command is no revert."""
+
+    async def _async_test(simulation):
+        context = Context()
+        simulation.thermostats[0].async_remember_context(context)
+        return await _async_switch_to_heat(simulation, context)
+
+    counters, hvac_mode = simulate(
+        _async_test, 1, 0, {climate.CONF_TARGET_TEMP: 30.0}, {"drift_after": None}
+    )
+    assert counters[COUNTER_ECHOES_IGNORED] == 1
+    assert COUNTER_HEATER_REVERTS not in counters
+    assert hvac_mode == "heat"
+
+
+def test_foreign_switch_to_heat_is_reverted(simulate):
+    """A switch to heat by someone else is reverted to auto."""
+
+    counters, hvac_mode = simulate(
+        _async_switch_to_heat,
+        1,
+        0,
+        {climate.CONF_TARGET_TEMP: 30.0},
+        {"drift_after": None},
+    )
+    assert counters[COUNTER_HEATER_REVERTS] == 1
+    assert COUNTER_ECHOES_IGNORED not in counters
+    assert hvac_mode == "auto"
+
+
+def test_heaters_of_a_room_are_moved_in_parallel(simulate):
+    """Every heater of a room gets its commands without waiting for the others."""
+
+    async def _async_test(simulation):
+        calls = _record_calls(simulation.hass)
+        await simulation.thermostats[0].async_set_temperature(temperature=25)
+        await simulation.async_run(60)
+        first = {}
+        for time, entity_id in calls:
+            first.setdefault(entity_id, time)
+        return first, [trv.active for trv in simulation.fleet.trvs.values()]
+
+    first, active = simulate(_async_test, 1, 0, heaters_per_zone=3)
+    assert len(first) == 3
+    assert max(first.values()) - min(first.values()) < 2
+    assert active == [True, True, True]
+
+
+def test_set_all_groups_the_heaters_of_all_rooms(simulate):
+    """Switching all rooms off sends every step once for all heaters."""
+
+    async def _async_test(simulation):
+        hass = simulation.hass
+        await simulation.async_run(600)
+        calls = _record_calls(hass)
+        await hass.services.async_call(
+            DOMAIN, climate.SERVICE_SET_ALL, {"hvac_mode": "off"}, blocking=True
+        )
+        await simulation.async_run(60)
+        return calls, [thermostat.hvac_mode for thermostat in simulation.thermostats]
+
+    calls, hvac_modes = simulate(_async_test, 6, 0, {climate.CONF_TARGET_TEMP: 30.0})
+    heaters = sorted(f"climate.trv_{index}" for index in range(6))
+    assert [sorted(entity_ids) for _, entity_ids in calls] == [heaters, heaters]
+    assert hvac_modes == ["off"] * 6
+
+
+def test_stop_leaves_no_tasks(simulate, caplog):
+    """Stopping Home Assistant stops the pipelines retrying failed heaters."""
+
+    async def _async_test(simulation):
+        hass = simulation.hass
+        for thermostat in simulation.thermostats:
+            await thermostat.async_set_temperature(temperature=25)
+        await asyncio.sleep(400)
+        pipelines = [
+            pipeline
+            for thermostat in simulation.thermostats
+            for pipeline in thermostat._pipelines.values()
+        ]
+        assert all(pipeline.consecutive_failures for pipeline in pipelines)
+        started = hass.loop.time()
+        await hass.async_stop()
+        assert hass.loop.time() - started < 1
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert simulate(_async_test, zones=3, trv_options={"drop_rate": 1.0}) == []
+    assert "still running" not in caplog.text
+
+
+def test_unresponsive_heater_is_quarantined(simulate):
+    """A heater losing every command is listed in quarantined_heaters."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await thermostat.async_set_temperature(temperature=25)
+        await simulation.async_run(2 * 3600)
+        return simulation.hass.states.get(thermostat.entity_id).attributes
+
+    attributes = simulate(_async_test, 1, 0, trv_options={"drop_rate": 1.0})
+    assert attributes[climate.ATTR_QUARANTINED_HEATERS] == ["climate.trv_0"]
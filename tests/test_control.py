@@ -0,0 +1,113 @@
+"""Tests of the control strategies."""
+from custom_components.spzb0001_thermostat import DOMAIN, climate
+from custom_components.spzb0001_thermostat.control import (
+    ActuationCounter,
+    hysteresis_decision,
+    tpi_duty,
+)
+
+
+def test_hysteresis_keeps_the_state_within_the_tolerances():
+    """A heater only switches once the temperature leaves the band."""
+    assert hysteresis_decision(19.8, 20.0, False, 0.3, 0.3) is False
+    assert hysteresis_decision(19.7, 20.0, False, 0.3, 0.3) is True
+    assert hysteresis_decision(20.2, 20.0, True, 0.3, 0.3) is True
+    assert hysteresis_decision(20.3, 20.0, True, 0.3, 0.3) is False
+
+
+def test_hysteresis_without_tolerances_switches_at_target():
+    """Without tolerances the heater switches on and off at target."""
+    assert hysteresis_decision(20.0, 20.0, False, 0.0, 0.0) is True
+    assert hysteresis_decision(20.0, 20.0, True, 0.0, 0.0) is False
+
+
+def test_tpi_duty_is_proportional_and_clamped():
+    """The duty grows with the error and stays between 0 and 1."""
+    assert tpi_duty(19.5, 20.0, 0.5) == 0.25
+    assert tpi_duty(15.0, 20.0, 0.5) == 1.0
+    assert tpi_duty(21.0, 20.0, 0.5) == 0.0
+
+
+def test_actuation_counter_counts_avoided_actuations():
+    """The baseline switches on every crossing of target."""
+    counter = ActuationCounter()
+    for temperature in (19.9, 20.1, 19.9, 20.1, 19.9):
+        counter.observe(temperature, 20.0, False)
+    counter.actuated()
+    assert counter.baseline_actuations == 5
+    assert counter.actuations == 1
+    assert counter.avoided == 4
+
+
+def test_actuation_counter_reset_restarts_from_the_heater_state():
+    """After a reset the baseline starts again from the heater state."""
+    counter = ActuationCounter()
+    counter.observe(19.0, 20.0, False)
+    assert counter.baseline_actuations == 1
+    counter.reset()
+    # SPZB: the heater was turned off while the control loop did not decide
+    counter.observe(19.0, 20.0, False)
+    counter.observe(19.0, 20.0, True)
+    assert counter.baseline_actuations == 2
+    assert counter.avoided == 2
+
+
+def test_tolerances_avoid_actuations(simulate):
+    """The tolerances need fewer actuations than switching at target."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        for _ in range(3):
+            await simulation.async_run(3 * 3600)
+            await thermostat.async_set_hvac_mode("off")
+            await simulation.async_run(3600)
+            await thermostat.async_set_hvac_mode("heat")
+        return thermostat.statistics
+
+    statistics = simulate(
+        _async_test,
+        1,
+        3,
+        {climate.CONF_HOT_TOLERANCE: 0.3, climate.CONF_COLD_TOLERANCE: 0.3},
+    )
+    assert statistics[climate.ATTR_ACTUATIONS] > 0
+    assert statistics[climate.ATTR_ACTUATIONS_AVOIDED] > 0
+
+
+def test_tolerances_are_off_by_default(simulate):
+    """Without tolerances the heater switches at the target as before."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await simulation.async_run(6 * 3600)
+        return thermostat.statistics
+
+    statistics = simulate(_async_test, 1, 3)
+    assert statistics[climate.ATTR_ACTUATIONS] > 0
+    assert statistics[climate.ATTR_ACTUATIONS_AVOIDED] == 0
+
+
+def test_min_cycle_duration_keeps_the_heater_state(simulate):
+    """The heater is not switched again before min_cycle_duration passed."""
+
+    async def _async_test(simulation):
+        hass = simulation.hass
+        switched = []
+
+        def _async_requested(heater_entity_id, opening):
+            if not switched or switched[-1][1] != opening:
+                switched.append((hass.loop.time(), opening))
+
+        hass.data[DOMAIN][climate.DATA_REQUEST_LISTENERS].append(_async_requested)
+        await simulation.async_run(12 * 3600)
+        return switched
+
+    switched = simulate(
+        _async_test,
+        1,
+        3,
+        {climate.CONF_MIN_DUR: {"minutes": 30}, climate.CONF_TARGET_TEMP: 19.0},
+    )
+    assert len(switched) > 2
+    cycles = [later[0] - earlier[0] for earlier, later in zip(switched, switched[1:])]
+    assert min(cycles) >= 1800
@@ -0,0 +1,80 @@
+"""Tests of the shared state change dispatcher."""
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import callback
+
+from custom_components.spzb0001_thermostat.dispatch import StateChangeDispatcher
+
+
+def _recorder(received, name=None):
+    """Return an action appending the entity ids of its events to received."""
+
+    @callback
+    def _async_action(event):
+        entity_id = event.data["entity_id"]
+        received.append(entity_id if name is None else (name, entity_id))
+
+    return _async_action
+
+
+def test_events_reach_the_watching_actions(run_with_hass):
+    """Only the actions watching the entity get its events."""
+
+    async def _async_test(hass):
+        dispatcher = StateChangeDispatcher(hass)
+        received = []
+        dispatcher.async_track("sensor.Room_Temperature", _recorder(received, "a"))
+        dispatcher.async_track("sensor.room_temperature", _recorder(received, "b"))
+        hass.states.async_set("sensor.other", "20.0")
+        hass.states.async_set("sensor.room_temperature", "20.5")
+        await hass.async_block_till_done()
+        return received
+
+    assert run_with_hass(_async_test) == [
+        ("a", "sensor.room_temperature"),
+        ("b", "sensor.room_temperature"),
+    ]
+
+
+def test_failing_action_does_not_stop_the_others(run_with_hass, caplog):
+    """An exception in one action is logged, the other actions still get the event."""
+
+    async def _async_test(hass):
+        dispatcher = StateChangeDispatcher(hass)
+        received = []
+
+        @callback
+        def _async_fail(event):
+            raise ValueError("broken thermostat")
+
+        dispatcher.async_track("sensor.room_temperature", _async_fail)
+        dispatcher.async_track("sensor.room_temperature", _recorder(received))
+        hass.states.async_set("sensor.room_temperature", "20.5")
+        await hass.async_block_till_done()
+        return len(received)
+
+    assert run_with_hass(_async_test) == 1
+    assert "broken thermostat" in caplog.text
+
+
+def test_remove_stops_tracking(run_with_hass):
+    """The bus listener is removed with the last tracked action."""
+
+    async def _async_test(hass):
+        listeners = hass.bus.async_listeners().get(EVENT_STATE_CHANGED, 0)
+        dispatcher = StateChangeDispatcher(hass)
+        received = []
+        remove_a = dispatcher.async_track("sensor.a", _recorder(received))
+        remove_b = dispatcher.async_track("sensor.b", _recorder(received))
+        shared = hass.bus.async_listeners()[EVENT_STATE_CHANGED] - listeners
+        remove_a()
+        hass.states.async_set("sensor.a", "1")
+        hass.states.async_set("sensor.b", "1")
+        await hass.async_block_till_done()
+        remove_b()
+        remove_b()
+        hass.states.async_set("sensor.b", "2")
+        await hass.async_block_till_done()
+        left = hass.bus.async_listeners().get(EVENT_STATE_CHANGED, 0) - listeners
+        return shared, received, left
+
+    assert run_with_hass(_async_test) == (1, ["sensor.b"], 0)
@@ -0,0 +1,103 @@
+"""Tests of the heater drivers."""
+from custom_components.spzb0001_thermostat.driver import ValvePositionDriver
+
+
+async def _async_no_call(*_, **__):
+    """Stand in for the call of a driver that does not send commands."""
+
+
+def test_number_opening_is_scaled_to_its_range(run_with_hass):
+    """A number entity maps its min to max range to openings 0 to 1."""
+
+    async def _async_test(hass):
+        driver = ValvePositionDriver(hass, "climate.trv", _async_no_call, "number.valve")
+        openings = []
+        for position, attributes in (
+            ("0", {"min": 0, "max": 255}),
+            ("64", {"min": 0, "max": 255}),
+            ("255", {}),
+            ("60", {"min": 10, "max": 110}),
+            ("unavailable", {}),
+            ("closed", {}),
+        ):
+            hass.states.async_set("number.valve", position, attributes)
+            openings.append(driver.opening(hass.states.get("number.valve")))
+        openings.append(driver.opening(None))
+        return openings
+
+    assert run_with_hass(_async_test) == [0.0, 0.25, 1.0, 0.5, None, None, None]
+
+
+def test_valve_opening_is_read_from_the_current_position(run_with_hass):
+    """A valve entity reports its position in percent."""
+
+    async def _async_test(hass):
+        driver = ValvePositionDriver(hass, "climate.trv", _async_no_call, "valve.trv")
+        hass.states.async_set("valve.trv", "open", {"current_position": 35})
+        opening = driver.opening(hass.states.get("valve.trv"))
+        hass.states.async_set("valve.trv", "open")
+        return opening, driver.opening(hass.states.get("valve.trv"))
+
+    assert run_with_hass(_async_test) == (0.35, None)
+
+
+def test_position_for_an_opening(run_with_hass):
+    """Openings are sent as raw number values or valve percentages."""
+
+    async def _async_test(hass):
+        hass.states.async_set("number.valve", "0", {"min": 10, "max": 110})
+        number = ValvePositionDriver(hass, "climate.a", _async_no_call, "number.valve")
+        fallback = ValvePositionDriver(hass, "climate.b", _async_no_call, "number.new")
+        valve = ValvePositionDriver(hass, "climate.c", _async_no_call, "valve.trv")
+        return [driver._position(0.4) for driver in (number, fallback, valve)]
+
+    assert run_with_hass(_async_test) == [
+        ("set_value", "value", 50),
+        ("set_value", "value", 102),
+        ("set_valve_position", "position", 40),
+    ]
+
+
+def test_apply_is_acknowledged_by_the_reported_position(run_with_hass):
+    """async_apply sends one command and waits for the position."""
+
+    async def _async_test(hass):
+        calls = []
+
+        async def _async_call(heater_entity_id, domain, service, data, **kwargs):
+            calls.append((heater_entity_id, domain, service, data))
+            hass.loop.call_later(
+                1, hass.states.async_set, "number.valve", data["value"], {}
+            )
+
+        hass.states.async_set("number.valve", "0", {})
+        driver = ValvePositionDriver(hass, "climate.trv", _async_call, "number.valve")
+        acknowledged = await driver.async_apply(0.5)
+        return acknowledged, calls
+
+    acknowledged, calls = run_with_hass(_async_test)
+    assert acknowledged
+    assert calls == [
+        (
+            "climate.trv",
+            "number",
+            "set_value",
+            {"entity_id": "number.valve", "value": 128},
+        )
+    ]
+
+
+def test_thermostat_drives_the_valve_entity(simulate):
+    """With valve entities the heater stays off and only the position moves."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await thermostat.async_set_temperature(temperature=25)
+        await simulation.async_run(600)
+        trv = simulation.fleet.trvs["climate.trv_0"]
+        return trv.hvac_mode, trv.position, thermostat.hvac_action
+
+    hvac_mode, position, hvac_action = simulate(_async_test, 1, 0, valves=True)
+    assert hvac_mode == "off"
+    assert position == 255
+    assert hvac_action == "heating"
@@ -0,0 +1,61 @@
+"""Tests of the heater helpers."""
+from custom_components.spzb0001_thermostat.heater import (
+    HEATER_STATE_UNKNOWN,
+    async_wait_for_heaters,
+    hvac_mode_is,
+    parse_heater_state,
+)
+
+
+def test_parse_heater_state(run_with_hass):
+    """auto is active above min_temp, heat is always active."""
+
+    async def _async_test(hass):
+        hass.states.async_set("climate.a", "auto", {"temperature": 5.0})
+        hass.states.async_set("climate.b", "auto", {"temperature": 30.0})
+        hass.states.async_set("climate.c", "heat", {"temperature": 5.0})
+        return [
+            parse_heater_state(hass.states.get(entity_id), 5.0)
+            for entity_id in ("climate.a", "climate.b", "climate.c", "climate.d")
+        ]
+
+    states = run_with_hass(_async_test)
+    assert [state.active for state in states] == [False, True, True, False]
+    assert states[1].setpoint == 30.0
+    assert states[3] == HEATER_STATE_UNKNOWN
+
+
+def test_wait_returns_once_all_heaters_acknowledged(run_with_hass):
+    """The wait ends with the last acknowledgement, not after the timeout."""
+
+    async def _async_test(hass):
+        hass.states.async_set("climate.a", "off")
+        hass.states.async_set("climate.b", "auto")
+        hass.loop.call_later(2, hass.states.async_set, "climate.a", "auto")
+        start = hass.loop.time()
+        acknowledged = await async_wait_for_heaters(
+            hass, ["climate.a", "climate.b"], hvac_mode_is("auto"), 25
+        )
+        return acknowledged, hass.loop.time() - start
+
+    acknowledged, waited = run_with_hass(_async_test)
+    assert acknowledged == {"climate.a", "climate.b"}
+    assert waited == 2
+
+
+def test_wait_returns_the_acknowledged_heaters_after_the_timeout(run_with_hass):
+    """Heaters that did not report the state in time are left out."""
+
+    async def _async_test(hass):
+        hass.states.async_set("climate.a", "off")
+        hass.states.async_set("climate.b", "off")
+        hass.loop.call_later(1, hass.states.async_set, "climate.a", "auto")
+        start = hass.loop.time()
+        acknowledged = await async_wait_for_heaters(
+            hass, ["climate.a", "climate.b"], hvac_mode_is("auto"), 5
+        )
+        return acknowledged, hass.loop.time() - start
+
+    acknowledged, waited = run_with_hass(_async_test)
+    assert acknowledged == {"climate.a"}
+    assert waited == 5
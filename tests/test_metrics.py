@@ -0,0 +1,61 @@
+"""Tests of the runtime metrics."""
+import json
+
+from custom_components.spzb0001_thermostat import DOMAIN, climate
+from custom_components.spzb0001_thermostat.metrics import Histogram, Metrics
+
+
+def test_histogram_buckets():
+    """Durations are counted in the first bucket they fit."""
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 20):
+        histogram.observe(value)
+    assert histogram.as_dict() == {
+        "count": 4,
+        "mean": 6.625,
+        "max": 20,
+        "buckets": {"le_1": 2, "le_10": 1, "inf": 1},
+    }
+
+
+def test_metrics_add_up_in_the_parent():
+    """The platform metrics add up the metrics of the thermostats."""
+    platform = Metrics()
+    first = Metrics(platform)
+    second = Metrics(platform)
+    first.increment("commands_sent")
+    second.increment("commands_sent", 2)
+    first.observe("climate.set_temperature", 2.0)
+    second.observe("climate.set_temperature", 4.0)
+    assert first.counters == {"commands_sent": 1}
+    assert platform.counters == {"commands_sent": 3}
+    assert platform.histograms["climate.set_temperature"].summary() == {
+        "count": 2,
+        "mean": 3.0,
+        "max": 4.0,
+    }
+
+
+def test_dump_metrics_writes_platform_and_thermostats(simulate):
+    """dump_metrics writes the metrics of the platform and every thermostat."""
+
+    async def _async_test(simulation):
+        hass = simulation.hass
+        await simulation.async_run(3600)
+        await hass.services.async_call(
+            DOMAIN, climate.SERVICE_DUMP_METRICS, {}, blocking=True
+        )
+        with open(hass.config.path(climate.METRICS_FILE), encoding="utf-8") as file:
+            return json.load(file)
+
+    metrics = simulate(_async_test, 2, 0)
+    assert set(metrics["thermostats"]) == {"climate.room_0", "climate.room_1"}
+    thermostat = metrics["thermostats"]["climate.room_0"]
+    assert set(thermostat["heaters"]) == {"climate.trv_0"}
+    assert thermostat["heaters"]["climate.trv_0"]["health"] == "ok"
+    platform = metrics["platform"]
+    assert platform["counters"]["commands_sent"] == sum(
+        thermostat["counters"].get("commands_sent", 0)
+        for thermostat in metrics["thermostats"].values()
+    )
+    assert platform[climate.ATTR_COMMAND_QUEUE]["queue_depth"] == 0
@@ -0,0 +1,115 @@
+"""Tests of the learned thermal model."""
+from datetime import timedelta
+
+import homeassistant.util.dt as dt_util
+
+from custom_components.spzb0001_thermostat import climate
+from custom_components.spzb0001_thermostat.model import (
+    MAX_SEGMENT,
+    MIN_SEGMENT,
+    ThermalModel,
+)
+
+
+def test_rates_are_learned_from_long_segments():
+    """Heating and cooling rates come from segments of MIN_SEGMENT or more."""
+    model = ThermalModel()
+    model.observe(0, 18.0, True)
+    model.observe(1800, 19.0, False)
+    assert model.heating_rate == 2.0
+    model.observe(1800 + MIN_SEGMENT - 1, 18.9, True)
+    assert model.cooling_rate is None
+    assert model.samples == 1
+
+
+def test_long_segments_are_learned_in_parts():
+    """A segment is closed after MAX_SEGMENT and learned again."""
+    model = ThermalModel()
+    model.observe(0, 18.0, True)
+    model.observe(MAX_SEGMENT, 20.0, True)
+    assert model.heating_rate == 2.0
+    model.observe(2 * MAX_SEGMENT, 21.0, True)
+    assert model.heating_rate == 1.8
+    assert model.samples == 2
+
+
+def test_overshoot_after_the_heater_turned_off():
+    """The rise of the temperature after turning off is learned."""
+    model = ThermalModel()
+    model.observe(0, 19.0, True)
+    model.observe(600, 20.0, False)
+    model.observe(660, 20.2, False)
+    model.observe(720, 20.3, False)
+    model.observe(780, 20.1, False)
+    assert round(model.overshoot, 6) == 0.3
+
+
+def test_preheat_time():
+    """Preheat time follows the heating rate."""
+    model = ThermalModel(heating_rate=2.0)
+    assert model.preheat_time(19.0, 20.0) == 1800
+    assert model.preheat_time(21.0, 20.0) == 0.0
+    assert ThermalModel(heating_rate=-1.0).preheat_time(19.0, 20.0) is None
+
+
+def test_dict_round_trip():
+    """A model restores from its dict, invalid data gives a new model."""
+    model = ThermalModel(1.23456, -0.5, 0.2, 7)
+    restored = ThermalModel.from_dict(model.as_dict())
+    assert restored.as_dict() == {
+        "heating_rate": 1.235,
+        "cooling_rate": -0.5,
+        "overshoot": 0.2,
+        "samples": 7,
+    }
+    assert ThermalModel.from_dict({"heating_rate": "fast"}).as_dict()["samples"] == 0
+    assert ThermalModel.from_dict(None).heating_rate is None
+
+
+async def _async_preheat(simulation, model, checks):
+    """Preheat to 22 in three hours, return the target at the checked seconds."""
+    thermostat = simulation.thermostats[0]
+    await simulation.async_run(600)
+    thermostat._model = model
+    await thermostat.async_preheat(22.0, dt_util.now() + timedelta(hours=3))
+    targets = [thermostat.target_temperature]
+    elapsed = 0
+    for check in checks:
+        await simulation.async_run(check - elapsed)
+        elapsed = check
+        targets.append(thermostat.target_temperature)
+    return targets
+
+
+def test_preheat_starts_ahead_by_the_heating_rate(simulate):
+    """With 2 degrees per hour a room at 18 starts preheating 2 hours early."""
+
+    async def _async_test(simulation):
+        return await _async_preheat(
+            simulation, ThermalModel(heating_rate=2.0), (3590, 3610)
+        )
+
+    targets = simulate(
+        _async_test,
+        1,
+        0,
+        {climate.CONF_TARGET_TEMP: 10.0},
+        room_options={"temperature": 18.0, "loss_rate": 0.0, "noise": 0.0},
+    )
+    assert targets == [10.0, 10.0, 22.0]
+
+
+def test_preheat_without_heating_rate_sets_the_target_on_time(simulate):
+    """Until a heating rate is learned the target is set at the given time."""
+
+    async def _async_test(simulation):
+        return await _async_preheat(simulation, ThermalModel(), (10790, 10810))
+
+    targets = simulate(
+        _async_test,
+        1,
+        0,
+        {climate.CONF_TARGET_TEMP: 10.0},
+        room_options={"temperature": 18.0, "loss_rate": 0.0, "noise": 0.0},
+    )
+    assert targets == [10.0, 10.0, 22.0]
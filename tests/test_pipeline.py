@@ -0,0 +1,253 @@
+"""Tests of the per-heater command pipeline."""
+import asyncio
+
+from custom_components.spzb0001_thermostat.driver import HeaterDriver
+from custom_components.spzb0001_thermostat.metrics import (
+    COUNTER_COMMANDS_FAILED,
+    COUNTER_COMMANDS_PREEMPTED,
+    COUNTER_COMMANDS_SUPERSEDED,
+    COUNTER_HEATER_QUARANTINES,
+    Metrics,
+)
+from custom_components.spzb0001_thermostat.pipeline import (
+    BACKOFF_BASE,
+    BACKOFF_JITTER,
+    HEALTH_DEGRADED,
+    HEALTH_OK,
+    HEALTH_QUARANTINED,
+    QUARANTINE_FAILURES,
+    HeaterCommandPipeline,
+)
+from custom_components.spzb0001_thermostat.scheduler import (
+    PRIORITY_USER,
+    AirtimeScheduler,
+)
+
+
+class RecordingDriver:
+    """Driver taking duration seconds per opening, acknowledging as told."""
+
+    def __init__(self, hass, duration=10, failures=0):
+        """Initialize the driver, the first failures openings are not acknowledged."""
+        self.hass = hass
+        self.heater_entity_id = "climate.trv"
+        self.duration = duration
+        self.failures = failures
+        self.started = []
+        self.applied = []
+
+    async def async_apply(self, opening):
+        """Record the opening, return if it is acknowledged."""
+        self.started.append(opening)
+        await asyncio.sleep(self.duration)
+        self.applied.append((self.hass.loop.time(), opening))
+        if self.failures:
+            self.failures -= 1
+            return False
+        return True
+
+
+def _openings(driver):
+    """Return the openings the driver completed."""
+    return [opening for _, opening in driver.applied]
+
+
+def test_newest_request_wins(run_with_hass):
+    """Requests arriving while a sequence runs replace each other."""
+
+    async def _async_test(hass):
+        metrics = Metrics()
+        driver = RecordingDriver(hass)
+        pipeline = HeaterCommandPipeline(hass, driver, metrics)
+        pipeline.async_request(1.0)
+        await asyncio.sleep(1)
+        assert pipeline.sending
+        pipeline.async_request(0.5)
+        pipeline.async_request(0.3)
+        assert pipeline.target == 0.3
+        await asyncio.sleep(30)
+        assert not pipeline.busy
+        return _openings(driver), metrics.counters
+
+    openings, counters = run_with_hass(_async_test)
+    assert openings == [1.0, 0.3]
+    assert counters[COUNTER_COMMANDS_SUPERSEDED] == 1
+
+
+def test_flip_back_to_the_applied_opening_is_dropped(run_with_hass):
+    """A request returning to the opening just applied sends nothing."""
+
+    async def _async_test(hass):
+        driver = RecordingDriver(hass)
+        pipeline = HeaterCommandPipeline(hass, driver)
+        pipeline.async_request(1.0)
+        await asyncio.sleep(1)
+        pipeline.async_request(0.0)
+        pipeline.async_request(1.0)
+        await asyncio.sleep(30)
+        return _openings(driver)
+
+    assert run_with_hass(_async_test) == [1.0]
+
+
+def test_failure_is_retried_after_the_backoff(run_with_hass):
+    """An opening that is not acknowledged is sent again after the backoff."""
+
+    async def _async_test(hass):
+        metrics = Metrics()
+        driver = RecordingDriver(hass, failures=1)
+        pipeline = HeaterCommandPipeline(hass, driver, metrics)
+        pipeline.async_request(1.0)
+        await asyncio.sleep(11)
+        assert pipeline.health == HEALTH_DEGRADED
+        await asyncio.sleep(BACKOFF_BASE + 20)
+        return driver.applied, pipeline.health, metrics.counters
+
+    applied, health, counters = run_with_hass(_async_test)
+    assert [opening for _, opening in applied] == [1.0, 1.0]
+    backoff = applied[1][0] - applied[0][0] - 10
+    assert BACKOFF_BASE * (1 - BACKOFF_JITTER) <= backoff <= BACKOFF_BASE
+    assert health == HEALTH_OK
+    assert counters[COUNTER_COMMANDS_FAILED] == 1
+
+
+def test_heater_is_quarantined_after_failures_in_a_row(run_with_hass):
+    """A heater failing QUARANTINE_FAILURES times is not retried any more."""
+
+    async def _async_test(hass):
+        metrics = Metrics()
+        driver = RecordingDriver(hass, failures=100)
+        pipeline = HeaterCommandPipeline(hass, driver, metrics)
+        pipeline.async_request(1.0)
+        await asyncio.sleep(3600)
+        return len(driver.applied), pipeline.health, metrics.counters
+
+    attempts, health, counters = run_with_hass(_async_test)
+    assert attempts == QUARANTINE_FAILURES
+    assert health == HEALTH_QUARANTINED
+    assert counters[COUNTER_HEATER_QUARANTINES] == 1
+
+
+def test_wake_ends_the_backoff(run_with_hass):
+    """A heater reporting again is retried at once."""
+
+    async def _async_test(hass):
+        driver = RecordingDriver(hass, failures=1)
+        pipeline = HeaterCommandPipeline(hass, driver)
+        pipeline.async_request(1.0)
+        await asyncio.sleep(11)
+        pipeline.async_wake()
+        await asyncio.sleep(11)
+        return _openings(driver)
+
+    assert run_with_hass(_async_test) == [1.0, 1.0]
+
+
+def test_user_request_skips_the_backoff(run_with_hass):
+    """User requests are sent without waiting for the backoff."""
+
+    async def _async_test(hass):
+        driver = RecordingDriver(hass, failures=1)
+        pipeline = HeaterCommandPipeline(hass, driver)
+        pipeline.async_request(1.0)
+        await asyncio.sleep(11)
+        pipeline.async_request(0.0, priority=PRIORITY_USER)
+        await asyncio.sleep(11)
+        return _openings(driver)
+
+    assert run_with_hass(_async_test) == [1.0, 0.0]
+
+
+def test_stopped_pipeline_ignores_requests(run_with_hass):
+    """After stop nothing is sent and the listeners are not told."""
+
+    async def _async_test(hass):
+        requests = []
+        driver = RecordingDriver(hass)
+        pipeline = HeaterCommandPipeline(
+            hass, driver, listeners=[lambda *request: requests.append(request)]
+        )
+        pipeline.async_request(1.0)
+        await asyncio.sleep(1)
+        await pipeline.async_stop()
+        pipeline.async_request(0.0)
+        await asyncio.sleep(30)
+        return requests, driver.applied, pipeline.busy
+
+    assert run_with_hass(_async_test) == ([("climate.trv", 1.0)], [], False)
+
+
+def test_urgent_request_preempts_the_running_sequence(run_with_hass):
+    """A user request cancels a control sequence for another opening."""
+
+    async def _async_test(hass):
+        metrics = Metrics()
+        driver = RecordingDriver(hass)
+        pipeline = HeaterCommandPipeline(hass, driver, metrics)
+        pipeline.async_request(1.0)
+        await asyncio.sleep(1)
+        pipeline.async_request(0.0, priority=PRIORITY_USER)
+        await asyncio.sleep(30)
+        return driver.started, _openings(driver), metrics.counters
+
+    started, openings, counters = run_with_hass(_async_test)
+    assert started == [1.0, 0.0]
+    assert openings == [0.0]
+    assert counters[COUNTER_COMMANDS_PREEMPTED] == 1
+
+
+class TwoStepDriver(HeaterDriver):
+    """Driver sending two slow service calls per opening."""
+
+    @classmethod
+    async def async_apply_group(cls, drivers, opening, call):
+        """Send both steps for opening."""
+        heater_entity_ids = [driver.heater_entity_id for driver in drivers]
+        for step in (1, 2):
+            await call(
+                heater_entity_ids, "test", "slow", {"opening": opening, "step": step}
+            )
+        return set(heater_entity_ids)
+
+
+def test_preempted_sequence_does_not_interleave(run_with_hass):
+    """The preempting sequence starts after the command in flight returned."""
+
+    async def _async_test(hass):
+        log = []
+
+        async def _async_slow(call):
+            log.append(("start", call.data["opening"], call.data["step"]))
+            await asyncio.sleep(5)
+            log.append(("end", call.data["opening"], call.data["step"]))
+
+        hass.services.async_register("test", "slow", _async_slow)
+        scheduler = AirtimeScheduler(hass, 2.0, 5)
+
+        async def _async_call(heater_entity_id, domain, service, data):
+            await scheduler.async_call(
+                heater_entity_id,
+                domain,
+                service,
+                data,
+                priority=pipeline.priority,
+                blocking=True,
+            )
+
+        pipeline = HeaterCommandPipeline(
+            hass, TwoStepDriver(hass, "climate.trv", _async_call)
+        )
+        pipeline.async_request(1.0)
+        await asyncio.sleep(1)
+        pipeline.async_request(0.0, priority=PRIORITY_USER)
+        await asyncio.sleep(30)
+        return log
+
+    assert run_with_hass(_async_test) == [
+        ("start", 1.0, 1),
+        ("end", 1.0, 1),
+        ("start", 0.0, 1),
+        ("end", 0.0, 1),
+        ("start", 0.0, 2),
+        ("end", 0.0, 2),
+    ]
@@ -0,0 +1,87 @@
+"""Tests of the periodic reconciliation."""
+import asyncio
+from datetime import timedelta
+
+from custom_components.spzb0001_thermostat import climate
+from custom_components.spzb0001_thermostat.metrics import COUNTER_HEATER_DRIFTS
+from custom_components.spzb0001_thermostat.reconcile import HeaterReconciler
+
+
+class DriftingThermostat:
+    """Thermostat reporting a fixed number of drifted heaters per pass."""
+
+    def __init__(self, drifted):
+        """Initialize the thermostat."""
+        self.drifted = drifted
+        self.passes = 0
+
+    def async_reconcile(self):
+        """Return the drifted heaters."""
+        self.passes += 1
+        return self.drifted
+
+
+def test_passes_count_the_drifted_heaters(run_with_hass):
+    """Every interval all thermostats are checked in one pass."""
+
+    async def _async_test(hass):
+        thermostats = {
+            "climate.a": DriftingThermostat(2),
+            "climate.b": DriftingThermostat(1),
+        }
+        reconciler = HeaterReconciler(hass, thermostats, timedelta(minutes=5))
+        reconciler.async_start()
+        await asyncio.sleep(3 * 300 + 1)
+        thermostats["climate.b"].drifted = 0
+        await asyncio.sleep(300)
+        reconciler.async_stop()
+        await asyncio.sleep(3000)
+        return reconciler.statistics, thermostats["climate.a"].passes
+
+    statistics, passes = run_with_hass(_async_test)
+    assert statistics == {"passes": 4, "drifted": 11, "last_drifted": 2}
+    assert passes == 4
+
+
+def test_interval_change_plans_the_next_pass_anew(run_with_hass):
+    """A new interval applies from the time it is set."""
+
+    async def _async_test(hass):
+        thermostats = {"climate.a": DriftingThermostat(0)}
+        reconciler = HeaterReconciler(hass, thermostats, timedelta(minutes=5))
+        reconciler.async_start()
+        await asyncio.sleep(200)
+        reconciler.async_set_interval(timedelta(minutes=1))
+        await asyncio.sleep(61)
+        passes = reconciler.passes
+        reconciler.async_stop()
+        return passes
+
+    assert run_with_hass(_async_test) == 1
+
+
+def test_thermostat_corrects_a_drifted_heater(simulate):
+    """A heater opened behind the thermostat's back is closed again."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await simulation.async_run(600)
+        trv = simulation.fleet.trvs["climate.trv_0"]
+        trv.hvac_mode = "auto"
+        trv.setpoint = 22.0
+        trv.async_write_state()
+        await simulation.hass.async_block_till_done()
+        drifted = [thermostat.async_reconcile(), thermostat.async_reconcile()]
+        await simulation.hass.async_block_till_done()
+        return drifted, thermostat.metrics.counters, (trv.hvac_mode, trv.setpoint)
+
+    drifted, counters, state = simulate(
+        _async_test,
+        1,
+        0,
+        {climate.CONF_TARGET_TEMP: 10.0},
+    )
+    # SPZB: the second pass finds the pipeline busy correcting the heater
+    assert drifted == [1, 0]
+    assert counters[COUNTER_HEATER_DRIFTS] == 1
+    assert state == ("off", 5.0)
@@ -0,0 +1,111 @@
+"""Tests of reloading the thermostats with changed options."""
+from homeassistant.const import CONF_NAME, CONF_PLATFORM
+
+from custom_components.spzb0001_thermostat import DOMAIN, climate
+
+
+async def _async_reload(simulation, options):
+    """Reload the zones of the simulation with other options."""
+    config = climate.PLATFORM_SCHEMA(
+        {
+            CONF_PLATFORM: DOMAIN,
+            climate.CONF_TARGET_TEMP: 20.0,
+            climate.CONF_INITIAL_HVAC_MODE: "heat",
+            **options,
+            climate.CONF_ZONES: [
+                {
+                    CONF_NAME: thermostat.name,
+                    climate.CONF_HEATER: thermostat.heater_entity_ids,
+                    climate.CONF_SENSOR: thermostat.sensor_entity_ids,
+                }
+                for thermostat in simulation.thermostats
+            ],
+        }
+    )
+    hass = simulation.hass
+    await climate._async_reload_thermostats(hass, hass.data[DOMAIN], [config])
+    await hass.async_block_till_done()
+
+
+def test_reload_applies_the_options_and_keeps_the_readings(simulate):
+    """Options other than the aggregation keep the buffered readings."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await simulation.async_run(3600)
+        aggregate = thermostat._aggregate
+        count = aggregate.windows["sensor.room_0_temperature"].count
+        await _async_reload(
+            simulation,
+            {
+                climate.CONF_SENSOR_WINDOW: 5,
+                climate.CONF_AWAY_TEMP: 16.0,
+                climate.CONF_HOT_TOLERANCE: 0.3,
+            },
+        )
+        return (
+            count,
+            thermostat._aggregate is aggregate,
+            thermostat.preset_modes,
+            thermostat._hot_tolerance,
+            thermostat in simulation.hass.data[DOMAIN][climate.DATA_THERMOSTATS].values(),
+        )
+
+    count, kept, preset_modes, hot_tolerance, running = simulate(
+        _async_test, 1, 2, {climate.CONF_SENSOR_WINDOW: 5}
+    )
+    assert count == 5
+    assert kept
+    assert "away" in preset_modes
+    assert hot_tolerance == 0.3
+    assert running
+
+
+def test_reload_rebuilds_the_aggregate_on_new_aggregation_options(simulate):
+    """A changed sensor_window starts new buffers with the current readings."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await simulation.async_run(3600)
+        aggregate = thermostat._aggregate
+        await _async_reload(simulation, {climate.CONF_SENSOR_WINDOW: 3})
+        return (
+            thermostat._aggregate is aggregate,
+            thermostat._aggregate.windows["sensor.room_0_temperature"].count,
+            thermostat.current_temperature,
+        )
+
+    kept, count, current_temperature = simulate(
+        _async_test, 1, 2, {climate.CONF_SENSOR_WINDOW: 5}
+    )
+    assert not kept
+    assert count == 1
+    assert current_temperature is not None
+
+
+async def _async_open_window(simulation, thermostat):
+    """Let the room lose heat fast until the thermostat sees an open window."""
+    simulation.rooms[0].loss_rate = 1.0
+    for _ in range(30):
+        if thermostat._window_open:
+            break
+        await simulation.async_run(60)
+
+
+def test_reload_keeps_the_open_window(simulate):
+    """A reload with other window options keeps heating suspended."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await simulation.async_run(3600)
+        await thermostat.async_set_temperature(temperature=25)
+        await simulation.async_run(300)
+        await _async_open_window(simulation, thermostat)
+        assert thermostat._window_open
+        await _async_reload(simulation, {climate.CONF_OPEN_WINDOW_SLOPE: 8.0})
+        assert thermostat._window_open
+        await simulation.async_run(900)
+        assert thermostat._window_open
+        assert not thermostat._is_device_active
+
+    simulate(_async_test, 1, 2, {climate.CONF_OPEN_WINDOW_SLOPE: 10.0})
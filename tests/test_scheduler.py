@@ -0,0 +1,155 @@
+"""Tests of the airtime scheduler."""
+import asyncio
+
+import pytest
+
+from custom_components.spzb0001_thermostat.scheduler import (
+    PRIORITY_CONTROL,
+    PRIORITY_RECONCILE,
+    PRIORITY_SAFETY,
+    PRIORITY_USER,
+    AirtimeScheduler,
+    outranks,
+)
+
+
+async def _async_acquire_all(hass, scheduler, commands):
+    """Acquire airtime for (heater, priority) commands, return the grant order."""
+    granted = []
+
+    async def _async_acquire(heater_entity_id, priority):
+        await scheduler.async_acquire(heater_entity_id, priority)
+        granted.append((heater_entity_id, hass.loop.time()))
+
+    await asyncio.gather(
+        *(_async_acquire(heater_entity_id, priority) for heater_entity_id, priority in commands)
+    )
+    return granted
+
+
+def test_heaters_are_served_round_robin(run_with_hass):
+    """A heater with several queued commands does not starve the others."""
+
+    async def _async_test(hass):
+        scheduler = AirtimeScheduler(hass, 1.0, 1)
+        granted = await _async_acquire_all(
+            hass,
+            scheduler,
+            [
+                ("climate.a", PRIORITY_CONTROL),
+                ("climate.a", PRIORITY_CONTROL),
+                ("climate.a", PRIORITY_CONTROL),
+                ("climate.b", PRIORITY_CONTROL),
+            ],
+        )
+        return [heater_entity_id for heater_entity_id, _ in granted]
+
+    assert run_with_hass(_async_test) == ["climate.a", "climate.b", "climate.a", "climate.a"]
+
+
+def test_token_bucket_releases_burst_then_rate(run_with_hass):
+    """burst commands go out at once, the following ones at rate per second."""
+
+    async def _async_test(hass):
+        scheduler = AirtimeScheduler(hass, 2.0, 2)
+        start = hass.loop.time()
+        granted = await _async_acquire_all(
+            hass, scheduler, [(f"climate.{index}", PRIORITY_CONTROL) for index in range(5)]
+        )
+        return [round(time - start, 6) for _, time in granted], scheduler.statistics
+
+    times, statistics = run_with_hass(_async_test)
+    assert times == [0.0, 0.0, 0.5, 1.0, 1.5]
+    assert statistics["commands"] == 5
+    assert statistics["max_queue_depth"] == 5
+    assert statistics["queue_depth"] == 0
+
+
+def test_cancelled_commands_are_discarded(run_with_hass):
+    """A command cancelled while waiting leaves the queue and costs nothing."""
+
+    async def _async_test(hass):
+        scheduler = AirtimeScheduler(hass, 1.0, 1)
+        await scheduler.async_acquire("climate.a")
+        waiting = hass.async_create_task(scheduler.async_acquire("climate.b"))
+        await asyncio.sleep(0.1)
+        assert scheduler.queue_depth == 1
+        waiting.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth == 0
+        start = hass.loop.time()
+        await scheduler.async_acquire("climate.c")
+        return hass.loop.time() - start, scheduler.statistics["commands"]
+
+    waited, commands = run_with_hass(_async_test)
+    assert waited == pytest.approx(0.9)
+    assert commands == 2
+
+
+def test_stop_cancels_the_waiting_commands(run_with_hass):
+    """Callers waiting for airtime see a cancellation on stop."""
+
+    async def _async_test(hass):
+        scheduler = AirtimeScheduler(hass, 1.0, 1)
+        await scheduler.async_acquire("climate.a")
+        waiting = hass.async_create_task(scheduler.async_acquire("climate.b"))
+        await asyncio.sleep(0.1)
+        scheduler.async_stop()
+        await asyncio.wait((waiting,))
+        return waiting.cancelled(), scheduler.queue_depth
+
+    assert run_with_hass(_async_test) == (True, 0)
+
+
+def test_outranks():
+    """Priority classes are ordered from safety to reconcile."""
+    assert outranks(PRIORITY_SAFETY, PRIORITY_USER)
+    assert outranks(PRIORITY_USER, PRIORITY_CONTROL)
+    assert not outranks(PRIORITY_RECONCILE, PRIORITY_CONTROL)
+    assert not outranks(PRIORITY_CONTROL, PRIORITY_CONTROL)
+
+
+def test_urgent_commands_skip_the_line(run_with_hass):
+    """Commands of a more urgent class are released first."""
+
+    async def _async_test(hass):
+        scheduler = AirtimeScheduler(hass, 1.0, 1)
+        granted = await _async_acquire_all(
+            hass,
+            scheduler,
+            [
+                ("climate.a", PRIORITY_RECONCILE),
+                ("climate.b", PRIORITY_CONTROL),
+                ("climate.c", PRIORITY_USER),
+                ("climate.d", PRIORITY_SAFETY),
+            ],
+        )
+        return [heater_entity_id for heater_entity_id, _ in granted]
+
+    assert run_with_hass(_async_test) == ["climate.d", "climate.c", "climate.b", "climate.a"]
+
+
+def test_cancelled_caller_waits_for_the_command_in_flight(run_with_hass):
+    """A service call already sent is completed before the caller stops."""
+
+    async def _async_test(hass):
+        log = []
+        start = hass.loop.time()
+
+        async def _async_slow(call):
+            log.append(("start", hass.loop.time() - start))
+            await asyncio.sleep(5)
+            log.append(("end", hass.loop.time() - start))
+
+        hass.services.async_register("test", "slow", _async_slow)
+        scheduler = AirtimeScheduler(hass, 1.0, 1)
+        caller = hass.async_create_task(
+            scheduler.async_call("climate.a", "test", "slow", {}, blocking=True)
+        )
+        await asyncio.sleep(1)
+        caller.cancel()
+        await asyncio.wait((caller,))
+        log.append(("cancelled", hass.loop.time() - start))
+        return log
+
+    assert run_with_hass(_async_test) == [("start", 0.0), ("end", 5.0), ("cancelled", 5.0)]
@@ -0,0 +1,30 @@
+"""Tests of the simulation harness."""
+
+
+def test_requested_openings_reach_the_heaters_quickly(simulate):
+    """Every opening a thermostat requests reaches its heater within a minute."""
+
+    async def _async_test(simulation):
+        await simulation.async_run(6 * 3600)
+        return simulation.report()
+
+    report = simulate(_async_test, zones=3, seed=1)
+    assert report["simulated_hours"] == 6
+    assert report["actuations"] > 0
+    assert report["latency_p95"] < 60
+    assert report["commands_dropped"] == 0
+
+
+def test_latency_is_measured_through_the_request_listeners(simulate):
+    """The harness sees the requests without patching the pipelines."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await thermostat.async_set_temperature(temperature=30)
+        requested = dict(simulation._requested)
+        await simulation.async_run(120)
+        return requested, simulation.latencies
+
+    requested, latencies = simulate(_async_test, seed=1)
+    assert requested["climate.trv_0"][1] == 1.0
+    assert latencies
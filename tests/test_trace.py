@@ -0,0 +1,93 @@
+"""Tests of the actuation trace."""
+import math
+
+import pytest
+
+from custom_components.spzb0001_thermostat.trace import (
+    KIND_DECISION,
+    KIND_HEATER,
+    KIND_HEATER_STATE,
+    KIND_READING,
+    KIND_SENSOR,
+    KIND_TARGET,
+    KIND_THERMOSTAT,
+    RECORD,
+    TraceRecorder,
+    read_trace,
+)
+
+
+async def _async_record(hass, path, max_size, readings):
+    """Record a thermostat with readings sensor readings to path."""
+    recorder = TraceRecorder(hass)
+    recorder.async_define("climate.room", ["sensor.room"], ["climate.trv"])
+    await recorder.async_configure(path, max_size)
+    recorder.async_record(KIND_TARGET, "climate.room", math.nan)
+    recorder.async_record(KIND_TARGET, "climate.room", 20.5)
+    recorder.async_record(KIND_HEATER_STATE, "climate.trv", 1.0)
+    for index in range(readings):
+        recorder.async_record(KIND_READING, "sensor.room", 19.0 + index / 100)
+        # SPZB: a write per reading, so the file rotates between records
+        await recorder.async_flush()
+    recorder.async_record(KIND_DECISION, "climate.room", 0.0)
+    await recorder.async_stop()
+    return recorder.statistics
+
+
+def test_records_read_back(run_with_hass, tmp_path):
+    """Definitions and records come back with their entity ids."""
+    path = str(tmp_path / "trace.bin")
+    statistics = run_with_hass(lambda hass: _async_record(hass, path, 1e6, 2))
+    records = [record[1:] for record in read_trace(path)]
+    assert records == [
+        (KIND_THERMOSTAT, "climate.room", "climate.room"),
+        (KIND_SENSOR, "sensor.room", "climate.room"),
+        (KIND_HEATER, "climate.trv", "climate.room"),
+        (KIND_TARGET, "climate.room", None),
+        (KIND_TARGET, "climate.room", 20.5),
+        (KIND_HEATER_STATE, "climate.trv", 1.0),
+        (KIND_READING, "sensor.room", 19.0),
+        (KIND_READING, "sensor.room", pytest.approx(19.01)),
+        (KIND_DECISION, "climate.room", 0.0),
+    ]
+    assert statistics == {"path": path, "records": 6}
+
+
+def test_rotated_file_starts_with_definitions_and_states(run_with_hass, tmp_path):
+    """Both files stay within max_size and the newer one replays on its own."""
+    path = str(tmp_path / "trace.bin")
+    max_size = 40 * RECORD.size
+    run_with_hass(lambda hass: _async_record(hass, path, max_size, 60))
+    size = sum(
+        (tmp_path / name).stat().st_size for name in ("trace.bin", "trace.bin.1")
+    )
+    assert size <= max_size
+    # SPZB: without the older file the newer one still knows its entities and states
+    (tmp_path / "trace.bin.1").unlink()
+    records = [record[1:] for record in read_trace(path)]
+    assert records[:5] == [
+        (KIND_THERMOSTAT, "climate.room", "climate.room"),
+        (KIND_SENSOR, "sensor.room", "climate.room"),
+        (KIND_HEATER, "climate.trv", "climate.room"),
+        (KIND_TARGET, "climate.room", 20.5),
+        (KIND_HEATER_STATE, "climate.trv", 1.0),
+    ]
+    assert records[-1] == (KIND_DECISION, "climate.room", 0.0)
+
+
+def test_truncated_record_ends_the_file(run_with_hass, tmp_path):
+    """A record cut off by a crash is skipped."""
+    path = str(tmp_path / "trace.bin")
+    run_with_hass(lambda hass: _async_record(hass, path, 1e6, 2))
+    complete = list(read_trace(path))
+    with open(path, "rb+") as file:
+        file.truncate(file.seek(0, 2) - 1)
+    assert list(read_trace(path)) == complete[:-1]
+
+
+def test_other_files_are_rejected(tmp_path):
+    """A file without the magic is no trace."""
+    path = tmp_path / "trace.bin"
+    path.write_bytes(b"not a trace")
+    with pytest.raises(ValueError):
+        list(read_trace(str(path)))
@@ -0,0 +1,110 @@
+"""Tests of the open window detection."""
+import random
+
+from custom_components.spzb0001_thermostat import climate
+from custom_components.spzb0001_thermostat.window import (
+    TemperatureSlope,
+    WindowDetector,
+)
+
+
+def _least_squares(readings):
+    """Return the slope of readings in degrees per hour."""
+    count = len(readings)
+    mean_t = sum(time for time, _ in readings) / count
+    mean_v = sum(value for _, value in readings) / count
+    covariance = sum((time - mean_t) * (value - mean_v) for time, value in readings)
+    variance = sum((time - mean_t) ** 2 for time, _ in readings)
+    return covariance / variance * 3600
+
+
+def test_slope_matches_least_squares():
+    """The running sums give the slope of the readings within the span."""
+    rng = random.Random(2)
+    slope = TemperatureSlope(600, size=8)
+    readings = []
+    for time in range(0, 6000, 60):
+        value = 20.0 - time / 3600 + rng.uniform(-0.2, 0.2)
+        slope.push(time, value)
+        readings = [
+            reading for reading in readings + [(time, value)] if reading[0] >= time - 600
+        ][-8:]
+        if readings[-1][0] - readings[0][0] >= 300:
+            assert abs(slope.slope(time) - _least_squares(readings)) < 1e-6
+
+
+def test_slope_needs_readings_spread_over_the_span():
+    """A few readings close together give no slope."""
+    slope = TemperatureSlope(600)
+    for time in (0, 10, 20, 30):
+        slope.push(time, 20.0 - time)
+    assert slope.slope(30) is None
+    assert slope.slope(700) is None
+
+
+def _push_drop(detector, start, rate, value=20.0):
+    """Push readings of sensor.a changing rate degrees per hour for 10 minutes."""
+    for minute in range(11):
+        detector.push("sensor.a", start + minute * 60, value + rate * minute / 60)
+    return start + 600
+
+
+def test_detector_opens_on_a_fast_drop_and_closes_when_it_levels_off():
+    """The window opens below the open slope and closes at a quarter of it."""
+    detector = WindowDetector(["sensor.a", "sensor.b"], 600, 6.0)
+    now = _push_drop(detector, 0, -3.0)
+    assert detector.update(now) is False
+    now = _push_drop(detector, now + 60, -8.0)
+    assert detector.update(now) is True
+    assert detector.is_open
+    now = _push_drop(detector, now + 60, -2.0)
+    assert detector.update(now) is False
+    now = _push_drop(detector, now + 60, -1.0)
+    assert detector.update(now) is True
+    assert not detector.is_open
+
+
+def test_configure_keeps_the_readings_and_the_state():
+    """Changed options apply to the readings already pushed."""
+    detector = WindowDetector(["sensor.a"], 600, 6.0)
+    now = _push_drop(detector, 0, -8.0)
+    assert detector.update(now) is True
+    detector.configure(900, 10.0)
+    assert detector.is_open
+    assert detector.slopes["sensor.a"].span == 900
+    assert detector.slopes["sensor.a"].count == 11
+    # SPZB: still dropping faster than a quarter of the new open slope
+    assert detector.update(now) is False
+
+
+async def _async_open_window(simulation, thermostat):
+    """Let the room lose heat fast until the thermostat sees an open window."""
+    room = simulation.rooms[0]
+    loss_rate = room.loss_rate
+    room.loss_rate = 1.0
+    for _ in range(30):
+        if thermostat._window_open:
+            break
+        await simulation.async_run(60)
+    return loss_rate
+
+
+def test_open_window_suspends_heating(simulate):
+    """Heating stops while the window is open and resumes once it closed."""
+
+    async def _async_test(simulation):
+        thermostat = simulation.thermostats[0]
+        await simulation.async_run(3600)
+        await thermostat.async_set_temperature(temperature=25)
+        await simulation.async_run(300)
+        assert thermostat._is_device_active
+        loss_rate = await _async_open_window(simulation, thermostat)
+        assert thermostat._window_open
+        await simulation.async_run(60)
+        assert not thermostat._is_device_active
+        simulation.rooms[0].loss_rate = loss_rate
+        await simulation.async_run(2400)
+        assert not thermostat._window_open
+        assert thermostat._is_device_active
+
+    simulate(_async_test, 1, 2, {climate.CONF_OPEN_WINDOW_SLOPE: 10.0})